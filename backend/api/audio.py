@@ -1,35 +1,107 @@
-from flask import Blueprint, send_file, jsonify
-import os
-from pathlib import Path
+from flask import Blueprint, Response, send_file, jsonify, redirect, request
+from models import AudioAsset, Story
+from utils.audio_storage import get_audio_storage
+from utils.audio_variants import STANDARD_VARIANT, VARY_HEADERS, pick_variant, requested_variant
+from utils.metrics import AUDIO_RESPONSE_BYTES
 
 audio_bp = Blueprint('audio', __name__)
 
-AUDIO_DIR = Path("audio_files")
+# Segment files never change once written, so clients may cache them forever
+AUDIO_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def send_stored_audio(filename, etag=True, download_name=None, max_age=None):
+    """
+    Response for a file in the audio store, or None if it does not exist
+
+    Local files are sent with Range/If-None-Match support, cached publicly
+    for max_age (immutable) or revalidated on every use when max_age is
+    None. Remote objects are answered with 304 when the client already has
+    etag, otherwise redirected to a presigned URL that the browser fetches
+    (including Range requests) directly.
+    """
+    storage = get_audio_storage()
+    path = storage.local_path(filename)
+
+    if path is not None:
+        if not path.is_file():
+            return None
+        response = send_file(
+            path.absolute(),
+            mimetype='audio/mpeg',
+            as_attachment=False,
+            download_name=download_name or filename,
+            conditional=True,
+            etag=etag,
+            max_age=max_age
+        )
+        if max_age is None:
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+    if isinstance(etag, str) and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    response = redirect(storage.presigned_url(filename), code=302)
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        # The presigned URL stays the same until its window ends
+        response.cache_control.private = True
+        response.cache_control.max_age = storage.url_max_age()
+    return response
+
 
 @audio_bp.route('/<filename>', methods=['GET'])
 def serve_audio(filename):
     """
     Serve audio files
+
+    Supports Range requests (206) and conditional requests (304) against a
+    strong ETag computed when the file was written. Files are handed to
+    the WSGI server's file wrapper (or X-Sendfile) for zero-copy delivery.
+    A segment's lower-bitrate variant is served instead when the client
+    asks for it (?variant=, X-Audio-Variant, Save-Data or ECT) and it exists.
     """
     try:
-        file_path = AUDIO_DIR / filename
-        
-        print(f"🎵 Audio request: {filename}")
-        print(f"   Looking for: {file_path.absolute()}")
-        
-        if file_path.exists():
-            print(f"   ✓ File found, serving...")
-            return send_file(
-                file_path, 
-                mimetype='audio/mpeg',
-                as_attachment=False,
-                download_name=filename
-            )
+        served_variant = STANDARD_VARIANT
+        response = None
+
+        asset = (AudioAsset.query.filter_by(filename=filename)
+                 .with_entities(AudioAsset.etag, AudioAsset.variants).first())
+        if asset is None:
+            # Concatenated story files live alongside the segments
+            asset = Story.query.filter_by(audio_file=filename).with_entities(Story.audio_etag.label('etag')).first()
+            if asset is None and not get_audio_storage().exists(filename):
+                return jsonify({'error': 'File not found'}), 404
+            etag = asset.etag if asset and asset.etag else True  # Fall back to Werkzeug's mtime/size tag
         else:
-            print(f"   ✗ File not found!")
+            etag = asset.etag or True
+            wanted = requested_variant(request)
+            variant = pick_variant(asset.variants, wanted)
+            if variant:
+                response = send_stored_audio(variant['filename'], variant.get('etag') or True,
+                                             download_name=filename, max_age=AUDIO_MAX_AGE)
+                if response is not None:
+                    served_variant = wanted
+
+        if response is None:
+            response = send_stored_audio(filename, etag, max_age=AUDIO_MAX_AGE)
+        if response is None:
             return jsonify({'error': 'File not found'}), 404
-            
+
+        response.vary.update(VARY_HEADERS)
+        response.headers['X-Audio-Variant'] = served_variant
+        AUDIO_RESPONSE_BYTES.labels('segment', served_variant, response.status_code).observe(response.content_length or 0)
+        return response
+
+    except ValueError:
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
-        print(f"   ✗ Error: {e}")
+        print(f"✗ Error serving audio {filename}: {e}")
         return jsonify({'error': str(e)}), 500
-
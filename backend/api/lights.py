@@ -1,106 +1,262 @@
 from flask import Blueprint, jsonify, request
-import requests
-import os
 from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+
+from utils.audio_variants import requested_variant
+from utils.govee import (
+    GOVEE_API_KEY, GOVEE_DEVICE_ID, GOVEE_DEVICE_SKU,
+    brightness_capability, color_capability
+)
+from utils.light_devices import DEFAULT_GROUP, get_device_group, group_devices
+from utils.light_timeline import build_light_timeline, light_scheduler
+from models import db, Story, LightDevice
 
 load_dotenv()
 
 lights_bp = Blueprint('lights', __name__)
 
-GOVEE_API_URL = 'https://openapi.api.govee.com/router/api/v1/device/control'
-GOVEE_API_KEY = os.getenv('GOVEE_API_KEY', '')
-GOVEE_DEVICE_ID = os.getenv('GOVEE_DEVICE_ID', '')
-GOVEE_DEVICE_SKU = os.getenv('GOVEE_DEVICE_SKU', '')
+def _not_configured(group):
+    return jsonify({
+        'error': 'Govee not configured',
+        'message': f"No devices in group '{group}'. Set GOVEE_API_KEY and register devices "
+                   f"(POST /api/lights/devices) or set GOVEE_DEVICE_ID and GOVEE_DEVICE_SKU in backend/.env"
+    }), 503
 
 @lights_bp.route('/set-color', methods=['POST'])
 def set_color():
     """
     Proxy endpoint for Govee light control
     Avoids CORS issues by making request from backend
+    
+    The command is sent to every device in the group (body "group",
+    default "default") concurrently. Each device's coalescing queue skips
+    unchanged capabilities, and a command replaced by a newer one before
+    it was sent reports {"superseded": true}.
     """
-    if not all([GOVEE_API_KEY, GOVEE_DEVICE_ID, GOVEE_DEVICE_SKU]):
-        return jsonify({
-            'error': 'Govee not configured',
-            'message': 'Set GOVEE_API_KEY, GOVEE_DEVICE_ID, and GOVEE_DEVICE_SKU in backend/.env'
-        }), 503
+    data = request.json or {}
+    group_name = data.get('group', DEFAULT_GROUP)
+    group = get_device_group(group_name)
+    if group is None:
+        return _not_configured(group_name)
     
     try:
-        data = request.json
         emotion = data.get('emotion', 'neutral')
         color_value = data.get('colorValue')
         request_id = data.get('requestId', f'story-{emotion}')
         
-        print(f"💡 Light API: Setting color for emotion '{emotion}' (value: {color_value})")
+        print(f"💡 Light API: Setting color for emotion '{emotion}' (value: {color_value}) on {len(group)} device(s)")
         
-        # Set color
-        color_response = requests.post(
-            GOVEE_API_URL,
-            headers={
-                'Govee-API-Key': GOVEE_API_KEY,
-                'Content-Type': 'application/json'
-            },
-            json={
-                'requestId': request_id,
-                'payload': {
-                    'sku': GOVEE_DEVICE_SKU,
-                    'device': GOVEE_DEVICE_ID,
-                    'capability': {
-                        'type': 'devices.capabilities.color_setting',
-                        'instance': 'colorRgb',
-                        'value': color_value
-                    }
-                }
-            },
-            timeout=5
-        )
-        
-        color_result = color_response.json()
-        print(f"   ✓ Color set: {color_result}")
+        results = group.send([color_capability(color_value), brightness_capability(100)], request_id)
         
-        # Set brightness
-        brightness_response = requests.post(
-            GOVEE_API_URL,
-            headers={
-                'Govee-API-Key': GOVEE_API_KEY,
-                'Content-Type': 'application/json'
-            },
-            json={
-                'requestId': f'{request_id}-brightness',
-                'payload': {
-                    'sku': GOVEE_DEVICE_SKU,
-                    'device': GOVEE_DEVICE_ID,
-                    'capability': {
-                        'type': 'devices.capabilities.range',
-                        'instance': 'brightness',
-                        'value': 100
-                    }
-                }
-            },
-            timeout=5
-        )
+        devices = {}
+        errors = {}
+        for name, result in results.items():
+            if 'error' in result:
+                # The whole device timed out
+                errors[name] = result['error']
+                devices[name] = {'error': result['error']}
+                continue
+            devices[name] = {'color': result['colorRgb'], 'brightness': result['brightness']}
+            failed = [r['error'] for r in result.values() if 'error' in r]
+            if failed:
+                errors[name] = '; '.join(failed)
         
-        brightness_result = brightness_response.json()
-        print(f"   ✓ Brightness set: {brightness_result}")
+        for name, error in errors.items():
+            print(f"   ✗ {name}: {error}")
+        print(f"   ✓ {len(devices) - len(errors)}/{len(devices)} devices updated")
         
-        return jsonify({
-            'success': True,
-            'color': color_result,
-            'brightness': brightness_result
-        })
+        first = next(iter(devices.values()))
+        body = {
+            'success': not errors,
+            'group': group.name,
+            'devices': devices,
+            'color': first.get('color'),
+            'brightness': first.get('brightness')
+        }
+        if errors:
+            body['errors'] = errors
+        # Partial failures still changed the room; only report failure if nothing did
+        return jsonify(body), 502 if len(errors) == len(devices) else 200
         
-    except requests.exceptions.RequestException as e:
-        print(f"   ✗ Govee API error: {e}")
+    except Exception as e:
+        print(f"   ✗ Error: {e}")
         return jsonify({'error': str(e)}), 500
+
+@lights_bp.route('/devices', methods=['GET'])
+def list_devices():
+    """List registered light devices, grouped"""
+    devices = LightDevice.query.order_by(LightDevice.group_name, LightDevice.id).all()
+    groups = {}
+    for device in devices:
+        groups.setdefault(device.group_name, []).append(device.id)
+    return jsonify({
+        'devices': [device.to_dict() for device in devices],
+        'groups': groups
+    })
+
+@lights_bp.route('/devices', methods=['POST'])
+def register_device():
+    """
+    Register a light device
+    
+    Expected request body:
+    {
+        "name": "Bed strip",
+        "sku": "H6159",
+        "device_id": "AB:CD:EF:...",
+        "group": "bedroom"       # optional, default "default"
+    }
+    """
+    data = request.json or {}
+    if not data.get('name') or not data.get('sku') or not data.get('device_id'):
+        return jsonify({'error': 'Missing required fields: name, sku and device_id'}), 400
+    
+    device = LightDevice(
+        name=data['name'],
+        sku=data['sku'],
+        device_id=data['device_id'],
+        group_name=data.get('group', DEFAULT_GROUP),
+        enabled=data.get('enabled', True)
+    )
+    try:
+        db.session.add(device)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Device already registered'}), 409
+    
+    print(f"💡 Registered {device.name} ({device.sku}) in group '{device.group_name}'")
+    return jsonify(device.to_dict()), 201
+
+@lights_bp.route('/devices/<int:device_id>', methods=['PUT'])
+def update_device(device_id):
+    """Rename, regroup, enable or disable a device"""
+    device = db.session.get(LightDevice, device_id)
+    if not device:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    data = request.json or {}
+    if 'name' in data:
+        device.name = data['name']
+    if 'group' in data:
+        device.group_name = data['group']
+    if 'enabled' in data:
+        device.enabled = bool(data['enabled'])
+    db.session.commit()
+    return jsonify(device.to_dict())
+
+@lights_bp.route('/devices/<int:device_id>', methods=['DELETE'])
+def delete_device(device_id):
+    device = db.session.get(LightDevice, device_id)
+    if not device:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    db.session.delete(device)
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'Device deleted'})
+
+def _position(data, required=False):
+    position = (data or {}).get('position')
+    if position is None:
+        if required:
+            raise ValueError('position is required')
+        return None
+    return float(position)
+
+@lights_bp.route('/sessions', methods=['POST'])
+def create_session():
+    """
+    Start server-driven lights for a story's playback
+    
+    Expected request body:
+    {
+        "story_id": 1,
+        "position": 0.0,      # seconds into the story audio (optional)
+        "playing": true,      # optional, default true
+        "group": "bedroom"    # optional, default "default"
+    }
+    
+    Cue times follow the audio variant the player is playing, requested
+    like story audio (?variant=, X-Audio-Variant, Save-Data or ECT).
+    
+    The backend fires each emotion change at its offset, ahead of time
+    by the measured device latency. Keep the session in step with the
+    player through the pause/seek/start/stop endpoints.
+    """
+    data = request.json or {}
+    group_name = data.get('group', DEFAULT_GROUP)
+    group = get_device_group(group_name)
+    if group is None:
+        return _not_configured(group_name)
+    
+    try:
+        story = db.session.get(Story, data.get('story_id'))
+        if not story:
+            return jsonify({'error': 'Story not found'}), 404
+        
+        timeline = build_light_timeline(story, requested_variant(request))
+        if timeline is None:
+            return jsonify({'error': 'Story audio has no timing information'}), 409
+        
+        session = light_scheduler.create_session(
+            story.id,
+            timeline,
+            group,
+            position=_position(data) or 0.0,
+            play=data.get('playing', True)
+        )
+        print(f"💡 Light session {session.id[:8]} for story {story.id} ({len(timeline['cues'])} cues)")
+        return jsonify(session.to_dict()), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"   ✗ Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@lights_bp.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = light_scheduler.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(session.to_dict())
+
+@lights_bp.route('/sessions/<session_id>/<action>', methods=['POST'])
+def control_session(session_id, action):
+    """
+    Transport control for a light session
+    
+    Actions: start (resume, optional position), pause (optional
+    position), seek (position required), stop
+    """
+    if light_scheduler.get(session_id) is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        if action == 'start':
+            session = light_scheduler.play(session_id, _position(data))
+        elif action == 'pause':
+            session = light_scheduler.pause(session_id, _position(data))
+        elif action == 'seek':
+            session = light_scheduler.seek(session_id, _position(data, required=True))
+        elif action == 'stop':
+            session = light_scheduler.stop(session_id)
+        else:
+            return jsonify({'error': f'Unknown action: {action}'}), 404
+        return jsonify(session.to_dict())
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @lights_bp.route('/health', methods=['GET'])
 def health():
     """Check if Govee lights are configured"""
-    configured = all([GOVEE_API_KEY, GOVEE_DEVICE_ID, GOVEE_DEVICE_SKU])
+    devices = group_devices(DEFAULT_GROUP)
+    configured = bool(GOVEE_API_KEY and devices)
     return jsonify({
         'configured': configured,
+        'devices': len(devices),
         'apiKey': 'Set' if GOVEE_API_KEY else 'Missing',
         'deviceId': 'Set' if GOVEE_DEVICE_ID else 'Missing',
         'deviceSku': 'Set' if GOVEE_DEVICE_SKU else 'Missing'
@@ -0,0 +1,29 @@
+from flask import Blueprint, Response
+from utils.audio_reclaimer import audio_reclaimer
+from utils.govee import device_queue_stats
+from utils.job_queue import job_queue
+from utils.metrics import REGISTRY, Counter, Gauge
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Computed when scraped
+Gauge('story_jobs_pending', 'Story jobs waiting for a worker', function=job_queue.pending)
+Gauge('audio_reclaim_pending', 'Audio files waiting to be deleted', function=audio_reclaimer.pending)
+Counter('audio_reclaimed_files_total', 'Audio files deleted by the reclaimer', ['outcome'],
+        function=lambda: {(outcome,): audio_reclaimer.stats[outcome] for outcome in ('deleted', 'missing', 'failed')})
+Counter('audio_reclaimed_bytes_total', 'Audio bytes freed by the reclaimer',
+        function=lambda: audio_reclaimer.stats['bytes_freed'])
+Counter('govee_commands_total', 'Govee commands by outcome (skipped and superseded were never sent)',
+        ['outcome'], function=lambda: {(outcome,): count for outcome, count in device_queue_stats().items()})
+
+
+@metrics_bp.route('', methods=['GET'])
+def get_metrics():
+    """
+    Story pipeline metrics in the Prometheus text exposition format
+
+    Gemini and TTS latency, segment sizes, cache hits, job queue wait and
+    run time, outbound retries, DB commit time, Govee latency and audio
+    bytes served.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
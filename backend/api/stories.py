@@ -1,36 +1,161 @@
-from flask import Blueprint, jsonify, request
-from models import db, Story, AudioAsset
+from flask import Blueprint, jsonify, request, url_for, abort
+from models import db, Story, StoryJob, AudioAsset
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import selectinload
 from datetime import datetime
+import base64
+import json
 import sys
 import os
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.story_audio_processor import StoryAudioProcessor
+from utils.http_cache import make_weak_etag, not_modified, with_etag
+from utils.metrics import AUDIO_RESPONSE_BYTES
+from utils.audio_variants import (
+    STANDARD_VARIANT, VARY_HEADERS, pick_variant, requested_variant, segment_duration, served_variant_name,
+    story_offsets
+)
+from utils.job_queue import job_queue
+from utils.audio_reclaimer import audio_reclaimer
+from utils.story_pipeline import (
+    DEFAULT_VOICE_ID, segment_audio_names, serialize_story, story_audio_names, story_audio_url
+)
+from utils.light_timeline import emotion_color_value
+from api.audio import send_stored_audio
 
 stories_bp = Blueprint('stories', __name__)
 
+PREVIEW_LENGTH = 200  # Characters of story text shown on list cards
+
+# Fields available to GET /api/stories?fields=...; heavy text columns are opt-in
+LIST_FIELDS = {
+    'id': Story.id,
+    'uuid': Story.uuid,
+    'title': Story.title,
+    'voice_id': Story.voice_id,
+    'created_at': Story.created_at,
+    'updated_at': Story.updated_at,
+    'processed_at': Story.processed_at,
+    'emotion_summary': Story.emotion_summary,
+    'preview': func.substr(Story.content, 1, PREVIEW_LENGTH),
+    'prompt': Story.prompt,
+    'content': Story.content,
+    'segments': Story.segments,
+    'audio_segments': Story.audio_segments
+}
+DEFAULT_LIST_FIELDS = ['id', 'uuid', 'title', 'voice_id', 'created_at', 'processed_at', 'emotion_summary', 'preview']
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Players start fetching a segment this many seconds before it is due
+MANIFEST_PREFETCH_SECONDS = float(os.getenv('MANIFEST_PREFETCH_SECONDS', '15'))
+
+def _encode_cursor(created_at, story_id):
+    raw = json.dumps([created_at.isoformat(), story_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    created_at, story_id = json.loads(raw)
+    return datetime.fromisoformat(created_at), int(story_id)
+
 @stories_bp.route('', methods=['GET'])
 def get_stories():
-    """Get all stories"""
-    stories = Story.query.all()
-    return jsonify([{
-        'id': s.id,
-        'uuid': s.uuid,
-        'title': s.title,
-        'content': s.content,
-        'segments': s.segments,
-        'audio_segments': s.audio_segments,
-        'voice_id': s.voice_id,
-        'created_at': s.created_at.isoformat(),
-        'processed_at': s.processed_at.isoformat() if s.processed_at else None
-    } for s in stories])
+    """
+    List stories, newest first, one page at a time
+    
+    Query params:
+        limit: page size (default 20, max 100)
+        cursor: opaque next_cursor from the previous page
+        fields: comma-separated subset of LIST_FIELDS (default: summary fields)
+    
+    Pages are keyset-paginated on (created_at, id), so each page costs the
+    same regardless of how deep into the library it is. A weak ETag built
+    from the page's story versions lets unchanged pages return 304.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else DEFAULT_LIST_FIELDS
+    unknown = [f for f in fields if f not in LIST_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    # Resolve the page's keys first: they determine the ETag and the cursor
+    query = db.session.query(Story.id, Story.created_at, Story.version)
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = _decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(or_(
+            Story.created_at < cursor_created_at,
+            and_(Story.created_at == cursor_created_at, Story.id < cursor_id)
+        ))
+    
+    keys = query.order_by(Story.created_at.desc(), Story.id.desc()).limit(limit + 1).all()
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+    next_cursor = _encode_cursor(keys[-1].created_at, keys[-1].id) if has_more else None
+    
+    etag = make_weak_etag('stories', ','.join(fields), next_cursor, *[f"{k.id}v{k.version}" for k in keys])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Then load only the requested columns for those rows
+    rows = {}
+    if keys:
+        selected = list(dict.fromkeys(['id'] + fields))
+        for row in (db.session.query(*[LIST_FIELDS[f].label(f) for f in selected])
+                    .filter(Story.id.in_([k.id for k in keys]))):
+            rows[row.id] = row
+    
+    stories = []
+    for key in keys:
+        row = rows.get(key.id)
+        if row is None:
+            continue  # Deleted between the two queries
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            item[field] = value.isoformat() if isinstance(value, datetime) else value
+        stories.append(item)
+    
+    return with_etag(jsonify({
+        'stories': stories,
+        'next_cursor': next_cursor
+    }), etag)
 
 @stories_bp.route('/<int:story_id>', methods=['GET'])
 def get_story(story_id):
-    """Get single story by ID"""
-    story = Story.query.get_or_404(story_id)
-    return jsonify({
+    """
+    Get single story by ID
+    
+    Carries a weak ETag derived from the story's version; a matching
+    If-None-Match gets a 304 without loading the story body.
+    audio_offsets describe the story audio variant this client would be
+    served (see get_story_audio), named in audio_variant.
+    """
+    version = db.session.query(Story.version).filter(Story.id == story_id).scalar()
+    if version is None:
+        abort(404)
+    
+    wanted = requested_variant(request)
+    etag = make_weak_etag('story', story_id, version, wanted)
+    cached = not_modified(etag)
+    if cached:
+        cached.vary.update(VARY_HEADERS)
+        return cached
+    
+    story = db.session.get(Story, story_id)
+    response = with_etag(jsonify({
         'id': story.id,
         'uuid': story.uuid,
         'title': story.title,
@@ -38,15 +163,143 @@ def get_story(story_id):
         'prompt': story.prompt,
         'segments': story.segments,
         'audio_segments': story.audio_segments,
+        'audio_url': story_audio_url(story),
+        'audio_offsets': story_offsets(story, wanted),
+        'audio_variant': served_variant_name(story.audio_variants, wanted),
         'voice_id': story.voice_id,
         'created_at': story.created_at.isoformat(),
+        'updated_at': story.updated_at.isoformat() if story.updated_at else None,
         'processed_at': story.processed_at.isoformat() if story.processed_at else None
-    })
+    }), etag)
+    response.vary.update(VARY_HEADERS)
+    return response
+
+@stories_bp.route('/<int:story_id>/audio', methods=['GET'])
+def get_story_audio(story_id):
+    """
+    Serve the story's concatenated audio as one seekable stream
+    
+    Supports Range (206) and If-None-Match (304). Lower-bitrate variants
+    are picked like segment audio (?variant=, X-Audio-Variant, Save-Data
+    or ECT). Each variant has its own segment boundaries, returned as
+    audio_offsets by GET /api/stories/<id> for the same request headers.
+    """
+    story = Story.query.get_or_404(story_id)
+    if not story.audio_file:
+        return jsonify({'error': 'Story audio not available'}), 404
+    
+    download_name = f"story_{story.id}.mp3"
+    
+    # The URL is stable across edits, so responses are revalidated (max_age=None)
+    response = None
+    served_variant = STANDARD_VARIANT
+    wanted = requested_variant(request)
+    variant = pick_variant(story.audio_variants, wanted)
+    if variant:
+        response = send_stored_audio(variant['filename'], variant.get('etag') or True, download_name=download_name)
+        if response is not None:
+            served_variant = wanted
+    if response is None:
+        response = send_stored_audio(story.audio_file, story.audio_etag or True, download_name=download_name)
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+    
+    response.vary.update(VARY_HEADERS)
+    response.headers['X-Audio-Variant'] = served_variant
+    AUDIO_RESPONSE_BYTES.labels('story', served_variant, response.status_code).observe(response.content_length or 0)
+    return response
+
+@stories_bp.route('/<int:story_id>/manifest', methods=['GET'])
+def get_story_manifest(story_id):
+    """
+    Compact playback manifest for segment-by-segment players
+    
+    Lists each segment's audio URL, byte size, duration, start time,
+    content hash (the audio's strong ETag) and emotion/light color, plus
+    prefetch_at: the story time at which a player should start fetching
+    that segment so it is cached before it is needed. Timing follows the
+    audio variant the client would be served. Cached by a weak ETag on
+    the story version and requested variant.
+    """
+    version = db.session.query(Story.version).filter(Story.id == story_id).scalar()
+    if version is None:
+        abort(404)
+    
+    wanted = requested_variant(request)
+    etag = make_weak_etag('manifest', story_id, version, wanted)
+    cached = not_modified(etag)
+    if cached:
+        cached.vary.update(VARY_HEADERS)
+        return cached
+    
+    story = db.session.get(Story, story_id)
+    assets = {
+        asset.segment_index: asset
+        for asset in AudioAsset.query
+            .filter_by(story_id=story_id)
+            .with_entities(AudioAsset.segment_index, AudioAsset.filename, AudioAsset.size,
+                           AudioAsset.duration, AudioAsset.etag, AudioAsset.variants)
+    }
+    offsets = {entry['segment_index']: entry['start_time'] for entry in story_offsets(story, wanted) or []}
+    
+    segments = []
+    position = 0.0
+    for idx, segment in enumerate(story.segments or []):
+        asset = assets.get(idx)
+        emotion = (segment.get('emotion') or 'neutral').lower()
+        start = offsets.get(idx, position)
+        entry = {
+            'index': idx,
+            'emotion': emotion,
+            'color': emotion_color_value(emotion),
+            'start': round(start, 3),
+            'prefetch_at': round(max(0.0, start - MANIFEST_PREFETCH_SECONDS), 3)
+        }
+        if asset:
+            duration = segment_duration({'duration': asset.duration, 'variants': asset.variants}, wanted)
+            entry.update({
+                'url': f"/api/audio/{asset.filename}",
+                'filename': asset.filename,
+                'size': asset.size,
+                'duration': duration,
+                'hash': asset.etag
+            })
+            if asset.variants:
+                entry['variants'] = {
+                    name: {'size': variant.get('size'), 'hash': variant.get('etag'), 'duration': variant.get('duration')}
+                    for name, variant in asset.variants.items()
+                }
+            position = start + (duration or 0.0)
+        segments.append(entry)
+    
+    served = STANDARD_VARIANT
+    if pick_variant(story.audio_variants, wanted) or any(pick_variant(asset.variants, wanted) for asset in assets.values()):
+        served = wanted
+    
+    manifest = {
+        'story_id': story.id,
+        'version': version,
+        'variant': served,
+        'duration': round(position, 3),
+        'prefetch_window': {'seconds': MANIFEST_PREFETCH_SECONDS, 'segments_ahead': 1},
+        'segments': segments
+    }
+    if story.audio_file:
+        manifest['story_audio'] = {'url': story_audio_url(story), 'hash': story.audio_etag}
+        if story.audio_variants:
+            manifest['story_audio']['variants'] = {
+                name: {'size': variant.get('size'), 'hash': variant.get('etag'), 'offsets': variant.get('offsets')}
+                for name, variant in story.audio_variants.items()
+            }
+    
+    response = with_etag(jsonify(manifest), etag)
+    response.vary.update(VARY_HEADERS)
+    return response
 
 @stories_bp.route('/generate', methods=['POST'])
 def generate_story():
     """
-    Generate story from Gemini and process audio
+    Queue audio processing for caller-provided story segments
     
     Expected request body:
     {
@@ -57,6 +310,8 @@ def generate_story():
             {"text": "More text...", "emotion": "happy"}
         ]
     }
+    
+    Returns 202 with a job id; poll GET /api/stories/jobs/<job_id>.
     """
     try:
         data = request.json
@@ -65,64 +320,15 @@ def generate_story():
         if not data.get('title') or not data.get('segments'):
             return jsonify({'error': 'Missing required fields: title and segments'}), 400
         
-        # Extract full text from segments
-        full_content = ' '.join([seg['text'] for seg in data['segments']])
+        job = job_queue.submit('segments', {
+            'title': data['title'],
+            'prompt': data.get('prompt'),
+            'segments': data['segments'],
+            'voice_id': DEFAULT_VOICE_ID
+        })
         
-        # Create story in database (without audio yet)
-        story = Story(
-            title=data['title'],
-            content=full_content,
-            prompt=data.get('prompt'),
-            segments=data['segments']
-        )
-        db.session.add(story)
-        db.session.commit()
-        
-        print(f"\n📖 Created story: {story.title} (ID: {story.id}, UUID: {story.uuid})")
-        
-        # Process audio for each segment
-        processor = StoryAudioProcessor()
-        audio_metadata = processor.process_story_segments(
-            story_uuid=story.uuid,
-            segments=data['segments'],
-            voice_id="jTk8bSDoiLDLZqAVYKKr"  # Aayan voice
-        )
-        
-        # Store audio metadata in story
-        story.audio_segments = audio_metadata
-        story.processed_at = datetime.utcnow()
-        
-        # Create AudioAsset records for each segment
-        for meta in audio_metadata:
-            if meta.get('audio_file'):  # Only create if audio was successfully generated
-                audio_asset = AudioAsset(
-                    story_id=story.id,
-                    segment_index=meta['segment_index'],
-                    filename=meta['filename'],
-                    file_path=meta['audio_file'],
-                    emotion=meta['emotion'],
-                    duration=meta.get('duration')
-                )
-                db.session.add(audio_asset)
-        
-        db.session.commit()
-        
-        print(f"✓ Story saved with {len(audio_metadata)} audio segments")
-        
-        return jsonify({
-            'success': True,
-            'story': {
-                'id': story.id,
-                'uuid': story.uuid,
-                'title': story.title,
-                'content': story.content,
-                'segments': story.segments,
-                'audio_segments': story.audio_segments,
-                'created_at': story.created_at.isoformat(),
-                'processed_at': story.processed_at.isoformat()
-            },
-            'message': f'Story created with {len(audio_metadata)} audio segments'
-        }), 201
+        print(f"\n📥 Queued story job {job.id}: {data['title']}")
+        return _job_accepted(job)
         
     except Exception as e:
         db.session.rollback()
@@ -134,116 +340,31 @@ def generate_story():
 @stories_bp.route('', methods=['POST'])
 def create_story():
     """
-    Create story by generating from Gemini AI and processing audio
+    Queue story generation from Gemini AI plus audio processing
     
     Expected request body:
     {
         "prompt": "write a story for my child about...",
         "voice_id": "optional_voice_id" (defaults to "jTk8bSDoiLDLZqAVYKKr")
     }
+    
+    Returns 202 with a job id; poll GET /api/stories/jobs/<job_id>.
     """
     try:
-        import json
-        from utils.gemini import generate_story as gemini_generate_story
-        
         data = request.json
         
         # Validate prompt
         if not data.get('prompt'):
             return jsonify({'error': 'Missing required field: prompt'}), 400
         
-        # Get voice_id from request or use default
-        voice_id = data.get('voice_id', 'jTk8bSDoiLDLZqAVYKKr')
-        
-        print(f"\n🤖 Generating story from prompt: {data['prompt'][:100]}...")
-        print(f"🎤 Using voice ID: {voice_id}")
-        
-        # Generate story using Gemini
-        gemini_response = gemini_generate_story(data['prompt'])
-        
-        # Parse Gemini JSON response
-        # Remove markdown code blocks if present
-        if gemini_response.strip().startswith('```'):
-            # Strip markdown code block wrappers
-            lines = gemini_response.strip().split('\n')
-            if lines[0].startswith('```'):
-                lines = lines[1:]
-            if lines[-1].startswith('```'):
-                lines = lines[:-1]
-            gemini_response = '\n'.join(lines)
-        
-        generated_content = json.loads(gemini_response)
-        
-        print(f"✓ Story generated: {generated_content['title']}")
-        print(f"  Segments: {len(generated_content['segments'])}")
-        
-        # Extract full text from segments
-        full_content = ' '.join([seg['text'] for seg in generated_content['segments']])
-        
-        # Create story in database (without audio yet)
-        story = Story(
-            title=generated_content['title'],
-            content=full_content,
-            prompt=data.get('prompt'),
-            segments=generated_content['segments'],
-            voice_id=voice_id
-        )
-        db.session.add(story)
-        db.session.commit()
-        
-        print(f"📖 Created story: {story.title} (ID: {story.id}, UUID: {story.uuid})")
-        
-        # Process audio for each segment
-        print(f"🎵 Processing audio for {len(generated_content['segments'])} segments...")
-        processor = StoryAudioProcessor()
-        audio_metadata = processor.process_story_segments(
-            story_uuid=story.uuid,
-            segments=generated_content['segments'],
-            voice_id=voice_id
-        )
-        
-        # Store audio metadata in story
-        story.audio_segments = audio_metadata
-        story.processed_at = datetime.utcnow()
+        job = job_queue.submit('prompt', {
+            'prompt': data['prompt'],
+            'voice_id': data.get('voice_id', DEFAULT_VOICE_ID)
+        })
         
-        # Create AudioAsset records for each segment
-        for meta in audio_metadata:
-            if meta.get('audio_file'):  # Only create if audio was successfully generated
-                audio_asset = AudioAsset(
-                    story_id=story.id,
-                    segment_index=meta['segment_index'],
-                    filename=meta['filename'],
-                    file_path=meta['audio_file'],
-                    emotion=meta['emotion'],
-                    duration=meta.get('duration')
-                )
-                db.session.add(audio_asset)
+        print(f"\n📥 Queued story job {job.id} for prompt: {data['prompt'][:100]}...")
+        return _job_accepted(job)
         
-        db.session.commit()
-        
-        print(f"✓ Story saved with {len(audio_metadata)} audio segments\n")
-        
-        return jsonify({
-            'success': True,
-            'id': story.id,
-            'uuid': story.uuid,
-            'story': {
-                'id': story.id,
-                'uuid': story.uuid,
-                'title': story.title,
-                'content': story.content,
-                'segments': story.segments,
-                'audio_segments': story.audio_segments,
-                'created_at': story.created_at.isoformat(),
-                'processed_at': story.processed_at.isoformat()
-            },
-            'message': f'Story created with {len(audio_metadata)} audio segments'
-        }), 201
-        
-    except json.JSONDecodeError as e:
-        db.session.rollback()
-        print(f"❌ JSON Parse Error: {e}")
-        return jsonify({'error': f'Failed to parse Gemini response: {str(e)}'}), 500
     except Exception as e:
         db.session.rollback()
         print(f"❌ Error creating story: {e}")
@@ -251,33 +372,84 @@ def create_story():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@stories_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_story_job(job_id):
+    """Get status, stage and per-segment progress of a story job"""
+    job = StoryJob.query.get_or_404(job_id)
+    result = job.to_dict()
+    if job.status == 'completed' and job.story_id:
+        story = db.session.get(Story, job.story_id)
+        if story:
+            result['story'] = serialize_story(story)
+    return jsonify(result)
+
+def _job_accepted(job):
+    status_url = url_for('stories.get_story_job', job_id=job.id)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': status_url,
+        'job': job.to_dict()
+    }), 202, {'Location': status_url}
+
 @stories_bp.route('/<int:story_id>', methods=['PUT'])
 def update_story(story_id):
-    """Update story"""
+    """
+    Update story
+    
+    Title-only changes are applied immediately. Changed segments are
+    applied by a background "edit" job that re-synthesizes only the
+    segments that were added or changed and reuses the rest of the audio;
+    that case returns 202 with the job id, like story creation, or 409
+    while an earlier edit of the story is still queued or running.
+    """
     story = Story.query.get_or_404(story_id)
     data = request.json
     
     story.title = data.get('title', story.title)
-    story.content = data.get('content', story.content)
-    story.segments = data.get('segments', story.segments)
+    segments = data.get('segments')
+    
+    if segments is None or segments == story.segments:
+        story.content = data.get('content', story.content)
+        db.session.commit()
+        return jsonify({'message': 'Story updated'})
+    
+    if not all(isinstance(seg, dict) and seg.get('text') and seg.get('emotion') for seg in segments):
+        return jsonify({'error': 'Each segment needs text and emotion'}), 400
+    
+    # The edit would be planned against audio the pending one is about to replace
+    pending = (StoryJob.query
+               .filter(StoryJob.story_id == story.id, StoryJob.kind == 'edit',
+                       StoryJob.status.in_(['queued', 'running']))
+               .first())
+    if pending is not None:
+        db.session.rollback()
+        return jsonify({
+            'error': 'An edit of this story is still in progress',
+            'job_id': pending.id,
+            'status_url': url_for('stories.get_story_job', job_id=pending.id)
+        }), 409
     
     db.session.commit()
-    return jsonify({'message': 'Story updated'})
+    job = job_queue.submit('edit', {'segments': segments}, story_id=story.id)
+    print(f"\n📥 Queued edit job {job.id} for story {story.id}")
+    return _job_accepted(job)
 
 @stories_bp.route('/<int:story_id>', methods=['DELETE'])
 def delete_story(story_id):
-    """Delete story and associated audio files"""
-    story = Story.query.get_or_404(story_id)
+    """
+    Delete story and associated audio files
+    
+    The files are handed to the background reclaimer once the delete has
+    committed, so the response does not wait on the audio store.
+    """
+    # Assets are needed for the cascade, so fetch them in one extra query
+    story = Story.query.options(selectinload(Story.audio_files)).get_or_404(story_id)
     
-    # Delete audio files from filesystem
-    if story.audio_segments:
-        for audio_meta in story.audio_segments:
-            if audio_meta.get('audio_file'):
-                try:
-                    os.remove(audio_meta['audio_file'])
-                except:
-                    pass
+    audio_names = [name for meta in story.audio_segments or [] for name in segment_audio_names(meta)]
+    audio_names.extend(story_audio_names(story))
     
     db.session.delete(story)
     db.session.commit()
+    audio_reclaimer.reclaim(audio_names)
     return jsonify({'message': 'Story deleted'})
@@ -1,10 +1,15 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, Response
 import os
 import sys
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.audio_storage import get_audio_storage
 from utils.elevenlabs_client import generate_story_audio_from_gemini
+from utils.story_audio_processor import StoryAudioProcessor
+from utils.tts_stream import prime
+from api.audio import send_stored_audio
+import requests
 
 tts_bp = Blueprint('tts', __name__)
 
@@ -40,7 +45,7 @@ def generate_tts():
         
         if audio_path:
             # Return the relative path for frontend to access
-            relative_path = f'/audio/{filename}'
+            relative_path = f'/api/tts/audio/{filename}'
             return jsonify({
                 'success': True,
                 'audio_url': relative_path,
@@ -54,17 +59,49 @@ def generate_tts():
         return jsonify({'error': str(e)}), 500
 
 
+@tts_bp.route('/stream', methods=['POST'])
+def stream_tts():
+    """
+    Stream synthesized audio for a single segment as it is generated
+    
+    Expected request body:
+    {
+        "text": "Story text...",
+        "emotion": "calm",
+        "voice_id": "optional_voice_id"
+    }
+    
+    Audio is teed into the TTS cache, so repeating the same request is
+    served from disk.
+    """
+    try:
+        data = request.json
+        
+        if not data.get('text'):
+            return jsonify({'error': 'No text provided'}), 400
+        
+        segment = {'text': data['text'], 'emotion': data.get('emotion', 'neutral')}
+        voice_id = data.get('voice_id', 'jTk8bSDoiLDLZqAVYKKr')
+        
+        processor = StoryAudioProcessor()
+        audio_stream = prime(processor.stream_segment(segment, voice_id))
+        
+        return Response(audio_stream, mimetype='audio/mpeg')
+        
+    except requests.exceptions.RequestException as e:
+        return jsonify({'error': str(e)}), 502
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @tts_bp.route('/audio/<filename>', methods=['GET'])
 def serve_audio(filename):
     """
     Serve audio files
     """
     try:
-        audio_dir = os.path.dirname(os.path.dirname(__file__))
-        file_path = os.path.join(audio_dir, filename)
-        
-        if os.path.exists(file_path):
-            return send_file(file_path, mimetype='audio/mpeg')
+        if get_audio_storage().exists(filename):
+            return send_stored_audio(filename)
         else:
             return jsonify({'error': 'File not found'}), 404
             
@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response
 import os
 import sys
 from werkzeug.utils import secure_filename
@@ -6,37 +6,15 @@ from werkzeug.utils import secure_filename
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.elevenlabs_client import get_available_voices, client
-import requests
+from utils.voice_previews import voice_preview_cache
+from utils import http_client
+from utils.voice_catalog import BASIC_VOICES
 from dotenv import load_dotenv
 
 load_dotenv()
 
 voices_bp = Blueprint('voices', __name__)
 
-# Predefined basic ElevenLabs voices (commonly available)
-BASIC_VOICES = [
-    {
-        "voice_id": "21m00Tcm4TlvDq8ikWAM",
-        "name": "Rachel",
-        "description": "Calm and soothing female voice"
-    },
-    {
-        "voice_id": "EXAVITQu4vr4xnSDxMaL",
-        "name": "Bella",
-        "description": "Soft and expressive female voice"
-    },
-    {
-        "voice_id": "ErXwobaYiN019PkySvjV",
-        "name": "Antoni",
-        "description": "Well-rounded male voice"
-    },
-    {
-        "voice_id": "pNInz6obpgDQGcFmaJgB",
-        "name": "Adam",
-        "description": "Deep and resonant male voice"
-    }
-]
-
 @voices_bp.route('', methods=['GET'])
 def get_voices():
     """
@@ -54,35 +32,31 @@ def get_voices():
 @voices_bp.route('/preview/<voice_id>', methods=['GET'])
 def preview_voice(voice_id):
     """
-    Generate a preview audio sample for a voice
+    Serve a preview audio sample for a voice
+    
+    Cached previews are answered from memory or disk with an ETag and
+    honor If-None-Match. A preview that is already being rendered (by the
+    startup warmer or another request) is waited for and answered the
+    same way, so each preview is synthesized once. On any other miss the
+    audio is streamed to the client as it arrives from ElevenLabs while
+    being written to the cache; later requests get the cached copy and
+    its ETag.
     """
     try:
-        from utils.elevenlabs_client import generate_audio
-        
-        # Preview text
-        preview_text = "Hi, this is a voice using ElevenLabs API"
+        headers = {
+            'Content-Disposition': f'inline; filename="preview_{voice_id}.mp3"',
+            'Cache-Control': 'public, max-age=3600'  # Cache for 1 hour
+        }
         
-        print(f"🎤 Generating preview for voice: {voice_id}")
+        preview, audio_stream = voice_preview_cache.get_or_stream(voice_id)
+        if preview:
+            audio_data, etag = preview
+            response = Response(audio_data, mimetype='audio/mpeg', headers=headers)
+            response.set_etag(etag)
+            return response.make_conditional(request)
         
-        # Generate audio
-        audio_generator = generate_audio(preview_text, voice_id)
-        
-        if audio_generator:
-            # Collect audio chunks
-            audio_data = b''
-            for chunk in audio_generator:
-                audio_data += chunk
-            
-            # Return audio file
-            from flask import Response
-            return Response(
-                audio_data,
-                mimetype='audio/mpeg',
-                headers={
-                    'Content-Disposition': f'inline; filename="preview_{voice_id}.mp3"',
-                    'Cache-Control': 'public, max-age=3600'  # Cache for 1 hour
-                }
-            )
+        if audio_stream:
+            return Response(audio_stream, mimetype='audio/mpeg', headers=headers)
         else:
             return jsonify({'error': 'Failed to generate preview'}), 500
             
@@ -132,25 +106,26 @@ def create_custom_voice():
         try:
             # Use ElevenLabs API to create voice
             api_key = os.getenv('ELEVENLABS_API_KEY')
-            url = "https://api.elevenlabs.io/v1/voices/add"
+            url = f"{http_client.ELEVENLABS_API_BASE}/v1/voices/add"
             
             headers = {
                 "xi-api-key": api_key
             }
             
-            # Prepare multipart form data
+            # Prepare multipart form data (read into memory so a retry can resend it)
             with open(temp_filepath, 'rb') as f:
                 files = {
-                    'files': (filename, f, audio_file.content_type or 'audio/mpeg')
+                    'files': (filename, f.read(), audio_file.content_type or 'audio/mpeg')
                 }
                 
-                data = {
-                    'name': voice_name,
-                    'description': voice_description
-                }
-                
-                print(f"📤 Uploading to ElevenLabs...")
-                response = requests.post(url, headers=headers, files=files, data=data)
+            data = {
+                'name': voice_name,
+                'description': voice_description
+            }
+            
+            print(f"📤 Uploading to ElevenLabs...")
+            response = http_client.post(url, headers=headers, files=files, data=data,
+                                        timeout=(http_client.HTTP_CONNECT_TIMEOUT, 120))
             
             # Clean up temp file
             os.remove(temp_filepath)
@@ -1,33 +1,55 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
+from werkzeug.serving import is_running_from_reloader
 from config import Config
 from models import db
 from api.stories import stories_bp
 from api.tts import tts_bp
 from api.audio import audio_bp
 from api.lights import lights_bp
-from api.voices import voices_bp
+from api.voices import voices_bp, BASIC_VOICES
+from api.metrics import metrics_bp
+from utils.audio_reclaimer import audio_reclaimer
+from utils.db_migrations import upgrade_schema
+from utils.http_cache import init_compression
+from utils.job_queue import job_queue
+from utils.story_pipeline import backfill_emotion_summaries
+from utils.voice_previews import start_preview_warmer
 
-def create_app():
+def create_app(start_background=True):
     app = Flask(__name__)
     app.config.from_object(Config)
     
     # Initialize database
     db.init_app(app)
     
-    # Create tables
+    # Create tables and add any new columns to an existing database
     with app.app_context():
-        db.create_all()
+        upgrade_schema(db)
+        backfill_emotion_summaries()
     
+    # Background story generation workers
+    job_queue.init_app(app, start_workers=start_background)
+    
+    # Deferred audio deletion and the periodic orphan sweep
+    audio_reclaimer.init_app(app, start_sweeper=start_background)
+    
+    # Pre-render voice picker previews so they never wait on ElevenLabs
+    if start_background:
+        start_preview_warmer(voice['voice_id'] for voice in BASIC_VOICES)
     
     app.register_blueprint(stories_bp, url_prefix='/api/stories')
     app.register_blueprint(tts_bp, url_prefix='/api/tts')
     app.register_blueprint(audio_bp, url_prefix='/api/audio')
     app.register_blueprint(lights_bp, url_prefix='/api/lights')
     app.register_blueprint(voices_bp, url_prefix='/api/voices')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
     
     # Enable CORS for all routes
     CORS(app, resources={r"/api/*": {"origins": "*"}})
+    
+    # gzip/deflate JSON responses for clients that accept it
+    init_compression(app)
 
     @app.route('/api/health')
     def health():
@@ -36,5 +58,6 @@ def create_app():
     return app
 
 if __name__ == '__main__':
-    app = create_app()
+    # Under the debug reloader only the serving child runs background workers
+    app = create_app(start_background=is_running_from_reloader())
     app.run(debug=True, port=5001, host='0.0.0.0')
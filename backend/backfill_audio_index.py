@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Backfill durations and seek tables for existing audio segments
+
+Scans the MP3 frame headers of every AudioAsset that is missing a
+duration or seek table, updates the row, and copies the duration into
+the matching entry of Story.audio_segments and the story's emotion
+summary.
+
+Usage:
+    python backfill_audio_index.py [--batch-size 500] [--force]
+"""
+import argparse
+import time
+from sqlalchemy import or_
+
+from app import create_app
+from models import db, Story, AudioAsset
+from utils.audio_storage import get_audio_storage
+from utils.mp3_frames import index_mp3_data
+from utils.story_pipeline import compute_emotion_summary
+
+
+def backfill(batch_size=500, force=False):
+    started = time.time()
+    storage = get_audio_storage()
+    indexed = missing = failed = 0
+    touched_story_ids = set()
+    last_id = 0
+
+    while True:
+        query = AudioAsset.query.filter(AudioAsset.id > last_id)
+        if not force:
+            query = query.filter(or_(AudioAsset.duration.is_(None), AudioAsset.seek_table.is_(None)))
+        batch = query.order_by(AudioAsset.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for asset in batch:
+            last_id = asset.id
+            try:
+                data = storage.read_bytes(asset.filename)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            try:
+                index = index_mp3_data(data)
+            except Exception as e:
+                print(f"  ✗ {asset.filename}: {e}")
+                failed += 1
+                continue
+
+            asset.duration = index['duration']
+            asset.seek_table = index['seek_table']
+            if asset.size is None:
+                asset.size = len(data)
+            touched_story_ids.add(asset.story_id)
+            indexed += 1
+
+        db.session.commit()
+        print(f"  … indexed {indexed} segments")
+
+    # Copy durations into each story's audio_segments JSON, and refresh the
+    # emotion summary whose durations were computed from the old values
+    for story_id in touched_story_ids:
+        story = db.session.get(Story, story_id)
+        if not story or not story.audio_segments:
+            continue
+        durations = {
+            asset.segment_index: asset.duration
+            for asset in AudioAsset.query.filter_by(story_id=story_id)
+        }
+        story.audio_segments = [
+            {**meta, 'duration': durations.get(meta['segment_index'], meta.get('duration'))}
+            for meta in story.audio_segments
+        ]
+        story.emotion_summary = compute_emotion_summary(story.segments, story.audio_segments)
+    db.session.commit()
+
+    print(f"\n✓ Backfill complete in {time.time() - started:.1f}s")
+    print(f"  Indexed: {indexed}  Missing files: {missing}  Failed: {failed}  Stories updated: {len(touched_story_ids)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index MP3 frame headers for existing audio segments")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per commit")
+    parser.add_argument("--force", action="store_true", help="Re-index segments that already have an index")
+    args = parser.parse_args()
+
+    app = create_app(start_background=False)
+    with app.app_context():
+        backfill(batch_size=args.batch_size, force=args.force)
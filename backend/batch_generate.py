@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Batch-generate a library of stories from a JSONL file of prompts
+
+Each input line is a JSON object:
+    {"prompt": "A shy turtle joins a swim class", "voice_id": "jTk8bSDoiLDLZqAVYKKr"}
+voice_id is optional. Prompts that already have a processed story with
+the same voice are skipped, so an interrupted run can simply be restarted.
+
+Gemini generation and segment synthesis run on separately sized pools:
+a story's segments are queued for synthesis as soon as its text is
+ready, and stories are saved (combined audio, AudioAsset rows) as soon
+as their last segment finishes. All database writes happen on the main
+thread.
+
+Usage:
+    python batch_generate.py prompts.jsonl [--gemini-workers 2] [--tts-workers 4] [--limit N]
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app import create_app
+from models import db, Story
+from utils.gemini import generate_story as gemini_generate_story
+from utils.story_audio_processor import TTS_MAX_WORKERS, StoryAudioProcessor
+from utils.story_pipeline import (
+    DEFAULT_VOICE_ID, build_story_audio, new_story, parse_gemini_story, save_story_audio
+)
+
+
+def read_prompts(path):
+    """Parse the input file into a de-duplicated list of {prompt, voice_id}"""
+    prompts = []
+    seen = set()
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"  ✗ Line {line_number}: invalid JSON ({e})")
+                continue
+            if not entry.get('prompt'):
+                print(f"  ✗ Line {line_number}: missing prompt")
+                continue
+
+            key = (entry['prompt'], entry.get('voice_id') or DEFAULT_VOICE_ID)
+            if key in seen:
+                continue
+            seen.add(key)
+            prompts.append({'prompt': key[0], 'voice_id': key[1]})
+    return prompts
+
+
+def already_done(prompts):
+    """(prompt, voice_id) pairs that already have a processed story"""
+    done = set()
+    texts = list({entry['prompt'] for entry in prompts})
+    # Stay under SQLite's bound-parameter limit
+    for i in range(0, len(texts), 500):
+        rows = (db.session.query(Story.prompt, Story.voice_id)
+                .filter(Story.prompt.in_(texts[i:i + 500]), Story.processed_at.isnot(None))
+                .all())
+        done.update((row.prompt, row.voice_id or DEFAULT_VOICE_ID) for row in rows)
+    return done
+
+
+def generate_text(prompt):
+    started = time.perf_counter()
+    content = parse_gemini_story(gemini_generate_story(prompt))
+    return content, time.perf_counter() - started
+
+
+def synthesize(processor, story_uuid, idx, segment, voice_id, total):
+    started = time.perf_counter()
+    try:
+        meta = processor.process_indexed_segment(story_uuid, idx, segment, voice_id, total)
+    except Exception as e:
+        print(f"  ✗ Failed to process segment {idx}: {e}")
+        meta = {
+            "segment_index": idx,
+            "text": segment.get('text'),
+            "emotion": segment.get('emotion'),
+            "audio_file": None,
+            "filename": None,
+            "duration": None,
+            "error": str(e)
+        }
+    return meta, time.perf_counter() - started
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def print_latency(label, values):
+    if not values:
+        print(f"  {label:<14} -")
+        return
+    print(f"  {label:<14} n={len(values):<5} p50 {percentile(values, 50):6.2f}s  "
+          f"p95 {percentile(values, 95):6.2f}s  max {max(values):6.2f}s")
+
+
+def run_batch(prompts, gemini_workers, tts_workers):
+    processor = StoryAudioProcessor(max_workers=tts_workers)
+    started = time.perf_counter()
+
+    latencies = {'gemini': [], 'segment': [], 'save': [], 'story': []}
+    counts = {'stories': 0, 'segments': 0, 'failed_prompts': 0, 'failed_segments': 0}
+
+    stories = {}  # story id -> {story, metadata, remaining, submitted_at}
+    pending = {}  # future -> ('gemini', entry, submitted_at) | ('segment', story_id)
+
+    def finish_story(story_id):
+        # Every segment of the story is done: combine and persist
+        state = stories.pop(story_id)
+        save_started = time.perf_counter()
+        build_story_audio(state['story'], state['metadata'])
+        save_story_audio(state['story'], state['metadata'])
+        latencies['save'].append(time.perf_counter() - save_started)
+        latencies['story'].append(time.perf_counter() - state['submitted_at'])
+        counts['stories'] += 1
+        print(f"✓ Saved story {story_id} ({counts['stories']}/{len(prompts)})")
+
+    with ThreadPoolExecutor(max_workers=gemini_workers, thread_name_prefix="gemini") as gemini_pool, \
+            ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="tts") as tts_pool:
+
+        for entry in prompts:
+            future = gemini_pool.submit(generate_text, entry['prompt'])
+            pending[future] = ('gemini', entry, time.perf_counter())
+
+        while pending:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = pending.pop(future)
+
+                if task[0] == 'segment':
+                    state = stories[task[1]]
+                    meta, elapsed = future.result()
+                    latencies['segment'].append(elapsed)
+                    counts['segments'] += 1
+                    if not meta.get('audio_file'):
+                        counts['failed_segments'] += 1
+                    state['metadata'][meta['segment_index']] = meta
+                    state['remaining'] -= 1
+                    if not state['remaining']:
+                        finish_story(task[1])
+                    continue
+
+                _, entry, submitted_at = task
+                try:
+                    content, elapsed = future.result()
+                    segments = content['segments']
+                except Exception as e:
+                    print(f"  ✗ Gemini failed for '{entry['prompt'][:60]}': {e}")
+                    counts['failed_prompts'] += 1
+                    continue
+
+                latencies['gemini'].append(elapsed)
+                story = new_story(content['title'], segments, entry['voice_id'], prompt=entry['prompt'])
+                db.session.add(story)
+                db.session.commit()
+                print(f"📖 {story.title} ({len(segments)} segments, {elapsed:.1f}s)")
+
+                stories[story.id] = {
+                    'story': story,
+                    'metadata': [None] * len(segments),
+                    'remaining': len(segments),
+                    'submitted_at': submitted_at
+                }
+                if not segments:
+                    finish_story(story.id)
+                for idx, segment in enumerate(segments):
+                    segment_future = tts_pool.submit(
+                        synthesize, processor, story.uuid, idx, segment, entry['voice_id'], len(segments)
+                    )
+                    pending[segment_future] = ('segment', story.id)
+
+    elapsed = time.perf_counter() - started
+
+    print("\n" + "=" * 60)
+    print("📊 Batch complete")
+    print("=" * 60)
+    print(f"  Stories:   {counts['stories']} saved, {counts['failed_prompts']} failed in Gemini")
+    print(f"  Segments:  {counts['segments']} synthesized, {counts['failed_segments']} failed")
+    print(f"  Wall time: {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"  Throughput: {counts['stories'] / elapsed * 60:.1f} stories/min, "
+              f"{counts['segments'] / elapsed:.2f} segments/s")
+    print("\n  Latency by stage:")
+    print_latency('gemini', latencies['gemini'])
+    print_latency('tts segment', latencies['segment'])
+    print_latency('save', latencies['save'])
+    print_latency('end-to-end', latencies['story'])
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate stories (text + audio) from a JSONL file of prompts")
+    parser.add_argument("input", help="JSONL file with one {\"prompt\", \"voice_id\"} object per line")
+    parser.add_argument("--gemini-workers", type=int, default=2, help="Concurrent Gemini generations")
+    parser.add_argument("--tts-workers", type=int, default=TTS_MAX_WORKERS, help="Concurrent segment syntheses")
+    parser.add_argument("--limit", type=int, help="Only process the first N pending prompts")
+    args = parser.parse_args()
+
+    app = create_app(start_background=False)
+    with app.app_context():
+        prompts = read_prompts(args.input)
+        done = already_done(prompts)
+        todo = [entry for entry in prompts if (entry['prompt'], entry['voice_id']) not in done]
+        skipped = len(prompts) - len(todo)
+        if args.limit:
+            todo = todo[:args.limit]
+
+        print(f"📚 {len(prompts)} prompts, {skipped} already done, {len(todo)} to generate")
+        if not todo:
+            sys.exit(0)
+
+        counts = run_batch(todo, max(1, args.gemini_workers), max(1, args.tts_workers))
+        sys.exit(1 if counts['failed_prompts'] else 0)
@@ -0,0 +1,13 @@
+"""
+Offline benchmarks for the story backend
+
+stand_ins: local HTTP servers that mimic ElevenLabs, Gemini, Govee and S3
+harness: drives the API at set concurrencies and reports latency percentiles
+light_fanout: checks that group light commands cost about one device's latency
+db_writers: checks SQLite for lock errors under concurrent writers and readers
+
+Run from backend/:
+    python -m bench.harness --scenario stories,audio,lights --concurrency 1,4,16
+    python -m bench.light_fanout
+    python -m bench.db_writers
+"""
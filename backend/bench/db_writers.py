@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Check that SQLite handles concurrent writers and readers without lock errors
+
+Runs --writers threads that each insert and update --writes stories
+while --readers threads list recent stories, against a throwaway
+database with the app's engine settings (WAL, busy timeout, pooled
+connections from utils/db_engine.py). Reports commit throughput and read
+latency, and exits with status 1 on any error or lost write.
+
+Usage (from backend/):
+    python -m bench.db_writers [--writers 8] [--readers 16] [--writes 200] [--read-seconds 5]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent SQLite writers and readers through the app's engine")
+    parser.add_argument("--writers", type=int, default=8, help="Writer threads")
+    parser.add_argument("--readers", type=int, default=16, help="Reader threads")
+    parser.add_argument("--writes", type=int, default=200, help="Stories each writer inserts and updates")
+    parser.add_argument("--read-seconds", type=float, default=5.0, help="Longest time readers keep reading")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="storybook-db-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'stress.db')}"
+
+    # Configuration is read at import time, so import only once the environment is set
+    from app import create_app
+    from models import db, Story
+
+    app = create_app(start_background=False)
+    errors = []
+    read_latencies = []
+    writes_done = threading.Event()
+    lock = threading.Lock()
+
+    def writer(worker):
+        with app.app_context():
+            for i in range(args.writes):
+                try:
+                    story = Story(
+                        title=f"Stress {worker}-{i}",
+                        content="Once upon a time " * 50,
+                        segments=[{"text": "Once upon a time", "emotion": "calm"}]
+                    )
+                    db.session.add(story)
+                    db.session.commit()
+                    story.audio_segments = []
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(f"write: {e}")
+
+    def reader():
+        deadline = time.time() + args.read_seconds
+        with app.app_context():
+            while time.time() < deadline and not (writes_done.is_set() and read_latencies):
+                started = time.perf_counter()
+                try:
+                    db.session.query(Story.id, Story.title).order_by(Story.created_at.desc()).limit(20).all()
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(f"read: {e}")
+                    continue
+                with lock:
+                    read_latencies.append(time.perf_counter() - started)
+
+    started = time.time()
+    writers = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    readers = [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    write_elapsed = time.time() - started
+    writes_done.set()
+    for thread in readers:
+        thread.join()
+
+    with app.app_context():
+        journal_mode = db.session.execute(db.text("PRAGMA journal_mode")).scalar()
+        total = Story.query.count()
+
+    expected = args.writers * args.writes
+    print(f"journal_mode={journal_mode}")
+    print(f"Writes: {total}/{expected} rows in {write_elapsed:.2f}s ({2 * total / write_elapsed:.0f} commits/s)")
+    if read_latencies:
+        read_latencies.sort()
+        p99 = read_latencies[max(0, int(len(read_latencies) * 0.99) - 1)]
+        print(f"Reads: {len(read_latencies)} queries, p50 {read_latencies[len(read_latencies) // 2] * 1000:.1f}ms, "
+              f"p99 {p99 * 1000:.1f}ms, max {read_latencies[-1] * 1000:.1f}ms")
+    print(f"Errors: {len(errors)}")
+    for error in errors[:5]:
+        print(f"  {error}")
+
+    if errors or total != expected:
+        raise SystemExit(1)
+    print("✓ No lock errors under concurrent writers and readers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the story API
+
+Drives POST /api/stories, GET /api/audio/<file> and
+POST /api/lights/set-color at each requested concurrency and reports
+throughput and p50/p95/p99 latency. Story requests are timed twice:
+until the 202 (submit) and until the job finishes (complete).
+
+By default the backend runs in this process against the local
+stand-ins, with a throwaway database, audio store and caches, so no
+paid API is called and a run with the same --seed is reproducible.
+With --target, requests go to an already running server instead
+(start it with the environment printed by python -m bench.stand_ins).
+
+Pipeline settings (TTS_REQUESTS_PER_SECOND, STORY_JOB_WORKERS,
+AUDIO_VARIANTS, ...) are read from the environment as usual, so the
+same run can be repeated before and after a change. With
+AUDIO_STORAGE=s3 audio is stored in the S3 stand-in and the audio
+scenario follows the redirect to its presigned URLs. Against a
+long-running --target, change --seed between runs so stories are not
+served from the TTS cache.
+
+Usage (from backend/):
+    python -m bench.harness [--scenario stories,audio,lights] [--concurrency 1,4,16]
+                            [--requests 100] [--story-requests 8] [--json results.json]
+                            [--target http://localhost:5001] [--verbose]
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.stand_ins import add_arguments, backend_environment, start_stand_ins
+
+SCENARIOS = ('stories', 'audio', 'lights')
+JOB_POLL_INTERVAL = 0.1
+JOB_TIMEOUT = 600
+
+LIGHT_COLORS = [
+    ('happy', 16766720), ('calm', 8900331), ('excited', 16744192),
+    ('sad', 4286945), ('scared', 9055202), ('angry', 14423100),
+]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+class Recorder:
+    """Thread-safe latency samples, errors and byte counts per series"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.bytes = {}
+
+    def add(self, series, seconds, size=0):
+        with self._lock:
+            self.samples.setdefault(series, []).append(seconds)
+            self.bytes[series] = self.bytes.get(series, 0) + size
+
+    def error(self, series, message):
+        with self._lock:
+            self.errors.setdefault(series, []).append(message)
+
+
+class Client:
+    """One keep-alive session per benchmark thread"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def get(self, path, **kwargs):
+        return self.session.get(self.base_url + path, timeout=60, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session.post(self.base_url + path, timeout=60, **kwargs)
+
+
+def wait_for_job(client, status_url):
+    """Poll a story job until it finishes; returns the final job dict"""
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        job = client.get(status_url).json()
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(JOB_POLL_INTERVAL)
+    raise TimeoutError(f"Job {status_url} did not finish in {JOB_TIMEOUT}s")
+
+
+def story_op(client, recorder, i, tag):
+    started = time.perf_counter()
+    response = client.post('/api/stories', json={'prompt': f"A benchmark story {tag}-{i}"})
+    submitted = time.perf_counter()
+    if response.status_code != 202:
+        recorder.error('stories.submit', f"HTTP {response.status_code}")
+        return
+    recorder.add('stories.submit', submitted - started)
+
+    job = wait_for_job(client, response.headers['Location'])
+    if job['status'] != 'completed':
+        recorder.error('stories.complete', job.get('error') or 'failed')
+        return
+    recorder.add('stories.complete', time.perf_counter() - started)
+
+
+def audio_op(client, recorder, i, filenames):
+    started = time.perf_counter()
+    response = client.get(f"/api/audio/{filenames[i % len(filenames)]}")
+    size = len(response.content)  # Read the whole body, as a player would
+    if response.status_code != 200:
+        recorder.error('audio', f"HTTP {response.status_code}")
+        return
+    recorder.add('audio', time.perf_counter() - started, size)
+
+
+def lights_op(client, recorder, i):
+    emotion, color_value = LIGHT_COLORS[i % len(LIGHT_COLORS)]
+    started = time.perf_counter()
+    response = client.post('/api/lights/set-color', json={
+        'emotion': emotion,
+        'colorValue': color_value,
+        'requestId': f"bench-{i}"
+    })
+    if response.status_code != 200:
+        recorder.error('lights', f"HTTP {response.status_code}")
+        return
+    recorder.add('lights', time.perf_counter() - started)
+
+
+def run_level(op, concurrency, total):
+    """Run op(recorder, i, concurrency) total times on concurrency threads; returns (recorder, wall seconds)"""
+    recorder = Recorder()
+    counter = itertools.count()
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                i = next(counter)
+            if i >= total:
+                return
+            try:
+                op(recorder, i, concurrency)
+            except Exception as e:
+                recorder.error('exceptions', f"{e.__class__.__name__}: {e}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return recorder, time.perf_counter() - started
+
+
+def summarize(scenario, concurrency, recorder, wall):
+    rows = []
+    for series in sorted(set(recorder.samples) | set(recorder.errors)):
+        samples = sorted(recorder.samples.get(series, []))
+        rows.append({
+            'scenario': scenario,
+            'series': series,
+            'concurrency': concurrency,
+            'requests': len(samples),
+            'errors': len(recorder.errors.get(series, [])),
+            'seconds': round(wall, 3),
+            'throughput': round(len(samples) / wall, 2) if wall else None,
+            'mb_per_second': round(recorder.bytes.get(series, 0) / wall / 1e6, 2) if wall else None,
+            'p50_ms': _ms(percentile(samples, 50)),
+            'p95_ms': _ms(percentile(samples, 95)),
+            'p99_ms': _ms(percentile(samples, 99)),
+            'first_error': (recorder.errors.get(series) or [None])[0],
+        })
+    return rows
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def format_row(row):
+    def cell(value):
+        return '-' if value is None else value
+    return (f"{row['series']:<18}{row['concurrency']:>6}{row['requests']:>10}{row['errors']:>8}"
+            f"{row['throughput']:>10}{row['mb_per_second']:>8}"
+            f"{cell(row['p50_ms']):>10}{cell(row['p95_ms']):>10}{cell(row['p99_ms']):>10}")
+
+
+def start_backend(env, workdir):
+    """Run the app in this process on a free port, against env and a throwaway data directory"""
+    os.environ.update(env)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'AUDIO_STORAGE_DIR': os.path.join(workdir, 'audio'),
+        'TTS_CACHE_DIR': os.path.join(workdir, 'tts_cache'),
+        'VOICE_PREVIEW_CACHE_DIR': os.path.join(workdir, 'voice_previews'),
+    })
+
+    # Configuration is read at import time, so import only once the environment is set
+    from app import create_app
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-backend", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def prepare_audio(client):
+    """Generate one story and return its segment filenames"""
+    response = client.post('/api/stories', json={'prompt': 'A benchmark story for audio serving'})
+    response.raise_for_status()
+    job = wait_for_job(client, response.headers['Location'])
+    if job['status'] != 'completed':
+        raise RuntimeError(f"Could not prepare audio: {job.get('error')}")
+    return [segment['filename'] for segment in job['story']['audio_segments'] if segment.get('filename')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the story API against local stand-ins")
+    parser.add_argument("--scenario", default=','.join(SCENARIOS), help="Comma-separated: stories, audio, lights")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per level for audio and lights")
+    parser.add_argument("--story-requests", type=int, default=8, help="Stories per level")
+    parser.add_argument("--target", help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the in-process backend's log output")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenario.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenario: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    out = sys.stdout
+    stand_ins = {}
+    log = None
+    if args.target:
+        base_url = args.target
+    else:
+        stand_ins = start_stand_ins(args)
+        workdir = tempfile.mkdtemp(prefix="storybook-bench-")
+        if not args.verbose:
+            log = open(os.path.join(workdir, 'backend.log'), 'w')
+            sys.stdout = log
+        base_url = start_backend(backend_environment(stand_ins), workdir)
+        print(f"🏁 Backend on {base_url}, data in {workdir}", file=out)
+
+    try:
+        client = Client(base_url)
+        ops = {
+            # Prompts differ per seed and level so no level reuses another's cached audio
+            'stories': lambda recorder, i, level: story_op(client, recorder, i, f"{args.seed}-{level}"),
+            'lights': lambda recorder, i, level: lights_op(client, recorder, i),
+        }
+        if 'audio' in scenarios:
+            filenames = prepare_audio(client)
+            ops['audio'] = lambda recorder, i, level: audio_op(client, recorder, i, filenames)
+
+        print(f"\n{'series':<18}{'conc':>6}{'requests':>10}{'errors':>8}{'req/s':>10}{'MB/s':>8}"
+              f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=out)
+        results = []
+        for scenario in scenarios:
+            total = args.story_requests if scenario == 'stories' else args.requests
+            for level in levels:
+                recorder, wall = run_level(ops[scenario], level, total)
+                for row in summarize(scenario, level, recorder, wall):
+                    results.append(row)
+                    print(format_row(row), file=out)
+                    if row['first_error']:
+                        print(f"{'':<18}first error: {row['first_error']}", file=out)
+
+        if stand_ins:
+            print("\nStand-in calls:", file=out)
+            for name, server in stand_ins.items():
+                print(f"  {name}: {server.stats}", file=out)
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({
+                    'settings': {key: value for key, value in vars(args).items() if key != 'json'},
+                    'results': results,
+                    'stand_ins': {name: server.stats for name, server in stand_ins.items()},
+                }, f, indent=2)
+            print(f"\n✓ Results written to {args.json}", file=out)
+    finally:
+        sys.stdout = out
+        if log:
+            log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Check that a light command to a group costs about one device's latency
+
+Builds groups of 1 and --devices stub devices whose send sleeps for
+--latency seconds, sends each group a color + brightness command and
+compares the wall times. Exits with status 1 when the large group takes
+more than --max-ratio times as long as the single device, i.e. when
+devices queue behind each other instead of running concurrently.
+
+Usage (from backend/):
+    python -m bench.light_fanout [--devices 12] [--latency 0.2] [--rounds 3] [--max-ratio 1.5]
+"""
+import argparse
+import sys
+import time
+
+from utils.govee import DeviceCommandQueue, brightness_capability, color_capability
+from utils.light_devices import DeviceGroup
+
+
+def stub_group(count, latency):
+    def send(sku, device, capability, request_id):
+        time.sleep(latency)
+        return {'code': 200, 'msg': 'success'}
+
+    return DeviceGroup('bench', [
+        (f"stub-{i}", DeviceCommandQueue('H6000', f"stub-{i}", min_interval=0, send=send))
+        for i in range(count)
+    ])
+
+
+def time_group(group, rounds):
+    """Slowest wall time over rounds of distinct color + brightness commands"""
+    slowest = 0.0
+    for i in range(rounds):
+        started = time.monotonic()
+        results = group.send([color_capability(1000 + i), brightness_capability(50 + i)], f"fanout-{i}")
+        slowest = max(slowest, time.monotonic() - started)
+        errors = [name for name, result in results.items() if 'error' in result]
+        if errors:
+            raise RuntimeError(f"Devices failed: {', '.join(errors)}")
+    return slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare group command latency with one device's")
+    parser.add_argument("--devices", type=int, default=12, help="Devices in the large group")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds each stub send takes")
+    parser.add_argument("--rounds", type=int, default=3, help="Commands sent to each group")
+    parser.add_argument("--max-ratio", type=float, default=1.5, help="Largest allowed group / single wall time")
+    args = parser.parse_args()
+
+    single = time_group(stub_group(1, args.latency), args.rounds)
+    group = time_group(stub_group(args.devices, args.latency), args.rounds)
+    ratio = group / single
+    print(f"1 device: {single * 1000:.0f} ms, {args.devices} devices: {group * 1000:.0f} ms (x{ratio:.2f})")
+
+    if ratio > args.max_ratio:
+        print(f"✗ Group latency grows with the device count (limit x{args.max_ratio})")
+        sys.exit(1)
+    print("✓ Group latency stays close to one device's")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the ElevenLabs, Gemini and Govee APIs and S3
+
+Each stand-in is a threaded HTTP server answering the endpoints the
+backend calls. Every request waits for a latency drawn from a
+configurable distribution and fails with a configurable probability.
+Successful responses depend only on the request body, so the same text
+always produces the same MP3 bytes and the TTS cache behaves as it does
+against the real API. The S3 stand-in keeps objects in memory and
+checks SigV4 signatures, so AUDIO_STORAGE=s3 can be run end to end.
+
+Latency specs, in seconds:
+    0.2                  fixed
+    uniform:0.1:0.5      uniform between the bounds
+    lognormal:0.8:0.4    median 0.8, sigma 0.4 (long right tail)
+
+Usage (from backend/):
+    python -m bench.stand_ins [--port 8701] [--elevenlabs-latency lognormal:1.2:0.4] [--elevenlabs-errors 0.02] [--seed 0]
+
+Prints the environment to start the backend with, then serves until Ctrl+C.
+"""
+import argparse
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from utils.mp3_frames import parse_frame_header
+
+# Used to size fake audio: roughly how fast the narrators speak
+CHARS_PER_SECOND = 15
+
+STORY_EMOTIONS = ['happy', 'calm', 'excited', 'sad', 'scared', 'angry', 'neutral']
+STORY_WORDS = (
+    'the little fox walked slowly through a quiet forest and felt the soft moss under '
+    'her paws she wondered why her friend looked sad today so she sat beside him and '
+    'asked gently what was wrong it is okay to feel worried sometimes said the owl'
+).split()
+
+# (MPEG version bits, sample rate index) per sample rate
+_SAMPLE_RATE_BITS = {
+    44100: (3, 0), 48000: (3, 1), 32000: (3, 2),
+    22050: (2, 0), 24000: (2, 1), 16000: (2, 2),
+    11025: (0, 0), 12000: (0, 1), 8000: (0, 2),
+}
+
+
+class Latency:
+    """A latency distribution parsed from a spec string"""
+
+    _ARITY = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+
+    def __init__(self, spec):
+        self.spec = str(spec)
+        kind, *args = self.spec.split(':')
+        if not args:
+            kind, args = 'fixed', [kind]
+        try:
+            self.args = tuple(float(arg) for arg in args)
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        if self._ARITY.get(kind) != len(self.args) or min(self.args) < 0:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self.kind = kind
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            return self.args[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.args)
+        median, sigma = self.args
+        return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+class Profile:
+    """How a stand-in behaves: latency per request and the share of requests that fail"""
+
+    def __init__(self, latency='0', error_rate=0.0, error_status=503):
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+
+@functools.lru_cache(maxsize=None)
+def _frame_header(output_format):
+    """4-byte Layer III header and parsed frame info for an ElevenLabs output_format"""
+    try:
+        codec, sample_rate, kbps = output_format.split('_')
+        version, rate_index = _SAMPLE_RATE_BITS[int(sample_rate)]
+        bitrate = int(kbps) * 1000
+    except (ValueError, KeyError):
+        raise ValueError(f"Unsupported output_format: {output_format}")
+    if codec != 'mp3':
+        raise ValueError(f"Unsupported output_format: {output_format}")
+
+    for bitrate_index in range(1, 15):
+        # Layer III, no CRC, no padding, mono
+        header = bytes([0xFF, 0xE0 | version << 3 | 0b011, bitrate_index << 4 | rate_index << 2, 0xC0])
+        frame = parse_frame_header(header, 0)
+        if frame['bitrate'] == bitrate:
+            return header, frame
+    raise ValueError(f"Unsupported output_format: {output_format}")
+
+
+def fake_mp3(seed, seconds, output_format='mp3_44100_128'):
+    """
+    Deterministic MP3 frame stream about seconds long
+
+    Frame headers are valid for the format's sample rate and bitrate, so
+    frame indexing, durations and story concatenation work as with real
+    audio; payloads are pseudo-random bytes derived from seed.
+    """
+    header, frame = _frame_header(output_format)
+    frames = max(1, math.ceil(seconds * frame['sample_rate'] / frame['samples']))
+    payload_size = frame['length'] - 4
+    payload = random.Random(seed).randbytes(frames * payload_size)
+    return b''.join(header + payload[i:i + payload_size] for i in range(0, len(payload), payload_size))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+        server.count('requests')
+
+        route, match = server.route(method, url.path)
+        if route is None:
+            server.count('not_found')
+            self.send_json(404, {'error': f"No stand-in for {method} {url.path}"})
+            return
+
+        latency, fail = server.draw()
+        time.sleep(latency)
+        if fail:
+            server.count('errors')
+            status = server.profile.error_status
+            self.send_json(status, {'error': 'Injected failure'}, {'Retry-After': '1'} if status == 429 else None)
+            return
+
+        route(self, match, parse_qs(url.query, keep_blank_values=True), body)
+
+    def send_json(self, status, body, headers=None):
+        self.send_bytes(status, json.dumps(body).encode('utf-8'), 'application/json', headers)
+
+    def send_bytes(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def send_chunked(self, content_type, chunks, interval=0):
+        """Stream chunks with chunked transfer encoding, interval seconds apart"""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i and interval:
+                time.sleep(interval)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass  # A line per request would drown the benchmark output
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded server that routes requests to handler methods after the profile's latency"""
+
+    daemon_threads = True
+    name = None
+    routes = ()  # (method, path regex, handler method name)
+
+    def __init__(self, profile=None, host='127.0.0.1', port=0, seed=0):
+        super().__init__((host, port), _Handler)
+        self.profile = profile or Profile()
+        self._rng = random.Random(f"{self.name}:{seed}")
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'requests': 0, 'errors': 0, 'not_found': 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=f"stand-in-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def route(self, method, path):
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path) if route_method == method else None
+            if match:
+                return getattr(self, handler), match
+        return None, None
+
+    def draw(self):
+        """Latency for the next request and whether it fails"""
+        with self._lock:
+            return self.profile.latency.sample(self._rng), self._rng.random() < self.profile.error_rate
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (timeouts, cancelled streams) are expected under load
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class ElevenLabsStandIn(StandInServer):
+    """POST /v1/text-to-dialogue and /v1/text-to-speech/<voice_id>, returning fake MP3s"""
+
+    name = 'elevenlabs'
+    routes = (
+        ('POST', re.compile(r'/v1/text-to-dialogue(/stream)?'), 'text_to_dialogue'),
+        ('POST', re.compile(r'/v1/text-to-speech/(?P<voice_id>[^/]+)(/stream)?'), 'text_to_speech'),
+    )
+
+    def text_to_dialogue(self, handler, match, query, body):
+        payload = json.loads(body or b'{}')
+        text = ' '.join(item.get('text', '') for item in payload.get('inputs', []))
+        self._send_audio(handler, body, text, query)
+
+    def text_to_speech(self, handler, match, query, body):
+        payload = json.loads(body or b'{}')
+        self._send_audio(handler, match.group('voice_id').encode('utf-8') + body, payload.get('text', ''), query)
+
+    def _send_audio(self, handler, seed, text, query):
+        output_format = query.get('output_format', ['mp3_44100_128'])[0]
+        try:
+            data = fake_mp3(hashlib.sha256(seed).digest(), max(1.0, len(text) / CHARS_PER_SECOND), output_format)
+        except ValueError as e:
+            handler.send_json(422, {'detail': str(e)})
+            return
+        handler.send_bytes(200, data, 'audio/mpeg')
+
+
+class GeminiStandIn(StandInServer):
+    """
+    POST /<version>/models/<model>:generateContent and :streamGenerateContent
+
+    Answers with a story in the JSON shape SYSTEM_INSTRUCTION asks for,
+    derived from the prompt. The profile's latency is the time to the
+    first chunk; streamed chunks then follow chunk_interval apart.
+    """
+
+    name = 'gemini'
+    routes = (
+        ('POST', re.compile(r'/[^/]+/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)'),
+         'generate'),
+    )
+
+    def __init__(self, profile=None, segments=10, words_per_segment=40, chunk_chars=80, chunk_interval=0.02,
+                 **kwargs):
+        super().__init__(profile, **kwargs)
+        self.segments = segments
+        self.words_per_segment = words_per_segment
+        self.chunk_chars = chunk_chars
+        self.chunk_interval = chunk_interval
+
+    def story_for(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        rng = random.Random(digest)
+        segments = []
+        for _ in range(self.segments):
+            words = ' '.join(rng.choice(STORY_WORDS) for _ in range(self.words_per_segment))
+            segments.append({'text': words.capitalize() + '.', 'emotion': rng.choice(STORY_EMOTIONS)})
+        return {'title': f"Bench Story {digest.hex()[:6]}", 'segments': segments}
+
+    def generate(self, handler, match, query, body):
+        payload = json.loads(body or b'{}')
+        prompt = ' '.join(part.get('text', '')
+                          for content in payload.get('contents', [])
+                          for part in content.get('parts', []))
+        text = json.dumps(self.story_for(prompt), indent=2)
+        model = match.group('model')
+
+        if match.group('method') == 'generateContent':
+            handler.send_json(200, _gemini_response(text, model, finished=True))
+            return
+
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        events = (
+            f"data: {json.dumps(_gemini_response(piece, model, finished=i == len(pieces) - 1))}\r\n\r\n".encode('utf-8')
+            for i, piece in enumerate(pieces)
+        )
+        handler.send_chunked('text/event-stream', events, self.chunk_interval)
+
+
+def _gemini_response(text, model, finished):
+    candidate = {'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}
+    if finished:
+        candidate['finishReason'] = 'STOP'
+    return {'candidates': [candidate], 'modelVersion': model}
+
+
+class GoveeStandIn(StandInServer):
+    """POST /router/api/v1/device/control, acknowledging every capability"""
+
+    name = 'govee'
+    routes = (('POST', re.compile(r'/router/api/v1/device/control'), 'control'),)
+
+    def control(self, handler, match, query, body):
+        payload = json.loads(body or b'{}')
+        capability = payload.get('payload', {}).get('capability', {})
+        handler.send_json(200, {
+            'requestId': payload.get('requestId'),
+            'msg': 'success',
+            'code': 200,
+            'capability': {**capability, 'state': {'status': 'success'}}
+        })
+
+
+S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+MIN_PART_SIZE = 5 * 1024 * 1024  # Every part but the last
+
+
+class S3StandIn(StandInServer):
+    """
+    Path-style S3 for one bucket, held in memory
+
+    Objects: PUT, GET (with a single Range), HEAD and DELETE, plus
+    multipart uploads (POST ?uploads, PUT ?partNumber&uploadId, POST and
+    DELETE ?uploadId) with S3's 5 MiB minimum part size. Bucket: GET
+    ?list-type=2 (ListObjectsV2, at most page_size keys per page) and
+    POST ?delete (DeleteObjects, which requires Content-MD5). Requests
+    must carry a valid SigV4 signature for the configured keys, in the
+    Authorization header or as a presigned query string.
+    delete_error_rate is the share of keys a DeleteObjects call reports
+    as failed and leaves in place.
+    """
+
+    name = 's3'
+    routes = (
+        ('GET', re.compile(r'/(?P<bucket>[^/]+)/?'), 'bucket_get'),
+        ('POST', re.compile(r'/(?P<bucket>[^/]+)/?'), 'bucket_post'),
+        *((method, re.compile(r'/(?P<bucket>[^/]+)/(?P<key>.+)'), 'object')
+          for method in ('GET', 'HEAD', 'PUT', 'DELETE', 'POST')),
+    )
+
+    def __init__(self, profile=None, bucket='bench-audio', access_key='bench', secret_key='bench-secret',
+                 page_size=1000, delete_error_rate=0.0, **kwargs):
+        super().__init__(profile, **kwargs)
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.page_size = page_size
+        self.delete_error_rate = delete_error_rate
+        self.objects = {}  # key -> (data, content type, modified timestamp, etag)
+        self.uploads = {}  # upload id -> {'key', 'content_type', 'parts': {number: (data, etag)}}
+        self.stats.update({'auth_failures': 0, 'puts': 0, 'deleted': 0, 'delete_errors': 0,
+                           'multipart_uploads': 0, 'parts': 0, 'aborted_uploads': 0})
+
+    def bucket_get(self, handler, match, query, body):
+        if not self._authorized(handler, match, query, body):
+            return
+        if query.get('list-type') != ['2']:
+            self._send_error(handler, 501, 'NotImplemented', 'Only ListObjectsV2 is supported')
+            return
+
+        prefix = query.get('prefix', [''])[0]
+        token = query.get('continuation-token', [''])[0]
+        after = base64.urlsafe_b64decode(token).decode('utf-8') if token else ''
+        max_keys = min(int(query.get('max-keys', ['1000'])[0]), self.page_size)
+        with self._lock:
+            keys = sorted(key for key in self.objects if key.startswith(prefix) and key > after)
+            page = [(key, self.objects[key]) for key in keys[:max_keys]]
+        truncated = len(keys) > max_keys
+
+        contents = ''.join(
+            f"<Contents><Key>{escape(key)}</Key><LastModified>{_iso_time(modified)}</LastModified>"
+            f"<ETag>&quot;{etag}&quot;</ETag><Size>{len(data)}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+            for key, (data, _, modified, etag) in page
+        )
+        next_token = ''
+        if truncated:
+            next_token = ('<NextContinuationToken>' +
+                          base64.urlsafe_b64encode(page[-1][0].encode('utf-8')).decode('ascii') +
+                          '</NextContinuationToken>')
+        self._send_xml(handler, 200,
+                       f'<ListBucketResult xmlns="{S3_XMLNS}"><Name>{escape(self.bucket)}</Name>'
+                       f'<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>'
+                       f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>'
+                       f'{next_token}{contents}</ListBucketResult>')
+
+    def bucket_post(self, handler, match, query, body):
+        if not self._authorized(handler, match, query, body):
+            return
+        if 'delete' not in query:
+            self._send_error(handler, 501, 'NotImplemented', 'Only DeleteObjects is supported')
+            return
+        md5 = handler.headers.get('Content-MD5')
+        if not md5:
+            self._send_error(handler, 400, 'MissingContentMD5', 'Missing required header for this request: Content-MD5')
+            return
+        if md5 != base64.b64encode(hashlib.md5(body).digest()).decode('ascii'):
+            self._send_error(handler, 400, 'InvalidDigest', 'The Content-MD5 you specified was invalid')
+            return
+        try:
+            request = ET.fromstring(body)
+        except ET.ParseError:
+            self._send_error(handler, 400, 'MalformedXML', 'The XML you provided was not well-formed')
+            return
+
+        # Clients may or may not namespace the request body
+        def children(element, tag):
+            return [child for child in element if child.tag.rsplit('}', 1)[-1] == tag]
+
+        keys = [child.text or '' for item in children(request, 'Object') for child in children(item, 'Key')]
+        quiet = any((child.text or '').strip() == 'true' for child in children(request, 'Quiet'))
+        if not keys or len(keys) > 1000:
+            self._send_error(handler, 400, 'MalformedXML', 'Between 1 and 1000 keys are required')
+            return
+
+        results = []
+        with self._lock:
+            for key in keys:
+                if self._rng.random() < self.delete_error_rate:
+                    self.stats['delete_errors'] += 1
+                    results.append(f"<Error><Key>{escape(key)}</Key><Code>InternalError</Code>"
+                                   f"<Message>We encountered an internal error. Please try again.</Message></Error>")
+                    continue
+                # Deleting a missing key succeeds, as in S3
+                if self.objects.pop(key, None) is not None:
+                    self.stats['deleted'] += 1
+                if not quiet:
+                    results.append(f"<Deleted><Key>{escape(key)}</Key></Deleted>")
+        self._send_xml(handler, 200, f'<DeleteResult xmlns="{S3_XMLNS}">{"".join(results)}</DeleteResult>')
+
+    def object(self, handler, match, query, body):
+        if not self._authorized(handler, match, query, body):
+            return
+        key = unquote(match.group('key'))
+        method = handler.command
+        if 'uploads' in query or 'uploadId' in query:
+            self._multipart(handler, key, query, body)
+            return
+
+        if method == 'PUT':
+            etag = hashlib.md5(body).hexdigest()
+            with self._lock:
+                self.objects[key] = (body, handler.headers.get('Content-Type', 'binary/octet-stream'), time.time(), etag)
+                self.stats['puts'] += 1
+            handler.send_bytes(200, b'', 'application/xml', {'ETag': f'"{etag}"'})
+            return
+
+        if method == 'DELETE':
+            with self._lock:
+                if self.objects.pop(key, None) is not None:
+                    self.stats['deleted'] += 1
+            handler.send_bytes(204, b'', 'application/xml')
+            return
+
+        with self._lock:
+            stored = self.objects.get(key)
+        if stored is None:
+            self._send_error(handler, 404, 'NoSuchKey', 'The specified key does not exist.')
+            return
+        data, content_type, modified, etag = stored
+        headers = {'ETag': f'"{etag}"', 'Last-Modified': formatdate(modified, usegmt=True), 'Accept-Ranges': 'bytes'}
+
+        status = 200
+        byte_range = re.fullmatch(r'bytes=(\d*)-(\d*)', handler.headers.get('Range', ''))
+        if byte_range and any(byte_range.groups()):
+            first, last = byte_range.groups()
+            if first:
+                start, end = int(first), min(int(last), len(data) - 1) if last else len(data) - 1
+            else:
+                start, end = max(0, len(data) - int(last)), len(data) - 1
+            if start >= len(data) or start > end:
+                self._send_error(handler, 416, 'InvalidRange', 'The requested range is not satisfiable')
+                return
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            data, status = data[start:end + 1], 206
+        handler.send_bytes(status, data, content_type, headers)
+
+    def _multipart(self, handler, key, query, body):
+        method = handler.command
+        if method == 'POST' and 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with self._lock:
+                self.uploads[upload_id] = {'key': key, 'parts': {},
+                                           'content_type': handler.headers.get('Content-Type', 'binary/octet-stream')}
+            self._send_xml(handler, 200,
+                           f'<InitiateMultipartUploadResult xmlns="{S3_XMLNS}"><Bucket>{escape(self.bucket)}</Bucket>'
+                           f'<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+            return
+
+        upload_id = query.get('uploadId', [''])[0]
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None or upload['key'] != key:
+            self._send_error(handler, 404, 'NoSuchUpload', 'The specified upload does not exist.')
+            return
+
+        if method == 'PUT':
+            number = int(query.get('partNumber', ['0'])[0])
+            if not 1 <= number <= 10000:
+                self._send_error(handler, 400, 'InvalidArgument', 'Part number must be between 1 and 10000')
+                return
+            etag = hashlib.md5(body).hexdigest()
+            with self._lock:
+                upload['parts'][number] = (body, etag)
+                self.stats['parts'] += 1
+            handler.send_bytes(200, b'', 'application/xml', {'ETag': f'"{etag}"'})
+            return
+
+        if method == 'DELETE':
+            with self._lock:
+                self.uploads.pop(upload_id, None)
+                self.stats['aborted_uploads'] += 1
+            handler.send_bytes(204, b'', 'application/xml')
+            return
+
+        if method != 'POST':
+            self._send_error(handler, 405, 'MethodNotAllowed', 'The specified method is not allowed')
+            return
+        try:
+            listed = [(int(part.findtext(f'{{{S3_XMLNS}}}PartNumber') or part.findtext('PartNumber')),
+                       part.findtext(f'{{{S3_XMLNS}}}ETag') or part.findtext('ETag'))
+                      for part in ET.fromstring(body) if part.tag.rsplit('}', 1)[-1] == 'Part']
+        except (ET.ParseError, TypeError, ValueError):
+            self._send_error(handler, 400, 'MalformedXML', 'The XML you provided was not well-formed')
+            return
+        numbers = [number for number, _ in listed]
+        if not listed or numbers != sorted(set(numbers)):
+            self._send_error(handler, 400, 'InvalidPartOrder', 'The list of parts was not in ascending order.')
+            return
+        parts = upload['parts']
+        if any(number not in parts or etag.strip('"') != parts[number][1] for number, etag in listed):
+            self._send_error(handler, 400, 'InvalidPart', 'One or more of the specified parts could not be found.')
+            return
+        if any(len(parts[number][0]) < MIN_PART_SIZE for number in numbers[:-1]):
+            self._send_error(handler, 400, 'EntityTooSmall', 'Your proposed upload is smaller than the minimum allowed')
+            return
+
+        data = b''.join(parts[number][0] for number in numbers)
+        etag = hashlib.md5(b''.join(bytes.fromhex(parts[number][1]) for number in numbers)).hexdigest()
+        etag = f"{etag}-{len(numbers)}"
+        with self._lock:
+            self.uploads.pop(upload_id, None)
+            self.objects[key] = (data, upload['content_type'], time.time(), etag)
+            self.stats['multipart_uploads'] += 1
+        self._send_xml(handler, 200,
+                       f'<CompleteMultipartUploadResult xmlns="{S3_XMLNS}"><Bucket>{escape(self.bucket)}</Bucket>'
+                       f'<Key>{escape(key)}</Key><ETag>&quot;{etag}&quot;</ETag></CompleteMultipartUploadResult>')
+
+    def _authorized(self, handler, match, query, body):
+        """Check the bucket and SigV4 signature, answering with an S3 error if either is wrong"""
+        if match.group('bucket') != self.bucket:
+            self._send_error(handler, 404, 'NoSuchBucket', 'The specified bucket does not exist')
+            return False
+        error = self._signature_error(handler, query, body)
+        if error:
+            self.count('auth_failures')
+            self._send_error(handler, 403, *error)
+            return False
+        return True
+
+    def _signature_error(self, handler, query, body):
+        """(code, message) if the request is not signed correctly, otherwise None"""
+        params = {name: values[0] for name, values in query.items()}
+        if 'X-Amz-Signature' in params:
+            try:
+                credential = params['X-Amz-Credential']
+                amz_date = params['X-Amz-Date']
+                signed_names = params['X-Amz-SignedHeaders'].split(';')
+                expires = int(params['X-Amz-Expires'])
+            except (KeyError, ValueError):
+                return 'AuthorizationQueryParametersError', 'Missing or invalid presigned query parameters'
+            signature = params.pop('X-Amz-Signature')
+            payload_hash = 'UNSIGNED-PAYLOAD'
+            if time.time() > _amz_timestamp(amz_date) + expires:
+                return 'AccessDenied', 'Request has expired'
+        else:
+            authorization = re.fullmatch(
+                r'AWS4-HMAC-SHA256 Credential=(\S+), SignedHeaders=(\S+), Signature=([0-9a-f]+)',
+                handler.headers.get('Authorization', ''))
+            if not authorization:
+                return 'AccessDenied', 'Missing or malformed Authorization header'
+            credential, signed_names, signature = authorization.groups()
+            signed_names = signed_names.split(';')
+            amz_date = handler.headers.get('x-amz-date', '')
+            payload_hash = handler.headers.get('x-amz-content-sha256', '')
+            if payload_hash != 'UNSIGNED-PAYLOAD' and payload_hash != hashlib.sha256(body).hexdigest():
+                return 'XAmzContentSHA256Mismatch', 'The provided x-amz-content-sha256 header does not match'
+
+        parts = credential.split('/')
+        if len(parts) != 5 or parts[0] != self.access_key:
+            return 'InvalidAccessKeyId', 'The AWS Access Key Id you provided does not exist in our records.'
+        if parts[1] != amz_date[:8] or parts[3:] != ['s3', 'aws4_request']:
+            return 'AuthorizationHeaderMalformed', 'Credential scope does not match the request date'
+        if 'host' not in signed_names:
+            return 'AccessDenied', 'The host header must be signed'
+
+        canonical_request = '\n'.join([
+            handler.command,
+            quote(unquote(urlsplit(handler.path).path), safe='/-_.~'),
+            '&'.join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(params.items())),
+            ''.join(f"{name}:{(handler.headers.get(name) or '').strip()}\n" for name in signed_names),
+            ';'.join(signed_names),
+            payload_hash
+        ])
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, '/'.join(parts[1:]),
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in parts[1:]:
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        expected = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return 'SignatureDoesNotMatch', 'The request signature we calculated does not match the signature you provided.'
+        return None
+
+    def _send_xml(self, handler, status, body):
+        handler.send_bytes(status, ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode('utf-8'),
+                           'application/xml')
+
+    def _send_error(self, handler, status, code, message):
+        self._send_xml(handler, status, f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>")
+
+
+def _iso_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _amz_timestamp(amz_date):
+    return datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc).timestamp()
+
+
+def add_arguments(parser):
+    """Stand-in options shared by this script and the harness"""
+    group = parser.add_argument_group('stand-ins')
+    group.add_argument('--elevenlabs-latency', default='lognormal:1.0:0.35', help='Latency spec per synthesis')
+    group.add_argument('--elevenlabs-errors', type=float, default=0.0, help='Share of syntheses that fail')
+    group.add_argument('--gemini-latency', default='lognormal:1.5:0.3', help='Latency spec to the first chunk')
+    group.add_argument('--gemini-errors', type=float, default=0.0, help='Share of generations that fail')
+    group.add_argument('--govee-latency', default='lognormal:0.15:0.3', help='Latency spec per control call')
+    group.add_argument('--govee-errors', type=float, default=0.0, help='Share of control calls that fail')
+    group.add_argument('--s3-latency', default='lognormal:0.03:0.5', help='Latency spec per S3 request')
+    group.add_argument('--s3-errors', type=float, default=0.0, help='Share of S3 requests that fail')
+    group.add_argument('--s3-page-size', type=int, default=1000, help='Most keys per S3 listing page')
+    group.add_argument('--s3-delete-errors', type=float, default=0.0,
+                       help='Share of keys a multi-object delete reports as failed')
+    group.add_argument('--error-status', type=int, default=503, help='HTTP status of injected failures')
+    group.add_argument('--story-segments', type=int, default=10, help='Segments per generated story')
+    group.add_argument('--gemini-chunk-interval', type=float, default=0.02, help='Seconds between streamed chunks')
+    group.add_argument('--seed', type=int, default=0, help='Seed for latencies, failures and content')
+
+
+def start_stand_ins(args, port=0):
+    """
+    Start all four stand-ins from parsed add_arguments() options
+
+    They listen on port to port + 3, or on free ports when port is 0.
+    """
+    def profile(latency, errors):
+        return Profile(latency, errors, args.error_status)
+
+    def port_for(offset):
+        return port + offset if port else 0
+
+    servers = {
+        'elevenlabs': ElevenLabsStandIn(profile(args.elevenlabs_latency, args.elevenlabs_errors),
+                                        port=port_for(0), seed=args.seed),
+        'gemini': GeminiStandIn(profile(args.gemini_latency, args.gemini_errors), segments=args.story_segments,
+                                chunk_interval=args.gemini_chunk_interval, port=port_for(1), seed=args.seed),
+        'govee': GoveeStandIn(profile(args.govee_latency, args.govee_errors), port=port_for(2), seed=args.seed),
+        's3': S3StandIn(profile(args.s3_latency, args.s3_errors), page_size=args.s3_page_size,
+                        delete_error_rate=args.s3_delete_errors, port=port_for(3), seed=args.seed),
+    }
+    for server in servers.values():
+        server.start()
+    return servers
+
+
+def backend_environment(servers):
+    """
+    Environment variables that point the backend at the stand-ins
+
+    The S3 settings only take effect with AUDIO_STORAGE=s3.
+    """
+    s3 = servers['s3']
+    return {
+        'ELEVENLABS_API_BASE': servers['elevenlabs'].url,
+        'ELEVENLABS_API_KEY': 'bench',
+        'GEMINI_API_BASE': servers['gemini'].url,
+        'GEMINI_API_KEY': 'bench',
+        'GOVEE_API_URL': f"{servers['govee'].url}/router/api/v1/device/control",
+        'GOVEE_API_KEY': 'bench',
+        'GOVEE_DEVICE_ID': 'bench-device',
+        'GOVEE_DEVICE_SKU': 'H6000',
+        'AUDIO_S3_ENDPOINT': s3.url,
+        'AUDIO_S3_BUCKET': s3.bucket,
+        'AWS_ACCESS_KEY_ID': s3.access_key,
+        'AWS_SECRET_ACCESS_KEY': s3.secret_key,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for ElevenLabs, Gemini, Govee and S3")
+    parser.add_argument("--port", type=int, default=8701,
+                        help="ElevenLabs port; Gemini, Govee and S3 use the next three (0 picks free ports)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    servers = start_stand_ins(args, port=args.port)
+    print("✓ Stand-ins running. Start the backend with:\n")
+    for name, value in backend_environment(servers).items():
+        print(f"export {name}={value}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print()
+        for name, server in servers.items():
+            print(f"  {name}: {server.stats}")
+            server.stop()
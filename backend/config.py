@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from utils.db_engine import engine_options
 
 load_dotenv()
 
@@ -16,10 +17,18 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # WAL, busy timeout and a sized pool for concurrent request/job threads
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
     # API Keys
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
     
     # Storage
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
-
+    
+    # Let a fronting nginx/Apache deliver files via X-Sendfile
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', '0') == '1'
+    
+    # Background story generation
+    STORY_JOB_WORKERS = int(os.getenv('STORY_JOB_WORKERS', '2'))
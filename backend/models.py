@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 import uuid
 
@@ -15,11 +16,28 @@ class Story(db.Model):
     segments = db.Column(db.JSON, nullable=False)  # Gemini segments: [{"text": "...", "emotion": "sad"}]
     audio_segments = db.Column(db.JSON)  # Audio file metadata: [{"segment_index": 0, "text": "...", "emotion": "sad", "audio_file": "path", "duration": 5.2}]
     voice_id = db.Column(db.String(100), default="jTk8bSDoiLDLZqAVYKKr")  # ElevenLabs voice ID
+    audio_file = db.Column(db.String(500))  # Concatenated story MP3 filename
+    audio_etag = db.Column(db.String(64))  # sha256 of the concatenated file
+    emotion_summary = db.Column(db.JSON)  # {"segment_count": 10, "audio_count": 10, "total_duration": 312.4, "sequence": ["sad", ...], "emotions": {"sad": {"count": 3, "duration": 92.1}}}
+    audio_offsets = db.Column(db.JSON)  # [{"segment_index": 0, "byte_start": 0, "byte_end": 81234, "start_time": 0.0, "duration": 5.2}]
+    audio_variants = db.Column(db.JSON)  # Concatenated file per bitrate variant: {"mobile": {"filename": "...", "size": 81234, "etag": "...", "offsets": [...]}}
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped on every update; feeds ETags
     processed_at = db.Column(db.DateTime)  # When audio processing completed
     
-    # Relationships
-    audio_files = db.relationship('AudioAsset', backref='story', lazy=True, cascade='all, delete-orphan')
+    # Relationships (routes that need assets opt in with selectinload)
+    audio_files = db.relationship('AudioAsset', backref='story', lazy=True, cascade='all, delete-orphan',
+                                  order_by='AudioAsset.segment_index')
+    
+    __table_args__ = (
+        db.Index('ix_stories_created_at_id', 'created_at', 'id'),  # Keyset pagination
+        db.Index('ix_stories_audio_file', 'audio_file'),
+    )
+
+@event.listens_for(Story, 'before_update')
+def _bump_story_version(mapper, connection, target):
+    target.version = (target.version or 0) + 1
 
 class AudioAsset(db.Model):
     __tablename__ = 'audio_assets'
@@ -31,4 +49,73 @@ class AudioAsset(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     emotion = db.Column(db.String(50))
     duration = db.Column(db.Float)  # Duration in seconds
+    size = db.Column(db.Integer)  # File size in bytes
+    etag = db.Column(db.String(64))  # sha256 of the file, computed when it was written
+    seek_table = db.Column(db.JSON)  # {"interval": 1.0, "offsets": [byte offset of each interval]}
+    variants = db.Column(db.JSON)  # Lower-bitrate encodings: {"mobile": {"filename": "...", "size": 20480, "etag": "...", "duration": 5.2, "output_format": "mp3_22050_32"}}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_audio_assets_story_segment', 'story_id', 'segment_index'),  # Also serves story_id lookups
+        db.Index('ix_audio_assets_filename', 'filename'),
+    )
+
+class StoryJob(db.Model):
+    __tablename__ = 'story_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(20), nullable=False)  # "prompt" (Gemini + audio), "segments" (audio only) or "edit" (changed segments only)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    stage = db.Column(db.String(50), nullable=False, default='queued')  # queued, generating_story, synthesizing_audio, concatenating_audio, saving, done
+    payload = db.Column(db.JSON, nullable=False)  # Original request body
+    progress = db.Column(db.JSON)  # {"total": 12, "completed": 3, "failed": 0, "segments": [{"segment_index": 0, "status": "done"}]}
+    story_id = db.Column(db.Integer, db.ForeignKey('stories.id', ondelete='SET NULL'))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_story_jobs_status_created_at', 'status', 'created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'story_id': self.story_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class LightDevice(db.Model):
+    __tablename__ = 'light_devices'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    sku = db.Column(db.String(50), nullable=False)  # Govee model, e.g. H6159
+    device_id = db.Column(db.String(100), nullable=False)  # Govee device MAC-style id
+    group_name = db.Column(db.String(100), nullable=False, default='default')  # Room or zone the device belongs to
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('sku', 'device_id', name='uq_light_devices_sku_device'),
+        db.Index('ix_light_devices_group_name', 'group_name'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'sku': self.sku,
+            'device_id': self.device_id,
+            'group': self.group_name,
+            'enabled': self.enabled,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
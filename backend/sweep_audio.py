@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Reclaim story audio that no story or AudioAsset row references
+
+Lists the audio store, skips files the database points at, files
+younger than the grace period and files of stories with a job still in
+progress, and deletes the rest in batches. The server runs the same
+sweep every AUDIO_SWEEP_INTERVAL seconds.
+
+Usage:
+    python sweep_audio.py [--dry-run] [--grace 3600]
+"""
+import argparse
+
+from app import create_app
+from utils.audio_reclaimer import AUDIO_SWEEP_GRACE, audio_reclaimer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete orphaned story audio files")
+    parser.add_argument("--dry-run", action="store_true", help="Report orphans without deleting them")
+    parser.add_argument("--grace", type=int, default=AUDIO_SWEEP_GRACE,
+                        help="Ignore files modified within this many seconds")
+    args = parser.parse_args()
+
+    app = create_app(start_background=False)
+    with app.app_context():
+        audio_reclaimer.sweep(grace_seconds=args.grace, dry_run=args.dry_run)
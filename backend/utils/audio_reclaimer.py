@@ -0,0 +1,191 @@
+"""
+Background reclamation of story audio
+
+Deleting or editing a story commits the database change first and then
+hands the files it no longer needs to the reclaimer, which unlinks them
+in batches on its own thread, so request latency does not depend on
+how many files a story has. Files that fail to delete (or were never
+recorded, e.g. from an interrupted job) are found by a periodic sweep
+that reconciles the audio store against the database.
+"""
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+from dotenv import load_dotenv
+
+from models import db, AudioAsset, Story, StoryJob
+from utils.audio_storage import get_audio_storage
+
+load_dotenv()
+
+AUDIO_RECLAIM_BATCH = int(os.getenv('AUDIO_RECLAIM_BATCH', '200'))
+# Seconds between orphan sweeps; 0 disables the periodic sweep
+AUDIO_SWEEP_INTERVAL = int(os.getenv('AUDIO_SWEEP_INTERVAL', str(6 * 3600)))
+# Unreferenced files younger than this may belong to a job that has not saved yet
+AUDIO_SWEEP_GRACE = int(os.getenv('AUDIO_SWEEP_GRACE', '3600'))
+
+# Only files the story pipeline writes are ever swept
+STORY_AUDIO_NAME = re.compile(r'^(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_(segment|story)_')
+
+
+def referenced_audio_names():
+    """Every audio filename the database still points at"""
+    names = set()
+    for filename, variants in db.session.query(AudioAsset.filename, AudioAsset.variants).yield_per(1000):
+        names.add(filename)
+        names.update(variant['filename'] for variant in (variants or {}).values())
+    for audio_file, variants in (db.session.query(Story.audio_file, Story.audio_variants)
+                                 .filter(Story.audio_file.isnot(None)).yield_per(1000)):
+        names.add(audio_file)
+        names.update(variant['filename'] for variant in (variants or {}).values())
+    return names
+
+
+def active_story_uuids():
+    """Stories with a queued or running job, whose files may not be recorded yet"""
+    rows = (db.session.query(Story.uuid)
+            .join(StoryJob, StoryJob.story_id == Story.id)
+            .filter(StoryJob.status.in_(['queued', 'running'])))
+    return {row.uuid for row in rows}
+
+
+class AudioReclaimer:
+    """Batched background deletion of audio files plus the orphan sweeper"""
+
+    def __init__(self):
+        self.app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._sweeper = None
+        self._lock = threading.Lock()
+        self.stats = {'queued': 0, 'deleted': 0, 'bytes_freed': 0, 'missing': 0, 'failed': 0, 'last_sweep': None}
+
+    def init_app(self, app, start_sweeper=True):
+        self.app = app
+        app.extensions['audio_reclaimer'] = self
+        if start_sweeper and AUDIO_SWEEP_INTERVAL > 0 and self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="audio-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def reclaim(self, names):
+        """Queue files for deletion; returns immediately"""
+        names = [name for name in names if name]
+        if not names:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="audio-reclaimer", daemon=True)
+                self._thread.start()
+            self.stats['queued'] += len(names)
+        for name in names:
+            self._queue.put(name)
+
+    def pending(self):
+        """Number of files waiting to be deleted"""
+        return self._queue.qsize()
+
+    def drain(self):
+        """Block until every queued file has been handled"""
+        self._queue.join()
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < AUDIO_RECLAIM_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._delete_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _delete_batch(self, names):
+        try:
+            freed = get_audio_storage().delete_many(names)
+        except Exception as e:
+            # Left in the store; the next sweep finds them again
+            print(f"  ✗ Could not delete {len(names)} audio files: {e}")
+            with self._lock:
+                self.stats['failed'] += len(names)
+            return
+
+        with self._lock:
+            self.stats['deleted'] += len(freed)
+            self.stats['bytes_freed'] += sum(size for size in freed.values() if size)
+            self.stats['missing'] += len(names) - len(freed)
+
+    def sweep(self, grace_seconds=AUDIO_SWEEP_GRACE, dry_run=False):
+        """
+        Delete story audio that nothing in the database references
+
+        Must be called inside an app context.
+
+        Returns:
+            Dict with 'scanned', 'orphans', 'orphan_bytes', 'deleted',
+            'bytes_freed', 'partials' and 'seconds'
+        """
+        started = time.time()
+        storage = get_audio_storage()
+        cutoff = started - grace_seconds
+        # Snapshot references before listing: anything written later is inside the grace period
+        referenced = referenced_audio_names()
+        active = active_story_uuids()
+        # Don't hold a read transaction open while listing the store
+        db.session.remove()
+
+        report = {'scanned': 0, 'orphans': 0, 'orphan_bytes': 0, 'deleted': 0, 'bytes_freed': 0, 'partials': 0}
+        batch = {}
+
+        def flush():
+            freed = storage.delete_many(batch) if not dry_run else {}
+            report['deleted'] += len(freed)
+            # S3 does not report sizes, so fall back to the listed ones
+            report['bytes_freed'] += sum(batch[name] for name in freed)
+            batch.clear()
+
+        for name, size, modified in storage.iter_files():
+            report['scanned'] += 1
+            match = STORY_AUDIO_NAME.match(name)
+            if not match or name in referenced or modified >= cutoff or match.group('uuid') in active:
+                continue
+            report['orphans'] += 1
+            report['orphan_bytes'] += size
+            batch[name] = size
+            if len(batch) >= AUDIO_RECLAIM_BATCH:
+                flush()
+        if batch:
+            flush()
+
+        if not dry_run:
+            partials, partial_bytes = storage.remove_stale_partials(cutoff)
+            report['partials'] = partials
+            report['bytes_freed'] += partial_bytes
+
+        report['seconds'] = round(time.time() - started, 2)
+        with self._lock:
+            self.stats['last_sweep'] = {**report, 'finished_at': time.time(), 'dry_run': dry_run}
+        print(f"🧹 Audio sweep: {report['scanned']} files scanned, {report['orphans']} orphaned "
+              f"({report['orphan_bytes'] / 1e6:.1f} MB), {report['deleted']} deleted, "
+              f"{report['bytes_freed'] / 1e6:.1f} MB reclaimed in {report['seconds']}s")
+        return report
+
+    def _sweep_loop(self):
+        # First sweep shortly after startup, then on the interval
+        time.sleep(min(300, AUDIO_SWEEP_INTERVAL))
+        while True:
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                print(f"❌ Audio sweep failed: {e}")
+                traceback.print_exc()
+            time.sleep(AUDIO_SWEEP_INTERVAL)
+
+
+audio_reclaimer = AudioReclaimer()
@@ -0,0 +1,457 @@
+"""
+Storage for generated story audio
+
+Every audio file is addressed by its filename. The local backend shards
+files into <root>/ab/cd/<filename> directories from a hash of the name,
+so no directory grows past a few entries, and writes are atomic (temp
+file + rename). The S3 backend talks to any S3-compatible endpoint (AWS,
+MinIO, a local stand-in) with SigV4-signed requests over the shared HTTP
+client, and serves objects through presigned URLs.
+
+AUDIO_STORAGE selects the backend: "local" (default) or "s3".
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape
+
+import requests
+from dotenv import load_dotenv
+
+from utils import http_client
+from utils.tts_stream import tee_to_file
+
+load_dotenv()
+
+AUDIO_STORAGE = os.getenv('AUDIO_STORAGE', 'local').lower()
+AUDIO_STORAGE_DIR = os.getenv('AUDIO_STORAGE_DIR') or str(Path(__file__).resolve().parent.parent / 'audio_files')
+AUDIO_STORAGE_SHARD_DEPTH = int(os.getenv('AUDIO_STORAGE_SHARD_DEPTH', '2'))
+
+AUDIO_S3_BUCKET = os.getenv('AUDIO_S3_BUCKET', '')
+AUDIO_S3_REGION = os.getenv('AUDIO_S3_REGION', 'us-east-1')
+AUDIO_S3_ENDPOINT = os.getenv('AUDIO_S3_ENDPOINT') or f'https://s3.{AUDIO_S3_REGION}.amazonaws.com'
+AUDIO_S3_PREFIX = os.getenv('AUDIO_S3_PREFIX', 'audio/')
+# Presigned URLs are identical within one window so browsers can cache the object
+AUDIO_S3_URL_WINDOW = int(os.getenv('AUDIO_S3_URL_WINDOW', '3600'))
+# Larger objects are uploaded in parts of this size (S3's minimum is 5 MiB), bounding memory per upload
+AUDIO_S3_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv('AUDIO_S3_PART_SIZE', str(8 * 1024 * 1024))))
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+S3_XMLNS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+def _shard(name, depth):
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return [digest[i * 2:i * 2 + 2] for i in range(depth)]
+
+
+def _check_name(name):
+    if not name or '/' in name or '\\' in name or name.startswith('.'):
+        raise ValueError(f"Invalid audio file name: {name!r}")
+
+
+class LocalAudioStorage:
+    """Hash-sharded directory tree on the local filesystem"""
+
+    def __init__(self, root=AUDIO_STORAGE_DIR, shard_depth=AUDIO_STORAGE_SHARD_DEPTH):
+        self.root = Path(root)
+        self.shard_depth = shard_depth
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def shard_path(self, name):
+        _check_name(name)
+        return self.root.joinpath(*_shard(name, self.shard_depth), name)
+
+    def local_path(self, name):
+        """Path of a stored file; files from the old flat layout are still found"""
+        path = self.shard_path(name)
+        if not path.is_file():
+            legacy = self.root / name
+            if legacy.is_file():
+                return legacy
+        return path
+
+    def location(self, name):
+        return str(self.shard_path(name))
+
+    def write_stream(self, name, chunks, on_commit=None):
+        """
+        Yield chunks while writing them to name; the file appears
+        atomically once the source is exhausted, then
+        on_commit(location, size, sha256_hex) is called
+        """
+        def committed(path, size, digest):
+            if on_commit:
+                on_commit(str(path), size, digest)
+
+        return tee_to_file(chunks, self.shard_path(name), on_commit=committed)
+
+    def write_bytes(self, name, data):
+        """Store data under name; returns {'location', 'size', 'content_hash'}"""
+        written = {}
+        for _ in self.write_stream(name, [data], lambda location, size, digest: written.update(
+                location=location, size=size, content_hash=digest)):
+            pass
+        return written
+
+    def read_bytes(self, name):
+        with open(self.local_path(name), 'rb') as f:
+            return f.read()
+
+    def exists(self, name):
+        try:
+            return self.local_path(name).is_file()
+        except ValueError:
+            return False
+
+    def delete(self, name):
+        """Remove a stored file; returns False if it was already gone"""
+        try:
+            os.remove(self.local_path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete_many(self, names):
+        """
+        Remove several files
+
+        Returns:
+            {name: bytes freed} for the files that were removed; names
+            that were already gone are left out
+        """
+        freed = {}
+        for name in names:
+            path = self.local_path(name)
+            try:
+                size = path.stat().st_size
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            freed[name] = size
+        return freed
+
+    def iter_files(self):
+        """Yield (name, size, modified timestamp) for every stored file"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.part'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue
+                yield filename, stat.st_size, stat.st_mtime
+
+    def remove_stale_partials(self, older_than):
+        """Delete temp files of writes interrupted before older_than; returns (count, bytes)"""
+        count = freed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.part'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime >= older_than:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                count += 1
+                freed += stat.st_size
+        return count, freed
+
+    def presigned_url(self, name):
+        return None  # Served directly from local_path
+
+
+class S3AudioStorage:
+    """Objects in an S3-compatible bucket (path-style addressing)"""
+
+    def __init__(self, bucket=AUDIO_S3_BUCKET, endpoint=AUDIO_S3_ENDPOINT, region=AUDIO_S3_REGION,
+                 prefix=AUDIO_S3_PREFIX, access_key=None, secret_key=None,
+                 shard_depth=AUDIO_STORAGE_SHARD_DEPTH, url_window=AUDIO_S3_URL_WINDOW, part_size=AUDIO_S3_PART_SIZE):
+        if not bucket:
+            raise ValueError('AUDIO_S3_BUCKET is required for S3 audio storage')
+        self.bucket = bucket
+        self.endpoint = endpoint.rstrip('/')
+        self.region = region
+        self.prefix = prefix
+        self.access_key = access_key or os.getenv('AWS_ACCESS_KEY_ID', '')
+        self.secret_key = secret_key or os.getenv('AWS_SECRET_ACCESS_KEY', '')
+        self.shard_depth = shard_depth
+        self.url_window = url_window
+        self.part_size = part_size
+        self.host = urlsplit(self.endpoint).netloc
+
+    def key(self, name):
+        # Hashed prefixes also spread request load across S3 partitions
+        _check_name(name)
+        return self.prefix + '/'.join(_shard(name, self.shard_depth) + [name])
+
+    def local_path(self, name):
+        return None
+
+    def location(self, name):
+        return f"s3://{self.bucket}/{self.key(name)}"
+
+    def _path(self, name):
+        return quote(f"/{self.bucket}/{self.key(name)}", safe='/-_.~')
+
+    def _signature(self, method, path, query, headers, payload_hash, amz_date):
+        """SigV4 signature; returns (signature, signed header names)"""
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method,
+            path,
+            '&'.join(f"{quote(k, safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(query.items())),
+            ''.join(f"{k}:{str(headers[k]).strip()}\n" for k in sorted(headers)),
+            signed_headers,
+            payload_hash
+        ])
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (amz_date[:8], self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        return signature, signed_headers
+
+    def _request(self, method, name=None, data=None, payload_hash=EMPTY_SHA256, headers=None, query=None, **kwargs):
+        """Signed request for an object, or for the bucket itself when name is None"""
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        path = self._path(name) if name else quote(f"/{self.bucket}", safe='/-_.~')
+        query = query or {}
+        signed = {
+            'host': self.host,
+            'x-amz-content-sha256': payload_hash,
+            'x-amz-date': amz_date,
+            **{k.lower(): v for k, v in (headers or {}).items()}
+        }
+        signature, signed_headers = self._signature(method, path, query, signed, payload_hash, amz_date)
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        signed['authorization'] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        del signed['host']  # requests sets it from the URL
+        url = f"{self.endpoint}{path}"
+        if query:
+            url += '?' + '&'.join(
+                f"{quote(k, safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(query.items())
+            )
+        return http_client.request(method, url, data=data, headers=signed, **kwargs)
+
+    def write_stream(self, name, chunks, on_commit=None):
+        """
+        Yield chunks while uploading them, holding at most one part in memory
+
+        An object smaller than part_size is uploaded in one PUT once the
+        source is exhausted; a larger one becomes a multipart upload with a
+        part sent every part_size bytes. Nothing is stored if the source
+        fails or the consumer stops early: a started upload is aborted.
+        """
+        buffer = bytearray()
+        digest = hashlib.sha256()
+        size = 0
+        upload_id = None
+        parts = []  # [(part number, ETag)]
+        completed = False
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                buffer.extend(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+
+                if len(buffer) >= self.part_size:
+                    upload_id = upload_id or self._create_multipart_upload(name)
+                    parts.append(self._upload_part(name, upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+
+            if not size:
+                return
+            if upload_id:
+                if buffer:
+                    parts.append(self._upload_part(name, upload_id, len(parts) + 1, bytes(buffer)))
+                self._complete_multipart_upload(name, upload_id, parts)
+            else:
+                data = bytes(buffer)
+                response = self._request('PUT', name, data=data, payload_hash=hashlib.sha256(data).hexdigest(),
+                                         headers={'Content-Type': 'audio/mpeg'})
+                response.raise_for_status()
+            completed = True
+        finally:
+            if upload_id and not completed:
+                self._abort_multipart_upload(name, upload_id)
+
+        if on_commit:
+            on_commit(self.location(name), size, digest.hexdigest())
+
+    def _create_multipart_upload(self, name):
+        response = self._request('POST', name, query={'uploads': ''}, headers={'Content-Type': 'audio/mpeg'})
+        response.raise_for_status()
+        return ET.fromstring(response.content).findtext(f'{S3_XMLNS}UploadId')
+
+    def _upload_part(self, name, upload_id, number, data):
+        """Upload one part; returns (part number, ETag)"""
+        response = self._request('PUT', name, data=data, payload_hash=hashlib.sha256(data).hexdigest(),
+                                 query={'partNumber': str(number), 'uploadId': upload_id})
+        response.raise_for_status()
+        return number, response.headers['ETag']
+
+    def _complete_multipart_upload(self, name, upload_id, parts):
+        body = ('<CompleteMultipartUpload>' +
+                ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>'
+                        for number, etag in parts) +
+                '</CompleteMultipartUpload>').encode('utf-8')
+        response = self._request('POST', name, data=body, payload_hash=hashlib.sha256(body).hexdigest(),
+                                 query={'uploadId': upload_id}, headers={'Content-Type': 'application/xml'})
+        response.raise_for_status()
+        # S3 can report a failed completion in the body of a 200
+        root = ET.fromstring(response.content)
+        if root.tag == 'Error' or root.tag == f'{S3_XMLNS}Error':
+            raise requests.exceptions.HTTPError(
+                f"Completing upload of {self.location(name)} failed: {root.findtext('Code')}", response=response)
+
+    def _abort_multipart_upload(self, name, upload_id):
+        try:
+            self._request('DELETE', name, query={'uploadId': upload_id}).raise_for_status()
+        except Exception as e:
+            # Unfinished parts are left to the bucket's lifecycle rules
+            print(f"  ✗ Could not abort upload of {self.location(name)}: {e}")
+
+    def write_bytes(self, name, data):
+        written = {}
+        for _ in self.write_stream(name, [data], lambda location, size, digest: written.update(
+                location=location, size=size, content_hash=digest)):
+            pass
+        return written
+
+    def read_bytes(self, name):
+        response = self._request('GET', name)
+        if response.status_code == 404:
+            raise FileNotFoundError(self.location(name))
+        response.raise_for_status()
+        return response.content
+
+    def exists(self, name):
+        try:
+            response = self._request('HEAD', name)
+        except ValueError:
+            return False
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def delete(self, name):
+        response = self._request('DELETE', name)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def delete_many(self, names):
+        """
+        Remove objects with multi-object DELETE requests (1000 keys each)
+
+        Returns:
+            {name: None} for the objects that were removed (S3 does not
+            report their sizes)
+        """
+        names = list(names)
+        removed = {}
+        for start in range(0, len(names), 1000):
+            batch = {self.key(name): name for name in names[start:start + 1000]}
+            body = ('<Delete><Quiet>true</Quiet>' +
+                    ''.join(f'<Object><Key>{escape(key)}</Key></Object>' for key in batch) +
+                    '</Delete>').encode('utf-8')
+            response = self._request(
+                'POST', data=body, payload_hash=hashlib.sha256(body).hexdigest(), query={'delete': ''},
+                headers={'Content-MD5': base64.b64encode(hashlib.md5(body).digest()).decode('ascii'),
+                         'Content-Type': 'application/xml'}
+            )
+            response.raise_for_status()
+
+            errors = ET.fromstring(response.content).iter(f'{S3_XMLNS}Error')
+            failed = {element.findtext(f'{S3_XMLNS}Key') for element in errors}
+            removed.update((name, None) for key, name in batch.items() if key not in failed)
+        return removed
+
+    def iter_files(self):
+        """Yield (name, size, modified timestamp) for every object under the prefix"""
+        token = None
+        while True:
+            query = {'list-type': '2', 'prefix': self.prefix}
+            if token:
+                query['continuation-token'] = token
+            response = self._request('GET', query=query)
+            response.raise_for_status()
+
+            root = ET.fromstring(response.content)
+            for item in root.iter(f'{S3_XMLNS}Contents'):
+                key = item.findtext(f'{S3_XMLNS}Key')
+                modified = datetime.strptime(item.findtext(f'{S3_XMLNS}LastModified')[:19], '%Y-%m-%dT%H:%M:%S')
+                yield (key.rsplit('/', 1)[-1], int(item.findtext(f'{S3_XMLNS}Size')),
+                       modified.replace(tzinfo=timezone.utc).timestamp())
+
+            token = root.findtext(f'{S3_XMLNS}NextContinuationToken')
+            if root.findtext(f'{S3_XMLNS}IsTruncated') != 'true' or not token:
+                return
+
+    def remove_stale_partials(self, older_than):
+        return 0, 0  # Objects are uploaded in a single PUT, so nothing is ever partial
+
+    def presigned_url(self, name):
+        """
+        Time-limited GET URL for an object
+
+        Signed at the start of the current window and valid for two, so
+        every request in a window gets the same URL.
+        """
+        window_start = int(time.time()) // self.url_window * self.url_window
+        amz_date = datetime.fromtimestamp(window_start, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        path = self._path(name)
+        query = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(min(2 * self.url_window, 7 * 24 * 3600)),
+            'X-Amz-SignedHeaders': 'host'
+        }
+        signature, _ = self._signature('GET', path, query, {'host': self.host}, 'UNSIGNED-PAYLOAD', amz_date)
+        query_string = '&'.join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items()))
+        return f"{self.endpoint}{path}?{query_string}&X-Amz-Signature={signature}"
+
+    def url_max_age(self):
+        """Seconds until the current presigned URL window ends"""
+        return self.url_window - int(time.time()) % self.url_window
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_audio_storage():
+    """Process-wide audio storage backend, created on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = S3AudioStorage() if AUDIO_STORAGE == 's3' else LocalAudioStorage()
+    return _storage
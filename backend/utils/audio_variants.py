@@ -0,0 +1,91 @@
+"""
+Bitrate variants of segment and story audio
+
+The standard variant is the provider's default MP3 (44.1 kHz, 128 kbps).
+Extra variants are requested from ElevenLabs with a different
+output_format and stored next to it, so constrained clients can play a
+file several times smaller. Clients pick a variant with ?variant=<name>,
+an X-Audio-Variant header, or the Save-Data / ECT client hints.
+
+Each variant is a separate synthesis, so its segment durations differ
+from the standard audio's; timing served alongside a variant (offset
+tables, manifests, light timelines) must come from that variant.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STANDARD_VARIANT = 'standard'
+
+
+def _parse_variants(value):
+    """'mobile:mp3_22050_32,...' -> {'mobile': 'mp3_22050_32', ...}"""
+    variants = {}
+    for item in value.split(','):
+        name, _, output_format = item.strip().partition(':')
+        if name and output_format and name != STANDARD_VARIANT:
+            variants[name.strip()] = output_format.strip()
+    return variants
+
+
+# Off by default: every variant is one more ElevenLabs request (and rate-limit
+# token) per segment, e.g. "mobile:mp3_22050_32"
+AUDIO_VARIANTS = _parse_variants(os.getenv('AUDIO_VARIANTS', ''))
+# Served to clients that ask to save data or report a slow connection
+LOW_BANDWIDTH_VARIANT = os.getenv('AUDIO_LOW_BANDWIDTH_VARIANT', 'mobile')
+SLOW_CONNECTION_TYPES = {'slow-2g', '2g', '3g'}
+
+# Response headers that affect which variant is served
+VARY_HEADERS = ['X-Audio-Variant', 'Save-Data', 'ECT']
+
+
+def variant_suffix(name):
+    """Filename suffix for a variant ('' for standard)"""
+    return '' if name in (None, STANDARD_VARIANT) else f'_{name}'
+
+
+def requested_variant(request):
+    """
+    Variant a client asked for, explicitly or through client hints
+
+    Returns:
+        Variant name; STANDARD_VARIANT when nothing was asked for
+    """
+    explicit = request.args.get('variant') or request.headers.get('X-Audio-Variant')
+    if explicit:
+        return explicit.strip().lower()
+
+    if request.headers.get('Save-Data', '').strip().lower() == 'on':
+        return LOW_BANDWIDTH_VARIANT
+    if request.headers.get('ECT', '').strip().lower() in SLOW_CONNECTION_TYPES:
+        return LOW_BANDWIDTH_VARIANT
+    return STANDARD_VARIANT
+
+
+def pick_variant(variants, name):
+    """Stored variant entry for name, or None to serve the standard file"""
+    if not variants or name == STANDARD_VARIANT:
+        return None
+    return variants.get(name)
+
+
+def served_variant_name(variants, name):
+    """Name of the variant actually served when a client asks for name"""
+    return name if pick_variant(variants, name) else STANDARD_VARIANT
+
+
+def story_offsets(story, name):
+    """Offset table of the concatenated story file served for variant name"""
+    variant = pick_variant(story.audio_variants, name)
+    if variant and variant.get('offsets'):
+        return variant['offsets']
+    return story.audio_offsets  # Stories built before variants stored their own offsets
+
+
+def segment_duration(meta, name):
+    """Duration of a segment's audio as served for variant name"""
+    variant = pick_variant(meta.get('variants'), name)
+    if variant and variant.get('duration'):
+        return variant['duration']
+    return meta.get('duration')
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import time
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+from utils.metrics import DB_COMMIT_SECONDS
+
+load_dotenv()
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Applied to every new SQLite connection. WAL lets readers proceed while a
+# story job is writing; NORMAL sync is durable across app crashes in WAL mode.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", SQLITE_BUSY_TIMEOUT_MS),
+    ("mmap_size", SQLITE_MMAP_SIZE),
+    ("cache_size", -SQLITE_CACHE_SIZE_KB),  # Negative means KiB rather than pages
+    ("temp_store", "MEMORY"),
+    ("foreign_keys", "ON"),
+)
+
+
+def engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    if not database_uri.startswith("sqlite"):
+        return {"pool_pre_ping": True, "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+
+    if database_uri in ("sqlite://", "sqlite:///:memory:"):
+        return {}  # In-memory databases keep Flask-SQLAlchemy's single shared connection
+
+    return {
+        "poolclass": QueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": {
+            # Connections move between request and worker threads via the pool
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+    }
+
+
+@event.listens_for(Engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+# Commit timing for /api/metrics. before_commit runs ahead of the final flush,
+# so the observed time includes writing pending rows as well as the COMMIT.
+@event.listens_for(Session, "before_commit")
+def _start_commit_timer(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _observe_commit(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_commit_timer(session):
+    session.info.pop('commit_started', None)
@@ -0,0 +1,61 @@
+from sqlalchemy import inspect, text
+
+
+def add_missing_columns(db):
+    """
+    Add columns that exist on the models but not in the database
+
+    db.create_all() only creates missing tables, so an existing
+    storybook.db never picks up new columns. New columns are always
+    nullable (or have a server default), which makes a plain
+    ALTER TABLE ... ADD COLUMN safe on SQLite.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                conn.execute(text(ddl))
+                print(f"  ↑ Added column {table.name}.{column.name}")
+
+
+def create_missing_indexes(db):
+    """
+    Create model indexes that an existing database lacks
+
+    Like columns, indexes declared after a table was first created are
+    never added by db.create_all().
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(bind=conn)
+                print(f"  ↑ Created index {index.name}")
+
+
+def upgrade_schema(db):
+    """Bring an existing database up to date with the models"""
+    db.create_all()
+    add_missing_columns(db)
+    create_missing_indexes(db)
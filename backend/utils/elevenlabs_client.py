@@ -3,12 +3,16 @@ import requests
 from dotenv import load_dotenv
 from elevenlabs.client import ElevenLabs
 
+from utils import http_client
+from utils.audio_storage import get_audio_storage
+
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
 client = ElevenLabs(
     api_key=ELEVENLABS_API_KEY,
+    base_url=http_client.ELEVENLABS_API_BASE,
 )
 
 
@@ -34,10 +38,10 @@ def generate_story_audio_from_gemini(gemini_segments, output_filename="story_aud
     
     Args:
         gemini_segments: List of dicts with format [{"text": "...", "emotion": "sad"}, ...]
-        output_filename: Name of the output file to save in backend folder
+        output_filename: Name of the output file in the audio store
     
     Returns:
-        Path to the saved audio file or None if failed
+        Location of the saved audio file or None if failed
     """
     voice_id = "t9aQ9igYdTOv1RmpYub9"  # Your specified voice ID
     
@@ -50,7 +54,7 @@ def generate_story_audio_from_gemini(gemini_segments, output_filename="story_aud
         })
     
     # Make API call to text-to-dialogue endpoint
-    url = "https://api.elevenlabs.io/v1/text-to-dialogue"
+    url = f"{http_client.ELEVENLABS_API_BASE}/v1/text-to-dialogue"
     headers = {
         "xi-api-key": ELEVENLABS_API_KEY,
         "Content-Type": "application/json"
@@ -61,17 +65,11 @@ def generate_story_audio_from_gemini(gemini_segments, output_filename="story_aud
     
     try:
         print(f"Sending {len(inputs)} segments to ElevenLabs...")
-        response = requests.post(url, headers=headers, json=payload)
+        response = http_client.post(url, headers=headers, json=payload)
         response.raise_for_status()
         
         # Save the audio file
-        output_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),  # backend folder
-            output_filename
-        )
-        
-        with open(output_path, "wb") as f:
-            f.write(response.content)
+        output_path = get_audio_storage().write_bytes(output_filename, response.content)['location']
         
         print(f"✓ Audio saved to: {output_path}")
         return output_path
@@ -1,20 +1,57 @@
+import time
 from textwrap import dedent
-from google import genai
 from google.genai import types
 
+from utils.http_client import get_genai_client
+from utils.metrics import GEMINI_FIRST_CHUNK_SECONDS, GEMINI_SECONDS
+
 # Gemini API integration
 def generate_story(prompt):
     """
     Generate a story using Gemini API
     """
-    client = genai.Client()
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        config=types.GenerateContentConfig(
-            system_instruction=SYSTEM_INSTRUCTION),
-        contents=prompt
-    )
-    return response.text
+    client = get_genai_client()
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        response = client.models.generate_content(
+            model="gemini-2.5-flash",
+            config=types.GenerateContentConfig(
+                system_instruction=SYSTEM_INSTRUCTION),
+            contents=prompt
+        )
+        outcome = 'ok'
+        return response.text
+    finally:
+        GEMINI_SECONDS.labels('generate', outcome).observe(time.perf_counter() - started)
+
+def stream_story(prompt):
+    """
+    Generate a story using Gemini's streaming API
+
+    Yields:
+        Pieces of the response text as they are generated
+    """
+    client = get_genai_client()
+    started = time.perf_counter()
+    first_chunk = True
+    outcome = 'error'
+    try:
+        stream = client.models.generate_content_stream(
+            model="gemini-2.5-flash",
+            config=types.GenerateContentConfig(
+                system_instruction=SYSTEM_INSTRUCTION),
+            contents=prompt
+        )
+        for chunk in stream:
+            if chunk.text:
+                if first_chunk:
+                    GEMINI_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - started)
+                    first_chunk = False
+                yield chunk.text
+        outcome = 'ok'
+    finally:
+        GEMINI_SECONDS.labels('stream', outcome).observe(time.perf_counter() - started)
 
 SYSTEM_INSTRUCTION = dedent(
     '''
@@ -0,0 +1,217 @@
+"""
+Govee device control with per-device command coalescing
+
+Each device gets a command queue that remembers the last state sent to
+it. Capabilities that would not change anything are dropped, a newer
+command replaces any older one that has not been sent yet, and the
+capabilities of one command (color, brightness) are sent concurrently
+on the device's own threads, so devices never wait on each other.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from utils import http_client
+from utils.metrics import GOVEE_SECONDS
+
+load_dotenv()
+
+GOVEE_API_URL = os.getenv('GOVEE_API_URL') or 'https://openapi.api.govee.com/router/api/v1/device/control'
+GOVEE_API_KEY = os.getenv('GOVEE_API_KEY', '')
+GOVEE_DEVICE_ID = os.getenv('GOVEE_DEVICE_ID', '')
+GOVEE_DEVICE_SKU = os.getenv('GOVEE_DEVICE_SKU', '')
+GOVEE_TIMEOUT = float(os.getenv('GOVEE_TIMEOUT', '5'))
+# Minimum gap between dispatches to one device; commands arriving inside it collapse
+GOVEE_MIN_INTERVAL = float(os.getenv('GOVEE_MIN_INTERVAL', '0.25'))
+# Sends in flight per device: one per capability of a command (color, brightness)
+GOVEE_DEVICE_CONCURRENCY = int(os.getenv('GOVEE_DEVICE_CONCURRENCY', '2'))
+
+
+def color_capability(color_value):
+    return {'type': 'devices.capabilities.color_setting', 'instance': 'colorRgb', 'value': color_value}
+
+
+def brightness_capability(brightness):
+    return {'type': 'devices.capabilities.range', 'instance': 'brightness', 'value': brightness}
+
+
+def send_capability(sku, device, capability, request_id):
+    """
+    Send one capability to a device
+
+    Returns:
+        Govee response JSON
+
+    Raises:
+        requests.exceptions.RequestException on transport or HTTP errors
+    """
+    response = http_client.post(
+        GOVEE_API_URL,
+        headers={
+            'Govee-API-Key': GOVEE_API_KEY,
+            'Content-Type': 'application/json'
+        },
+        json={
+            'requestId': request_id,
+            'payload': {
+                'sku': sku,
+                'device': device,
+                'capability': capability
+            }
+        },
+        timeout=(3, GOVEE_TIMEOUT),
+        max_retries=1  # A late light change is worse than a skipped one
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+class _Command:
+    """A submitted command, resolved once every capability has an outcome"""
+
+    def __init__(self, instances):
+        self.future = Future()
+        self.results = {}
+        self.remaining = set(instances)
+
+    def resolve(self, instance, result):
+        self.results[instance] = result
+        self.remaining.discard(instance)
+        if not self.remaining and not self.future.done():
+            self.future.set_result(self.results)
+
+
+class DeviceCommandQueue:
+    """Coalescing command queue for a single Govee device"""
+
+    def __init__(self, sku, device, min_interval=None, send=None):
+        self.sku = sku
+        self.device = device
+        self.min_interval = GOVEE_MIN_INTERVAL if min_interval is None else min_interval
+        self._send = send or send_capability
+        self.state = {}          # instance -> last value dispatched
+        self._pending = {}       # instance -> (capability, command, request_id)
+        self._last_dispatch = 0.0
+        self.latency = None      # Smoothed seconds from dispatch to device acknowledgement
+        self._cond = threading.Condition()
+        self.stats = {'submitted': 0, 'sent': 0, 'skipped': 0, 'superseded': 0, 'failed': 0}
+        self._executor = ThreadPoolExecutor(max_workers=GOVEE_DEVICE_CONCURRENCY, thread_name_prefix=f"govee-{device}")
+        self._thread = threading.Thread(target=self._run, name=f"govee-{device}", daemon=True)
+        self._thread.start()
+
+    def submit(self, capabilities, request_id):
+        """
+        Queue capabilities for this device
+
+        Returns:
+            Future resolving to {instance: result}, where result is the
+            Govee response, {'skipped': True}, {'superseded': True} or
+            {'error': message}
+        """
+        command = _Command([cap['instance'] for cap in capabilities])
+        with self._cond:
+            for cap in capabilities:
+                instance = cap['instance']
+                self.stats['submitted'] += 1
+
+                superseded = self._pending.pop(instance, None)
+                if superseded:
+                    self.stats['superseded'] += 1
+                    superseded[1].resolve(instance, {'superseded': True})
+
+                if self.state.get(instance) == cap['value']:
+                    self.stats['skipped'] += 1
+                    command.resolve(instance, {'skipped': True})
+                    continue
+
+                self._pending[instance] = (cap, command, request_id)
+            self._cond.notify()
+        return command.future
+
+    def forget_state(self):
+        """Force the next command to be sent in full (e.g. after a manual change)"""
+        with self._cond:
+            self.state.clear()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Let rapid follow-up commands replace this one before it goes out
+                delay = self._last_dispatch + self.min_interval - time.monotonic()
+                while delay > 0:
+                    self._cond.wait(delay)
+                    delay = self._last_dispatch + self.min_interval - time.monotonic()
+                batch = self._pending
+                self._pending = {}
+                for instance, (cap, _, _) in batch.items():
+                    self.state[instance] = cap['value']
+                self._last_dispatch = time.monotonic()
+
+            if batch:
+                self._dispatch(batch)
+
+    def _timed_send(self, cap, request_id):
+        started = time.monotonic()
+        try:
+            result = self._send(self.sku, self.device, cap, request_id)
+        except Exception:
+            GOVEE_SECONDS.labels(cap['instance'], 'error').observe(time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        GOVEE_SECONDS.labels(cap['instance'], 'ok').observe(elapsed)
+        with self._cond:
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        return result
+
+    def _dispatch(self, batch):
+        futures = {}
+        for instance, (cap, command, request_id) in batch.items():
+            suffix = '' if instance == 'colorRgb' else f'-{instance}'
+            futures[instance] = self._executor.submit(self._timed_send, cap, f'{request_id}{suffix}')
+
+        for instance, future in futures.items():
+            cap, command, _ = batch[instance]
+            try:
+                result = future.result()
+                with self._cond:
+                    self.stats['sent'] += 1
+            except Exception as e:
+                print(f"   ✗ Govee {instance} failed for {self.device}: {e}")
+                result = {'error': str(e)}
+                with self._cond:
+                    self.stats['failed'] += 1
+                    # Unknown device state: don't skip the next identical command
+                    if self.state.get(instance) == cap['value']:
+                        self.state.pop(instance, None)
+            command.resolve(instance, result)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_device_queue(sku, device):
+    """Process-wide command queue for a device, created on first use"""
+    key = (sku, device)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            queue = DeviceCommandQueue(sku, device)
+            _queues[key] = queue
+        return queue
+
+
+
+def device_queue_stats():
+    """Command counts summed across every device queue"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    totals = {'submitted': 0, 'sent': 0, 'skipped': 0, 'superseded': 0, 'failed': 0}
+    for queue in queues:
+        for key, value in queue.stats.items():
+            totals[key] += value
+    return totals
@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+import zlib
+from flask import request, Response
+
+# Bodies smaller than this don't shrink enough to be worth compressing
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript'}
+
+
+def make_weak_etag(*parts):
+    """Short opaque tag derived from version identifiers"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has etag, else None"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    """Attach a weak ETag and require revalidation on reuse"""
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+
+def _negotiate_encoding(accept_encoding):
+    if accept_encoding['gzip']:
+        return 'gzip'
+    if accept_encoding['deflate']:
+        return 'deflate'
+    return None
+
+
+def compress_response(response):
+    """after_request hook: gzip/deflate text responses the client accepts"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = _negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'gzip':
+        compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    else:
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(compressed))
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,120 @@
+"""
+Shared outbound HTTP clients
+
+One pooled keep-alive requests.Session per host, default connect/read
+timeouts, and bounded retries with jittered exponential backoff on
+429/5xx and connection errors. Long-lived SDK clients (Gemini) are
+created once and reused.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from utils.metrics import HTTP_RETRIES
+
+load_dotenv()
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# Provider endpoints, overridable to point at local stand-ins (see bench/stand_ins.py)
+ELEVENLABS_API_BASE = (os.getenv("ELEVENLABS_API_BASE") or "https://api.elevenlabs.io").rstrip('/')
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_genai_client = None
+_genai_lock = threading.Lock()
+
+
+def get_session(url):
+    """Keep-alive session for the scheme and host of url"""
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+
+    with _sessions_lock:
+        session = _sessions.get(origin)
+        if session is None:
+            session = requests.Session()
+            # Retries are handled in request() so they can back off with jitter
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            session.mount(origin, adapter)
+            _sessions[origin] = session
+        return session
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number attempt (0-based), with full jitter"""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, timeout=None, max_retries=None, **kwargs):
+    """
+    Send a request through the pooled session for url's host
+
+    Connection errors, timeouts and 429/5xx responses are retried up to
+    max_retries times. The last response is returned as-is (callers still
+    call raise_for_status()), and the last exception is re-raised.
+    """
+    session = get_session(url)
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            HTTP_RETRIES.labels(urlsplit(url).netloc, e.__class__.__name__).inc()
+            print(f"  ↻ {method} {url} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return response
+
+        delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+        HTTP_RETRIES.labels(urlsplit(url).netloc, response.status_code).inc()
+        print(f"  ↻ {method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+        response.close()
+        time.sleep(delay)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def get_genai_client():
+    """Process-wide Gemini client, created on first use"""
+    global _genai_client
+    if _genai_client is None:
+        with _genai_lock:
+            if _genai_client is None:
+                from google import genai
+                from google.genai import types
+                http_options = types.HttpOptions(base_url=GEMINI_API_BASE) if GEMINI_API_BASE else None
+                _genai_client = genai.Client(http_options=http_options)
+    return _genai_client
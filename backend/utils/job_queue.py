@@ -0,0 +1,83 @@
+import queue
+import threading
+import traceback
+
+from models import db, StoryJob
+from utils.story_pipeline import run_story_job
+
+
+class StoryJobQueue:
+    """
+    In-process story job queue backed by the story_jobs table
+
+    Jobs are persisted before they are queued, so anything still queued
+    or running when the process stops is picked up again at startup.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._threads = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, start_workers=True):
+        self.app = app
+        app.extensions['story_job_queue'] = self
+        if start_workers:
+            self.start(app.config.get('STORY_JOB_WORKERS', 2))
+
+    def start(self, workers):
+        """Re-queue unfinished jobs and start worker threads"""
+        if self._threads or workers <= 0:
+            return
+
+        with self.app.app_context():
+            self._recover()
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"story-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        print(f"✓ Story job queue started with {workers} workers")
+
+    def submit(self, kind, payload, story_id=None):
+        """Persist a new job and queue it. Must be called inside an app context."""
+        job = StoryJob(kind=kind, payload=payload, story_id=story_id)
+        db.session.add(job)
+        db.session.commit()
+        self._queue.put(job.id)
+        return job
+
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def _recover(self):
+        jobs = (StoryJob.query
+                .filter(StoryJob.status.in_(['queued', 'running']))
+                .order_by(StoryJob.created_at)
+                .all())
+        for job in jobs:
+            job.status = 'queued'
+            self._queue.put(job.id)
+        db.session.commit()
+
+        if jobs:
+            print(f"↻ Re-queued {len(jobs)} unfinished story jobs")
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self.app.app_context():
+                    run_story_job(job_id)
+            except Exception as e:
+                print(f"❌ Story job worker error: {e}")
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+
+job_queue = StoryJobQueue()
@@ -0,0 +1,81 @@
+"""
+Light device registry and group fan-out
+
+Devices are registered in the light_devices table and belong to one
+group (a room or zone). A command for a group is submitted to every
+device's coalescing queue at once, so total latency stays close to that
+of the slowest single device rather than growing with the device count.
+"""
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from models import LightDevice
+from utils.govee import GOVEE_API_KEY, GOVEE_DEVICE_ID, GOVEE_DEVICE_SKU, GOVEE_TIMEOUT, get_device_queue
+
+DEFAULT_GROUP = 'default'
+# Per-device wait: the request timeout plus room for the queue's coalescing delay
+DEVICE_WAIT_SECONDS = GOVEE_TIMEOUT + 1
+
+
+class DeviceGroup:
+    """A set of device queues addressed together"""
+
+    def __init__(self, name, devices):
+        self.name = name
+        self.devices = devices  # [(device name, DeviceCommandQueue)]
+
+    def __len__(self):
+        return len(self.devices)
+
+    @property
+    def latency(self):
+        """Slowest smoothed device latency, so cues land on every device in time"""
+        latencies = [queue.latency for _, queue in self.devices if queue.latency is not None]
+        return max(latencies) if latencies else None
+
+    def submit(self, capabilities, request_id):
+        """Queue a command on every device without waiting; returns {name: Future}"""
+        return {name: queue.submit(capabilities, request_id) for name, queue in self.devices}
+
+    def send(self, capabilities, request_id, timeout=DEVICE_WAIT_SECONDS):
+        """
+        Send a command to every device concurrently and wait for all of them
+
+        Returns:
+            {device name: {instance: result}}; a device that does not answer
+            within timeout reports {'error': 'timeout'}
+        """
+        futures = self.submit(capabilities, request_id)
+        deadline = time.monotonic() + timeout
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                results[name] = {'error': 'timeout'}
+        return results
+
+
+def group_devices(group=DEFAULT_GROUP):
+    """
+    Enabled devices in a group as (name, sku, device_id)
+
+    The device from GOVEE_DEVICE_ID/GOVEE_DEVICE_SKU is the default group
+    when no devices have been registered for it. Must be called inside an
+    app context.
+    """
+    devices = [
+        (device.name, device.sku, device.device_id)
+        for device in LightDevice.query.filter_by(group_name=group, enabled=True).order_by(LightDevice.id)
+    ]
+    if not devices and group == DEFAULT_GROUP and GOVEE_DEVICE_ID and GOVEE_DEVICE_SKU:
+        devices = [('default', GOVEE_DEVICE_SKU, GOVEE_DEVICE_ID)]
+    return devices
+
+
+def get_device_group(group=DEFAULT_GROUP):
+    """DeviceGroup for a group name, or None if it has no devices or no API key"""
+    devices = group_devices(group)
+    if not GOVEE_API_KEY or not devices:
+        return None
+    return DeviceGroup(group, [(name, get_device_queue(sku, device_id)) for name, sku, device_id in devices])
@@ -0,0 +1,275 @@
+"""
+Server-driven light timeline for story playback
+
+A story's segment emotions and audio durations are turned into a list
+of timed light cues. A playback session anchors that timeline to the
+wall clock, and one scheduler thread fires each cue early by the
+measured device latency, so the lights change in time with the audio
+however slow the client is.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+from utils.audio_variants import STANDARD_VARIANT, segment_duration, story_offsets
+from utils.govee import brightness_capability, color_capability
+
+load_dotenv()
+
+# Sessions that are paused, stopped or finished are dropped after this many idle seconds
+LIGHT_SESSION_TTL = int(os.getenv('LIGHT_SESSION_TTL', '600'))
+
+# Same palette as the frontend's lightController
+EMOTION_COLORS = {
+    'happy': (255, 215, 0),     # Gold
+    'sad': (135, 206, 235),     # Sky Blue
+    'excited': (255, 165, 0),   # Orange
+    'scared': (255, 140, 105),  # Coral
+    'angry': (200, 100, 100),   # Red-ish
+    'calm': (160, 174, 192),    # Gray-Blue
+    'neutral': (255, 255, 255)  # White
+}
+
+
+def emotion_color_value(emotion):
+    """Govee color value (r * 65536 + g * 256 + b) for an emotion"""
+    r, g, b = EMOTION_COLORS.get((emotion or 'neutral').lower(), EMOTION_COLORS['neutral'])
+    return (r << 16) + (g << 8) + b
+
+
+def build_light_timeline(story, variant=STANDARD_VARIANT):
+    """
+    Timed light cues for a story
+
+    Uses the concatenated audio's offset table when present, otherwise
+    sums segment durations, in both cases for the audio variant the
+    player is playing. Consecutive segments with the same emotion share
+    one cue.
+
+    Returns:
+        Dict with 'cues' ([{time, segment_index, emotion, color_value}])
+        and 'duration' (seconds), or None if durations are unknown
+    """
+    offsets = story_offsets(story, variant)
+    if offsets:
+        timing = [(entry['segment_index'], entry['start_time'], entry['duration'])
+                  for entry in offsets]
+    else:
+        timing = []
+        position = 0.0
+        for meta in story.audio_segments or []:
+            duration = segment_duration(meta, variant)
+            if not duration:
+                return None
+            timing.append((meta['segment_index'], position, duration))
+            position += duration
+
+    if not timing:
+        return None
+
+    cues = []
+    for segment_index, start_time, _ in timing:
+        segment = story.segments[segment_index] if segment_index < len(story.segments or []) else {}
+        emotion = (segment.get('emotion') or 'neutral').lower()
+        if cues and cues[-1]['emotion'] == emotion:
+            continue
+        cues.append({
+            'time': round(start_time, 3),
+            'segment_index': segment_index,
+            'emotion': emotion,
+            'color_value': emotion_color_value(emotion)
+        })
+
+    _, last_start, last_duration = timing[-1]
+    return {'cues': cues, 'duration': round(last_start + last_duration, 3)}
+
+
+class LightSession:
+    """Playback position of one story, anchored to the monotonic clock"""
+
+    def __init__(self, story_id, timeline, target):
+        self.id = str(uuid.uuid4())
+        self.story_id = story_id
+        self.cues = timeline['cues']
+        self.duration = timeline['duration']
+        self.target = target         # DeviceGroup the cues are sent to
+        self.state = 'paused'
+        self.generation = 0          # Bumped on every transport change to cancel scheduled cues
+        self._anchor_position = 0.0
+        self._anchor_time = time.monotonic()
+        self.idle_since = time.monotonic()  # Set while not playing; idle sessions expire
+        self.fired = 0
+
+    def position(self, now=None):
+        if self.state != 'playing':
+            return self._anchor_position
+        now = time.monotonic() if now is None else now
+        return min(self.duration, self._anchor_position + (now - self._anchor_time))
+
+    def set_position(self, position):
+        self._anchor_position = max(0.0, min(float(position), self.duration))
+        self._anchor_time = time.monotonic()
+
+    def cue_at(self, position):
+        current = None
+        for cue in self.cues:
+            if cue['time'] <= position:
+                current = cue
+            else:
+                break
+        return current or (self.cues[0] if self.cues else None)
+
+    def to_dict(self):
+        return {
+            'session_id': self.id,
+            'story_id': self.story_id,
+            'state': self.state,
+            'position': round(self.position(), 3),
+            'duration': self.duration,
+            'cues': len(self.cues),
+            'fired': self.fired,
+            'group': self.target.name,
+            'devices': len(self.target),
+            'device_latency': round(self.target.latency, 3) if self.target.latency is not None else None
+        }
+
+
+class LightScheduler:
+    """Fires the light cues of every active playback session"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="light-scheduler", daemon=True)
+            self._thread.start()
+
+    def create_session(self, story_id, timeline, target, position=0.0, play=True):
+        session = LightSession(story_id, timeline, target)
+        with self._cond:
+            self._expire()
+            self._sessions[session.id] = session
+            self._ensure_thread()
+        session.set_position(position)
+        if play:
+            self.play(session.id)
+        else:
+            self._apply_current(session)
+        return session
+
+    def get(self, session_id):
+        with self._cond:
+            return self._sessions.get(session_id)
+
+    def play(self, session_id, position=None):
+        with self._cond:
+            session = self._sessions[session_id]
+            if position is not None:
+                session.set_position(position)
+            elif session.state != 'playing':
+                session.set_position(session.position())
+            session.state = 'playing'
+            session.idle_since = None
+            self._reschedule(session)
+        self._apply_current(session)
+        return session
+
+    def pause(self, session_id, position=None):
+        with self._cond:
+            session = self._sessions[session_id]
+            current = session.position() if position is None else position
+            session.state = 'paused'
+            session.set_position(current)
+            session.generation += 1
+            session.idle_since = time.monotonic()
+        return session
+
+    def seek(self, session_id, position):
+        """Move to position and show its color now, keeping play/pause state"""
+        with self._cond:
+            session = self._sessions[session_id]
+            session.set_position(position)
+            if session.state == 'playing':
+                self._reschedule(session)
+        self._apply_current(session)
+        return session
+
+    def stop(self, session_id):
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.set_position(session.position())
+            session.state = 'stopped'
+            session.generation += 1
+            session.idle_since = time.monotonic()
+        return session
+
+    def _apply_current(self, session):
+        cue = session.cue_at(session.position())
+        if cue:
+            self._fire(session, cue)
+
+    def _reschedule(self, session):
+        # Caller holds self._cond
+        session.generation += 1
+        now = time.monotonic()
+        position = session.position(now)
+        latency = session.target.latency or 0.0
+
+        for cue in session.cues:
+            if cue['time'] <= position:
+                continue
+            fire_at = now + (cue['time'] - position) - latency
+            heapq.heappush(self._heap, (fire_at, next(self._seq), session.id, session.generation, cue))
+        end_at = now + (session.duration - position)
+        heapq.heappush(self._heap, (end_at, next(self._seq), session.id, session.generation, None))
+        self._cond.notify()
+
+    def _fire(self, session, cue):
+        session.fired += 1
+        session.target.submit(
+            [color_capability(cue['color_value']), brightness_capability(100)],
+            f"session-{session.id[:8]}-{cue['segment_index']}"
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                fire_at, _, session_id, generation, cue = self._heap[0]
+                delay = fire_at - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+
+                session = self._sessions.get(session_id)
+                if session is None or session.generation != generation or session.state != 'playing':
+                    continue
+                if cue is None:
+                    session.set_position(session.duration)
+                    session.state = 'finished'
+                    session.idle_since = time.monotonic()
+                    continue
+
+            self._fire(session, cue)
+
+    def _expire(self):
+        # Caller holds self._cond
+        cutoff = time.monotonic() - LIGHT_SESSION_TTL
+        for session_id in [sid for sid, s in self._sessions.items() if s.idle_since and s.idle_since < cutoff]:
+            del self._sessions[session_id]
+
+
+light_scheduler = LightScheduler()
@@ -0,0 +1,230 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+Counters, gauges and histograms with labels, recorded from any thread
+and rendered by GET /api/metrics. Counters and gauges can also be
+computed at scrape time from a callback (reclaimer totals, queue depths).
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.voice_catalog import BASIC_VOICES, DEFAULT_VOICE_ID
+
+METRIC_PREFIX = 'storybook_'
+
+# Seconds, for calls that usually take well under a second (DB commits, Govee)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds, for provider calls that take seconds to a minute (Gemini, TTS, jobs)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+# Bytes, 1 KB to 64 MB
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+# Emotions outside this set are reported as "other" to keep label cardinality bounded
+KNOWN_EMOTIONS = {'happy', 'sad', 'excited', 'scared', 'angry', 'calm', 'neutral', 'joy', 'fear', 'surprise'}
+
+
+# Voices outside this set (cloned or mistyped ids) are reported as "other"
+KNOWN_VOICES = {DEFAULT_VOICE_ID, *(voice['voice_id'] for voice in BASIC_VOICES)}
+
+
+def emotion_label(emotion):
+    emotion = (emotion or 'neutral').lower()
+    return emotion if emotion in KNOWN_EMOTIONS else 'other'
+
+
+def voice_label(voice_id):
+    return voice_id if voice_id in KNOWN_VOICES else 'other'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Bound:
+    """A metric with its label values filled in"""
+
+    def __init__(self, metric, values):
+        self._metric = metric
+        self._values = values
+
+    def inc(self, amount=1):
+        self._metric.inc(amount, _values=self._values)
+
+    def set(self, value):
+        self._metric.set(value, _values=self._values)
+
+    def observe(self, value):
+        self._metric.observe(value, _values=self._values)
+
+    def time(self):
+        return self._metric.time(_values=self._values)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Bound(self, tuple(str(value) for value in values))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class _Sampled(_Metric):
+    """A metric with one value per label set, recorded or computed at scrape time"""
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, function=None):
+        """function, if given, returns the value (or {label values tuple: value}) at scrape time"""
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = function
+
+    def _render_samples(self):
+        if self._function:
+            try:
+                result = self._function()
+            except Exception as e:
+                print(f"  ✗ Metric {self.name} failed: {e}")
+                return []
+            items = sorted(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+                for values, value in items]
+
+
+class Counter(_Sampled):
+    """Only ever increases; a function must return totals since startup"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, _values=()):
+        with self._lock:
+            self._values[_values] = self._values.get(_values, 0) + amount
+
+
+class Gauge(_Sampled):
+    type = 'gauge'
+
+    def set(self, value, _values=()):
+        with self._lock:
+            self._values[_values] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=SLOW_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, _values=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(_values)
+            if state is None:
+                state = self._values[_values] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, _values=()):
+        """Observe the duration of a with-block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, _values=_values)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((values, {**state, 'counts': list(state['counts'])})
+                           for values, state in self._values.items())
+        lines = []
+        for values, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# Story pipeline
+GEMINI_SECONDS = Histogram('gemini_request_seconds', 'Gemini story generation time', ['mode', 'outcome'])
+GEMINI_FIRST_CHUNK_SECONDS = Histogram('gemini_first_chunk_seconds', 'Time to the first streamed Gemini chunk')
+TTS_SEGMENT_SECONDS = Histogram('tts_segment_seconds', 'Time to synthesize and store one segment (standard variant)',
+                                ['voice', 'emotion'])
+TTS_SEGMENT_BYTES = Histogram('tts_segment_bytes', 'Size of synthesized segment audio', ['voice', 'emotion', 'variant'],
+                              buckets=BYTE_BUCKETS)
+TTS_REQUESTS = Counter('tts_requests_total', 'Segment syntheses sent to ElevenLabs', ['voice', 'emotion'])
+TTS_CACHE_HITS = Counter('tts_cache_hits_total', 'Segment syntheses served from the TTS cache', ['voice', 'emotion'])
+TTS_FAILURES = Counter('tts_failures_total', 'Segment syntheses that failed', ['voice', 'emotion'])
+JOB_QUEUE_WAIT_SECONDS = Histogram('story_job_queue_wait_seconds', 'Time a story job waited before a worker took it',
+                                   ['kind'])
+JOB_SECONDS = Histogram('story_job_seconds', 'Story job run time', ['kind', 'status'])
+
+# Infrastructure
+HTTP_RETRIES = Counter('http_retries_total', 'Outbound HTTP requests retried', ['host', 'reason'])
+DB_COMMIT_SECONDS = Histogram('db_commit_seconds', 'Session commit time, including flush', buckets=FAST_BUCKETS)
+GOVEE_SECONDS = Histogram('govee_request_seconds', 'Govee control call latency', ['instance', 'outcome'],
+                          buckets=FAST_BUCKETS)
+AUDIO_RESPONSE_BYTES = Histogram('audio_response_bytes', 'Audio bytes sent per response (0 for 304s and redirects)',
+                                 ['kind', 'variant', 'status'], buckets=BYTE_BUCKETS)
@@ -0,0 +1,307 @@
+"""
+Minimal MP3 frame-header parser
+
+Walks MPEG audio frame headers without decoding any audio, which is
+enough to find where the audio frames of a file start and end, skip
+ID3/Xing metadata, and count samples for exact durations.
+"""
+import math
+
+# Bitrates in kbps, indexed by [table][bitrate_index]
+_BITRATES = {
+    'v1l1': [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    'v1l2': [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    'v1l3': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'v2l1': [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    'v2l23': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates indexed by [version_bits][sample_rate_index]
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+
+def parse_frame_header(data, offset):
+    """
+    Parse the 4-byte frame header at offset
+
+    Returns:
+        Dict with 'length', 'samples', 'sample_rate', 'bitrate', 'version',
+        'layer' and 'mono' keys, or None if there is no valid header here
+    """
+    if offset + 4 > len(data):
+        return None
+
+    b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    layer_number = 4 - layer  # 1, 2 or 3
+    mpeg1 = version == 3
+
+    if mpeg1:
+        table = f'v1l{layer_number}'
+    else:
+        table = 'v2l1' if layer_number == 1 else 'v2l23'
+
+    bitrate = _BITRATES[table][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+
+    if layer_number == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer_number == 2:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 1152 if mpeg1 else 576
+        length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+    return {
+        'length': length,
+        'samples': samples,
+        'sample_rate': sample_rate,
+        'bitrate': bitrate,
+        'version': version,
+        'layer': layer_number,
+        'mono': (b3 >> 6) == 3
+    }
+
+
+def id3v2_size(data):
+    """Size of a leading ID3v2 tag (header, body and footer), or 0"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_info_frame(data, offset, header):
+    """True if the frame at offset is a Xing/Info/VBRI metadata frame"""
+    if header['version'] == 3:
+        side_info = 17 if header['mono'] else 32
+    else:
+        side_info = 9 if header['mono'] else 17
+    xing_at = offset + 4 + side_info
+    if data[xing_at:xing_at + 4] in (b'Xing', b'Info'):
+        return True
+    return data[offset + 36:offset + 40] == b'VBRI'
+
+
+def iter_frames(data):
+    """
+    Yield (offset, header) for every audio frame in data
+
+    Leading ID3v2 tags and Xing/Info/VBRI frames are skipped, as is any
+    garbage between frames. Stops at a trailing ID3v1/APE tag or a
+    truncated final frame.
+    """
+    offset = id3v2_size(data)
+    end = len(data)
+    first = True
+
+    while offset + 4 <= end:
+        header = parse_frame_header(data, offset)
+        if header is None:
+            if data[offset:offset + 3] == b'TAG' or data[offset:offset + 8] == b'APETAGEX':
+                return
+            offset += 1  # Resync
+            continue
+
+        if offset + header['length'] > end:
+            return
+
+        if first:
+            first = False
+            if _is_info_frame(data, offset, header):
+                offset += header['length']
+                continue
+
+        yield offset, header
+        offset += header['length']
+
+
+def audio_frames(data):
+    """
+    Summarize the audio frames in data
+
+    Returns:
+        Dict with 'frames' (list of (offset, length) pairs), 'samples',
+        'sample_rate' and 'duration' (seconds)
+    """
+    frames = []
+    samples = 0
+    sample_rate = None
+    for offset, header in iter_frames(data):
+        frames.append((offset, header['length']))
+        samples += header['samples']
+        sample_rate = sample_rate or header['sample_rate']
+
+    return {
+        'frames': frames,
+        'samples': samples,
+        'sample_rate': sample_rate,
+        'duration': samples / sample_rate if sample_rate else 0.0
+    }
+
+
+class FrameIndexer:
+    """
+    audio_frames() for a file that arrives in chunks
+
+    feed() each chunk as it passes by (e.g. on its way to storage) and
+    call index() at the end, so the file never has to be read back. Only
+    the bytes of the frame being parsed are buffered.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._base = 0          # Stream offset of the first buffered byte
+        self._skip = None       # Bytes of the ID3v2 tag still to drop; None until known
+        self._first = True
+        self._done = False
+        self.frames = []
+        self.samples = 0
+        self.sample_rate = None
+
+    def feed(self, chunk):
+        if not self._done:
+            self._buffer.extend(chunk)
+            self._parse(final=False)
+
+    def summary(self):
+        """Finish parsing and return what audio_frames() would for the whole file"""
+        if not self._done:
+            self._parse(final=True)
+            self._done = True
+        return {
+            'frames': self.frames,
+            'samples': self.samples,
+            'sample_rate': self.sample_rate,
+            'duration': self.samples / self.sample_rate if self.sample_rate else 0.0
+        }
+
+    def index(self, interval=1.0):
+        """index_mp3_data() for the whole file"""
+        return _index_summary(self.summary(), interval)
+
+    def _parse(self, final):
+        data = self._buffer
+        end = len(data)
+        offset = 0
+
+        if self._skip is None:
+            if end < 10 and not final:
+                return
+            self._skip = id3v2_size(bytes(data[:10]))
+        if self._skip:
+            offset = min(self._skip, end)
+            self._skip -= offset
+
+        # Same walk as iter_frames(), pausing wherever it needs bytes that have not arrived
+        while not self._skip and offset + 4 <= end:
+            header = parse_frame_header(data, offset)
+            if header is None:
+                tail = bytes(data[offset:offset + 8])
+                if tail[:3] == b'TAG' or tail == b'APETAGEX':
+                    self._done = True
+                    break
+                if not final and len(tail) < 8 and b'APETAGEX'.startswith(tail):
+                    break
+                offset += 1  # Resync
+                continue
+
+            if offset + header['length'] > end:
+                if final:
+                    self._done = True
+                break
+
+            if self._first:
+                self._first = False
+                if _is_info_frame(data, offset, header):
+                    offset += header['length']
+                    continue
+
+            self.frames.append((self._base + offset, header['length']))
+            self.samples += header['samples']
+            self.sample_rate = self.sample_rate or header['sample_rate']
+            offset += header['length']
+
+        del data[:offset]
+        self._base += offset
+
+
+def build_seek_table(frames, sample_rate, samples_per_frame, interval=1.0):
+    """
+    Compact time -> byte offset table
+
+    Returns a list of byte offsets where entry i is the first frame at or
+    after i * interval seconds, so a player can map a time to a Range
+    request without downloading the file.
+    """
+    if not frames or not sample_rate:
+        return []
+
+    # Each entry is computed from its own time; a fixed frame stride would drift
+    # because interval is rarely a whole number of frames
+    frames_per_second = sample_rate / samples_per_frame
+    offsets = []
+    while True:
+        # Tolerate float error when i * interval falls exactly on a frame boundary
+        index = math.ceil(len(offsets) * interval * frames_per_second - 1e-9)
+        if index >= len(frames):
+            return offsets
+        offsets.append(frames[index][0])
+
+
+def index_mp3(path, interval=1.0):
+    """
+    Index an MP3 file from its frame headers
+
+    Returns:
+        Dict with 'duration' (seconds), 'frame_count', 'sample_rate',
+        'bitrate' (average, bits/s), 'audio_start', 'audio_end' and
+        'seek_table' ({"interval": seconds, "offsets": [...]})
+    """
+    with open(path, 'rb') as f:
+        return index_mp3_data(f.read(), interval)
+
+
+def index_mp3_data(data, interval=1.0):
+    """index_mp3 for MP3 bytes already in memory"""
+    return _index_summary(audio_frames(data), interval)
+
+
+def _index_summary(summary, interval):
+    frames = summary['frames']
+    sample_rate = summary['sample_rate']
+    duration = summary['duration']
+    samples_per_frame = summary['samples'] // len(frames) if frames else None
+    audio_start = frames[0][0] if frames else 0
+    audio_end = frames[-1][0] + frames[-1][1] if frames else 0
+
+    return {
+        'duration': round(duration, 4),
+        'frame_count': len(frames),
+        'sample_rate': sample_rate,
+        'bitrate': round((audio_end - audio_start) * 8 / duration) if duration else None,
+        'audio_start': audio_start,
+        'audio_end': audio_end,
+        'seek_table': {
+            'interval': interval,
+            'offsets': build_seek_table(frames, sample_rate, samples_per_frame, interval)
+        }
+    }
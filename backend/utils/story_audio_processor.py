@@ -1,21 +1,45 @@
 import os
 import re
+import hashlib
 import time
 import requests
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv
 
+from utils import http_client
+from utils.audio_storage import get_audio_storage
+from utils.audio_variants import AUDIO_VARIANTS, STANDARD_VARIANT, variant_suffix
+from utils.metrics import (TTS_CACHE_HITS, TTS_FAILURES, TTS_REQUESTS, TTS_SEGMENT_BYTES, TTS_SEGMENT_SECONDS,
+                           emotion_label, voice_label)
+from utils.mp3_frames import FrameIndexer, audio_frames
+from utils.rate_limiter import TokenBucket
+from utils.tts_cache import get_tts_cache
+from utils.tts_stream import STREAM_CHUNK_SIZE, read_file_chunks, tee_to_file
+
 load_dotenv()
 
+# Concurrency and rate limiting for ElevenLabs synthesis
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "4"))
+TTS_REQUESTS_PER_SECOND = float(os.getenv("TTS_REQUESTS_PER_SECOND", "2"))
+TTS_BURST = int(os.getenv("TTS_BURST", "4"))
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") != "0"
+
+# Shared across processors so concurrent stories respect one account-wide limit
+tts_rate_limiter = TokenBucket(TTS_REQUESTS_PER_SECOND, TTS_BURST)
+
 class StoryAudioProcessor:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, max_workers=None, rate_limiter=None, cache=None, storage=None):
         self.api_key = api_key or os.getenv("ELEVENLABS_API_KEY")
-        self.api_url = "https://api.elevenlabs.io/v1/text-to-dialogue"
-        
-        # Create audio directory
-        self.audio_dir = Path("audio_files")
-        self.audio_dir.mkdir(exist_ok=True)
+        self.api_url = f"{http_client.ELEVENLABS_API_BASE}/v1/text-to-dialogue"
+        # The model text-to-dialogue uses when the request names none. It is not sent (the
+        # request body is unchanged); it only keys the TTS cache, so set it when ElevenLabs
+        # changes its default and audio from the old model is no longer reused.
+        self.model_id = os.getenv("ELEVENLABS_DIALOGUE_MODEL", "eleven_v3")
+        self.cache = cache or (get_tts_cache() if TTS_CACHE_ENABLED else None)
+        self.max_workers = max(1, max_workers or TTS_MAX_WORKERS)
+        self.rate_limiter = rate_limiter or tts_rate_limiter
+        self.storage = storage or get_audio_storage()
     
     def emotion_to_style(self, emotion):
         """Convert emotion tags to ElevenLabs style markers"""
@@ -43,20 +67,11 @@ class StoryAudioProcessor:
             return f"{{{style}}} {text}"
         return text
     
-    def process_segment(self, segment, voice_id="jTk8bSDoiLDLZqAVYKKr"):
-        """
-        Process a single segment through ElevenLabs API
-        
-        Args:
-            segment: Dict with 'text' and 'emotion' keys
-            voice_id: ElevenLabs voice ID
-            
-        Returns:
-            Audio content (bytes) or None if failed
-        """
+    def build_payload(self, segment, voice_id):
+        """Build the text-to-dialogue request body for a segment"""
         formatted_text = self.format_text_for_api(segment['text'], segment['emotion'])
         
-        payload = {
+        return {
             "inputs": [
                 {
                     "text": formatted_text,
@@ -64,87 +79,337 @@ class StoryAudioProcessor:
                 }
             ]
         }
+    
+    def stream_segment(self, segment, voice_id="jTk8bSDoiLDLZqAVYKKr", output_format=None):
+        """
+        Stream a segment's audio as it arrives from ElevenLabs
+        
+        Chunks are teed into the TTS cache and committed once the stream
+        completes, so a later identical request is served from disk.
+        output_format selects a non-default encoding (e.g. mp3_22050_32).
+        
+        Yields:
+            Audio chunks (bytes)
+        
+        Raises:
+            requests.exceptions.RequestException on provider errors
+        """
+        payload = self.build_payload(segment, voice_id)
+        url = f"{self.api_url}?output_format={output_format}" if output_format else self.api_url
+        
+        # Identical requests always produce reusable audio, so check the cache first
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(url, payload, self.model_id)
+            cached = self.cache.open(cache_key)
+            if cached:
+                TTS_CACHE_HITS.labels(voice_label(voice_id), emotion_label(segment['emotion'])).inc()
+                print(f"  ⚡ Cache hit: [{segment['emotion']}] {segment['text'][:50]}...")
+                yield from read_file_chunks(cached)
+                return
         
         headers = {
             "xi-api-key": self.api_key,
             "Content-Type": "application/json"
         }
         
+        self.rate_limiter.acquire()
+        TTS_REQUESTS.labels(voice_label(voice_id), emotion_label(segment['emotion'])).inc()
+        print(f"  Sending to ElevenLabs: [{segment['emotion']}] {segment['text'][:50]}...")
+        response = http_client.post(url, headers=headers, json=payload, stream=True)
         try:
-            print(f"  Sending to ElevenLabs: [{segment['emotion']}] {segment['text'][:50]}...")
-            response = requests.post(self.api_url, headers=headers, json=payload)
             response.raise_for_status()
-            return response.content  # Returns audio data
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if cache_key:
+                chunks = tee_to_file(
+                    chunks,
+                    self.cache.path_for(cache_key),
+                    on_commit=lambda path, size, digest: self.cache.register(cache_key, size)
+                )
+            yield from chunks
+        finally:
+            response.close()
+    
+    def process_segment(self, segment, voice_id="jTk8bSDoiLDLZqAVYKKr"):
+        """
+        Process a single segment through ElevenLabs API
+        
+        Args:
+            segment: Dict with 'text' and 'emotion' keys
+            voice_id: ElevenLabs voice ID
+            
+        Returns:
+            Audio content (bytes) or None if failed
+        """
+        try:
+            return b''.join(self.stream_segment(segment, voice_id))  # Returns audio data
+        except requests.exceptions.RequestException as e:
+            print(f"  Error processing segment: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                print(f"  Response: {e.response.text}")
+            return None
+    
+    def synthesize_to_file(self, segment, filename, voice_id="jTk8bSDoiLDLZqAVYKKr", output_format=None):
+        """
+        Stream a segment's audio straight into the audio store as filename
+        
+        The file only appears once the whole stream has been written. Frame
+        headers are indexed as the chunks pass through, so the file is never
+        read back from the store.
+        
+        Returns:
+            Dict with the file's 'location', 'size', 'content_hash' (sha256
+            hex) and 'index' (see index_mp3_data), or None if synthesis failed
+        """
+        committed = {}
+        indexer = FrameIndexer()
+        
+        def on_commit(location, size, digest):
+            committed.update(location=location, size=size, content_hash=digest, index=indexer.index())
+        
+        def indexed(chunks):
+            for chunk in chunks:
+                indexer.feed(chunk)
+                yield chunk
+        
+        try:
+            chunks = indexed(self.stream_segment(segment, voice_id, output_format))
+            for _ in self.storage.write_stream(filename, chunks, on_commit=on_commit):
+                pass
         except requests.exceptions.RequestException as e:
             print(f"  Error processing segment: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"  Response: {e.response.text}")
             return None
+        return committed or None
+    
+    def process_indexed_segment(self, story_uuid, idx, segment, voice_id, total, revision=None):
+        """Synthesize and save one segment, returning its metadata dict"""
+        print(f"\nSegment {idx + 1}/{total}:")
+        
+        # Generate filename (edits get a revision tag so they never overwrite audio still in use)
+        suffix = f"_r{revision}" if revision else ""
+        filename = f"{story_uuid}_segment_{idx:03d}{suffix}.mp3"
+        emotion = emotion_label(segment['emotion'])
+        
+        started = time.perf_counter()
+        written = self.synthesize_to_file(segment, filename, voice_id)
+        if written:
+            # Frame index from synthesis, so duration and seeking never need the client
+            index = written['index']
+            TTS_SEGMENT_SECONDS.labels(voice_label(voice_id), emotion).observe(time.perf_counter() - started)
+            TTS_SEGMENT_BYTES.labels(voice_label(voice_id), emotion, STANDARD_VARIANT).observe(written['size'])
+            print(f"  ✓ Saved to {written['location']} ({index['duration']:.1f}s)")
+            variants = self.synthesize_variants(segment, filename, voice_id)
+            return {
+                "segment_index": idx,
+                "text": segment['text'],
+                "emotion": segment['emotion'],
+                "audio_file": written['location'],
+                "filename": filename,
+                "size": written['size'],
+                "content_hash": written['content_hash'],
+                "duration": index['duration'],
+                "seek_table": index['seek_table'],
+                "variants": variants
+            }
+        
+        TTS_FAILURES.labels(voice_label(voice_id), emotion).inc()
+        print(f"  ✗ Failed to process segment {idx}")
+        # Still add metadata but mark as failed
+        return {
+            "segment_index": idx,
+            "text": segment['text'],
+            "emotion": segment['emotion'],
+            "audio_file": None,
+            "filename": None,
+            "duration": None,
+            "error": "Failed to generate audio"
+        }
     
-    def process_story_segments(self, story_uuid, segments, voice_id="jTk8bSDoiLDLZqAVYKKr", delay=1.0):
+    def synthesize_variants(self, segment, filename, voice_id):
+        """
+        Synthesize the extra bitrate variants of a segment
+        
+        A failed variant is skipped; clients asking for it get the
+        standard file instead.
+        
+        Returns:
+            {variant name: {filename, audio_file, size, content_hash,
+            duration, output_format}}
+        """
+        variants = {}
+        stem = filename[:-len(".mp3")]
+        for name, output_format in AUDIO_VARIANTS.items():
+            variant_filename = f"{stem}{variant_suffix(name)}.mp3"
+            written = self.synthesize_to_file(segment, variant_filename, voice_id, output_format)
+            if not written:
+                TTS_FAILURES.labels(voice_label(voice_id), emotion_label(segment['emotion'])).inc()
+                print(f"  ✗ Failed to synthesize {name} variant")
+                continue
+            TTS_SEGMENT_BYTES.labels(voice_label(voice_id), emotion_label(segment['emotion']), name).observe(written['size'])
+            variants[name] = {
+                "filename": variant_filename,
+                "audio_file": written['location'],
+                "size": written['size'],
+                "content_hash": written['content_hash'],
+                "duration": written['index']['duration'],
+                "output_format": output_format
+            }
+            print(f"  ✓ {name} variant: {written['size']} bytes")
+        return variants
+    
+    def process_story_segments(self, story_uuid, segments, voice_id="jTk8bSDoiLDLZqAVYKKr", on_segment_complete=None,
+                               indices=None, revision=None):
         """
         Process all segments of a story through ElevenLabs API
         
+        Segments are synthesized concurrently on a bounded worker pool.
+        The shared token bucket paces requests instead of a fixed sleep.
+        
         Args:
             story_uuid: Unique identifier for the story
-            segments: List of dicts with 'text' and 'emotion' keys
+            segments: List (or any iterable, e.g. a streaming parser) of
+                dicts with 'text' and 'emotion' keys. Each segment is
+                submitted as soon as the iterable produces it.
             voice_id: ElevenLabs voice ID to use
-            delay: Delay between API calls to avoid rate limiting
+            on_segment_complete: Optional callback invoked with each segment's
+                metadata as it finishes (called from the calling thread)
+            indices: Optional story positions of the segments, for
+                re-synthesizing a subset of an edited story
+            revision: Optional tag added to filenames of re-synthesized audio
         
         Returns:
-            List of audio metadata dicts
+            List of audio metadata dicts, in the order segments were given
         """
-        print(f"\n🎵 Processing {len(segments)} segments for story {story_uuid}")
+        total = len(segments) if hasattr(segments, '__len__') else '?'
+        print(f"\n🎵 Processing {total} segments for story {story_uuid}")
         
-        audio_metadata = []
+        received = []
+        audio_metadata = {}
+        pending = {}
         
-        for idx, segment in enumerate(segments):
-            print(f"\nSegment {idx + 1}/{len(segments)}:")
-            
-            # Get audio from API
-            audio_content = self.process_segment(segment, voice_id)
+        def collect(futures):
+            for future in futures:
+                idx, segment = pending.pop(future)
+                try:
+                    meta = future.result()
+                except Exception as e:
+                    TTS_FAILURES.labels(voice_label(voice_id), emotion_label(segment['emotion'])).inc()
+                    print(f"  ✗ Failed to process segment {idx}: {e}")
+                    meta = {
+                        "segment_index": idx,
+                        "text": segment['text'],
+                        "emotion": segment['emotion'],
+                        "audio_file": None,
+                        "filename": None,
+                        "duration": None,
+                        "error": str(e)
+                    }
+                audio_metadata[idx] = meta
+                if on_segment_complete:
+                    on_segment_complete(meta)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tts") as executor:
+            for position, segment in enumerate(segments):
+                received.append(segment)
+                idx = indices[position] if indices is not None else position
+                future = executor.submit(self.process_indexed_segment, story_uuid, idx, segment, voice_id, total, revision)
+                pending[future] = (idx, segment)
+                # Report segments that finished while the source was still producing
+                collect([f for f in list(pending) if f.done()])
             
-            if audio_content:
-                # Generate filename
-                filename = f"{story_uuid}_segment_{idx:03d}.mp3"
-                filepath = self.audio_dir / filename
-                
-                # Save audio file
-                with open(filepath, 'wb') as f:
-                    f.write(audio_content)
+            for future in as_completed(list(pending)):
+                collect([future])
+        
+        order = indices if indices is not None else range(len(received))
+        ordered = [audio_metadata[idx] for idx in order]
+        print(f"\n✓ Audio processing complete!")
+        print(f"  Successful: {sum(1 for a in ordered if a['audio_file'] is not None)}/{len(received)}")
+        
+        return ordered
+    
+    def build_story_audio(self, story_uuid, audio_metadata, variant=None):
+        """
+        Concatenate a story's segment MP3s into one frame-aligned file
+        
+        ID3 tags and Xing/Info headers are dropped from each segment so the
+        result is a single clean frame stream. The filename is derived from
+        the segment hashes, so it changes whenever any segment's audio does.
+        With variant set, that variant's segment files are concatenated
+        instead; every segment with audio must have it.
+        
+        Returns:
+            Dict with 'filename', 'audio_file', 'size', 'content_hash' and
+            'offsets' (per-segment byte and time ranges), or None if no
+            segment has audio
+        """
+        segments = [meta for meta in audio_metadata if meta.get('audio_file')]
+        if variant:
+            sources = [(meta.get('variants') or {}).get(variant) for meta in segments]
+            if not all(sources):
+                return None
+            # Keep the story's segment indices on the variant files
+            segments = [{**source, 'segment_index': meta['segment_index']}
+                        for meta, source in zip(segments, sources)]
+        if not segments:
+            return None
+        
+        name_hash = hashlib.sha256(
+            ''.join(meta.get('content_hash') or meta['filename'] for meta in segments).encode('utf-8')
+        ).hexdigest()[:12]
+        filename = f"{story_uuid}_story_{name_hash}{variant_suffix(variant)}.mp3"
+        
+        offsets = []
+        
+        def frame_chunks():
+            byte_pos = 0
+            time_pos = 0.0
+            for meta in segments:
+                data = self.storage.read_bytes(meta['filename'])
+                summary = audio_frames(data)
+                if not summary['frames']:
+                    continue
                 
-                # Store audio metadata
-                audio_metadata.append({
-                    "segment_index": idx,
-                    "text": segment['text'],
-                    "emotion": segment['emotion'],
-                    "audio_file": str(filepath),
-                    "filename": filename,
-                    "duration": None  # Could add duration detection if needed
-                })
+                start = byte_pos
+                run_start, run_end = summary['frames'][0][0], summary['frames'][0][0]
+                for offset, length in summary['frames']:
+                    if offset != run_end:
+                        # Write contiguous runs of frames in one piece
+                        yield data[run_start:run_end]
+                        run_start = offset
+                    run_end = offset + length
+                    byte_pos += length
+                yield data[run_start:run_end]
                 
-                print(f"  ✓ Saved to {filepath}")
-            else:
-                print(f"  ✗ Failed to process segment {idx}")
-                # Still add metadata but mark as failed
-                audio_metadata.append({
-                    "segment_index": idx,
-                    "text": segment['text'],
-                    "emotion": segment['emotion'],
-                    "audio_file": None,
-                    "filename": None,
-                    "duration": None,
-                    "error": "Failed to generate audio"
+                offsets.append({
+                    "segment_index": meta['segment_index'],
+                    "byte_start": start,
+                    "byte_end": byte_pos,
+                    "start_time": round(time_pos, 4),
+                    "duration": round(summary['duration'], 4)
                 })
-            
-            # Rate limiting delay (except for last segment)
-            if idx < len(segments) - 1:
-                time.sleep(delay)
+                time_pos += summary['duration']
         
-        print(f"\n✓ Audio processing complete!")
-        print(f"  Successful: {sum(1 for a in audio_metadata if a['audio_file'] is not None)}/{len(segments)}")
+        committed = {}
         
-        return audio_metadata
+        def on_commit(location, size, digest):
+            committed.update(location=location, size=size, content_hash=digest)
+        
+        for _ in self.storage.write_stream(filename, frame_chunks(), on_commit=on_commit):
+            pass
+        
+        if not committed:
+            return None
+        
+        print(f"  ✓ Story audio concatenated: {filename} ({len(offsets)} segments, {committed['size']} bytes)")
+        return {
+            "filename": filename,
+            "audio_file": committed['location'],
+            "size": committed['size'],
+            "content_hash": committed['content_hash'],
+            "offsets": offsets
+        }
     
     def get_audio_url(self, filename):
         """Generate URL for accessing audio file"""
@@ -0,0 +1,608 @@
+import json
+import os
+import threading
+import traceback
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import db, Story, AudioAsset, StoryJob
+from utils.audio_reclaimer import audio_reclaimer
+from utils.audio_storage import get_audio_storage
+from utils.audio_variants import AUDIO_VARIANTS
+from utils.metrics import JOB_QUEUE_WAIT_SECONDS, JOB_SECONDS
+from utils.story_audio_processor import StoryAudioProcessor
+from utils.story_stream import StorySegmentParser
+from utils.voice_catalog import DEFAULT_VOICE_ID
+
+# Overlap Gemini text generation with audio synthesis
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "1") != "0"
+
+# One lock per story id for edit jobs
+_edit_locks = {}
+_edit_locks_lock = threading.Lock()
+
+
+def parse_gemini_story(gemini_response):
+    """
+    Parse Gemini's JSON story response
+
+    Returns:
+        Dict with 'title' and 'segments' keys
+
+    Raises:
+        json.JSONDecodeError if the response is not valid JSON
+    """
+    # Remove markdown code blocks if present
+    if gemini_response.strip().startswith('```'):
+        # Strip markdown code block wrappers
+        lines = gemini_response.strip().split('\n')
+        if lines[0].startswith('```'):
+            lines = lines[1:]
+        if lines[-1].startswith('```'):
+            lines = lines[:-1]
+        gemini_response = '\n'.join(lines)
+
+    return json.loads(gemini_response)
+
+
+def serialize_story(story):
+    """Story fields returned once a story has been created"""
+    return {
+        'id': story.id,
+        'uuid': story.uuid,
+        'title': story.title,
+        'content': story.content,
+        'segments': story.segments,
+        'audio_segments': story.audio_segments,
+        'audio_url': story_audio_url(story),
+        'audio_offsets': story.audio_offsets,
+        'created_at': story.created_at.isoformat(),
+        'processed_at': story.processed_at.isoformat() if story.processed_at else None
+    }
+
+
+def compute_emotion_summary(segments, audio_metadata=None):
+    """
+    Constant-size digest of a story's emotions for list views
+
+    Counts segments per emotion and, once audio exists, sums their
+    durations. The per-segment emotion sequence drives the color strip.
+    """
+    durations = {}
+    audio_count = 0
+    for meta in audio_metadata or []:
+        if meta.get('audio_file'):
+            audio_count += 1
+        if meta.get('duration'):
+            durations[meta['segment_index']] = meta['duration']
+
+    emotions = {}
+    for idx, segment in enumerate(segments or []):
+        emotion = (segment.get('emotion') or 'neutral').lower()
+        entry = emotions.setdefault(emotion, {'count': 0, 'duration': 0.0})
+        entry['count'] += 1
+        entry['duration'] = round(entry['duration'] + durations.get(idx, 0.0), 2)
+
+    return {
+        'segment_count': len(segments or []),
+        'audio_count': audio_count,
+        'total_duration': round(sum(durations.values()), 2),
+        'sequence': [(segment.get('emotion') or 'neutral').lower() for segment in segments or []],
+        'emotions': emotions
+    }
+
+
+def backfill_emotion_summaries(batch_size=200):
+    """Compute emotion_summary for stories created before the column existed"""
+    updated = 0
+    while True:
+        stories = Story.query.filter(Story.emotion_summary.is_(None)).limit(batch_size).all()
+        if not stories:
+            break
+        for story in stories:
+            story.emotion_summary = compute_emotion_summary(story.segments, story.audio_segments)
+        db.session.commit()
+        updated += len(stories)
+
+    if updated:
+        print(f"  ↑ Computed emotion summaries for {updated} stories")
+
+
+def story_audio_url(story):
+    """URL of the concatenated story audio, or None if it was not built"""
+    return f"/api/stories/{story.id}/audio" if story.audio_file else None
+
+
+def build_story_audio(story, audio_metadata):
+    """
+    Concatenate segment audio into the single story file and record its
+    offset table on the story. Failures are logged and leave the story
+    playable segment by segment.
+    """
+    try:
+        combined = StoryAudioProcessor().build_story_audio(story.uuid, audio_metadata)
+    except Exception as e:
+        print(f"  ✗ Failed to concatenate story audio: {e}")
+        traceback.print_exc()
+        return None
+
+    if combined:
+        story.audio_file = combined['filename']
+        story.audio_etag = combined['content_hash']
+        story.audio_offsets = combined['offsets']
+        story.audio_variants = build_story_audio_variants(story, audio_metadata)
+    return combined
+
+
+def build_story_audio_variants(story, audio_metadata):
+    """
+    Concatenate each bitrate variant of the segments into its own story
+    file. Variants missing for any segment are skipped.
+
+    Each variant is its own synthesis with its own segment durations,
+    so its offset table is stored with it.
+
+    Returns:
+        {variant name: {filename, size, etag, offsets}} or None
+    """
+    processor = StoryAudioProcessor()
+    variants = {}
+    for name in AUDIO_VARIANTS:
+        try:
+            combined = processor.build_story_audio(story.uuid, audio_metadata, variant=name)
+        except Exception as e:
+            print(f"  ✗ Failed to concatenate {name} story audio: {e}")
+            continue
+        if combined:
+            variants[name] = {
+                'filename': combined['filename'],
+                'size': combined['size'],
+                'etag': combined['content_hash'],
+                'offsets': combined['offsets']
+            }
+    return variants or None
+
+
+def stored_variants(meta):
+    """Variant entries of segment metadata as kept on AudioAsset"""
+    return {
+        name: {
+            'filename': variant['filename'],
+            'size': variant.get('size'),
+            'etag': variant.get('content_hash'),
+            'duration': variant.get('duration'),
+            'output_format': variant.get('output_format')
+        }
+        for name, variant in (meta.get('variants') or {}).items()
+    } or None
+
+
+def segment_audio_names(meta):
+    """Every file written for one segment: the standard audio and its variants"""
+    names = [meta['filename']] if meta.get('audio_file') else []
+    names.extend(variant['filename'] for variant in (meta.get('variants') or {}).values())
+    return names
+
+
+def story_audio_names(story):
+    """Concatenated story files of every variant"""
+    names = [story.audio_file] if story.audio_file else []
+    names.extend(variant['filename'] for variant in (story.audio_variants or {}).values())
+    return names
+
+
+def save_story_audio(story, audio_metadata, replace=False):
+    """
+    Store audio metadata on the story and create AudioAsset records
+
+    All assets are written with one executemany INSERT in the same
+    transaction as the story update. With replace=True the story's
+    existing AudioAsset rows are deleted in that transaction first.
+    """
+    # Seek tables live on AudioAsset only, keeping the story JSON small
+    story.audio_segments = [
+        {key: value for key, value in meta.items() if key != 'seek_table'}
+        for meta in audio_metadata
+    ]
+    story.emotion_summary = compute_emotion_summary(story.segments, audio_metadata)
+    story.processed_at = datetime.utcnow()
+
+    now = datetime.utcnow()
+    assets = [
+        {
+            'story_id': story.id,
+            'segment_index': meta['segment_index'],
+            'filename': meta['filename'],
+            'file_path': meta['audio_file'],
+            'emotion': meta['emotion'],
+            'duration': meta.get('duration'),
+            'size': meta.get('size'),
+            'etag': meta.get('content_hash'),
+            'seek_table': meta.get('seek_table'),
+            'variants': stored_variants(meta),
+            'created_at': now
+        }
+        for meta in audio_metadata
+        if meta.get('audio_file')  # Only create if audio was successfully generated
+    ]
+    if replace:
+        AudioAsset.query.filter_by(story_id=story.id).delete(synchronize_session=False)
+    if assets:
+        db.session.execute(insert(AudioAsset), assets)
+
+    db.session.commit()
+
+
+def _segment_key(text, emotion):
+    return ((text or '').strip(), (emotion or 'neutral').lower())
+
+
+def plan_segment_reuse(audio_metadata, new_segments):
+    """
+    Match edited segments to audio that already exists
+
+    Segments are matched by text and emotion, so unchanged segments keep
+    their audio even if they moved. Duplicates are matched in order.
+
+    Returns:
+        (reused, changed, orphans): reused maps new segment index to the
+        old audio metadata, changed lists new indices needing synthesis,
+        orphans is the old audio metadata nothing uses any more
+    """
+    storage = get_audio_storage()
+    available = {}
+    for meta in audio_metadata or []:
+        if meta.get('audio_file') and storage.exists(meta['filename']):
+            available.setdefault(_segment_key(meta.get('text'), meta.get('emotion')), []).append(meta)
+
+    reused = {}
+    changed = []
+    for idx, segment in enumerate(new_segments):
+        pool = available.get(_segment_key(segment.get('text'), segment.get('emotion')))
+        if pool:
+            reused[idx] = pool.pop(0)
+        else:
+            changed.append(idx)
+
+    orphans = [meta for pool in available.values() for meta in pool]
+    return reused, changed, orphans
+
+
+def _set_stage(job, stage):
+    job.stage = stage
+    db.session.commit()
+    print(f"  [job {job.id[:8]}] {stage}")
+
+
+def new_story(title, segments, voice_id, prompt=None, story_uuid=None):
+    """Build (but don't add) a Story for generated or provided segments"""
+    # Extract full text from segments
+    full_content = ' '.join([seg['text'] for seg in segments])
+
+    return Story(
+        uuid=story_uuid or str(uuid.uuid4()),
+        title=title,
+        content=full_content,
+        prompt=prompt,
+        segments=segments,
+        voice_id=voice_id,
+        emotion_summary=compute_emotion_summary(segments)
+    )
+
+
+def _create_story(job, title, segments, voice_id, story_uuid=None):
+    story = new_story(title, segments, voice_id, prompt=job.payload.get('prompt'), story_uuid=story_uuid)
+    db.session.add(story)
+    db.session.flush()
+    job.story_id = story.id
+    db.session.commit()
+
+    print(f"📖 Created story: {story.title} (ID: {story.id}, UUID: {story.uuid})")
+    return story
+
+
+class _JobProgress:
+    """Per-segment progress stored on the job for the status endpoint"""
+
+    def __init__(self, job, total=0):
+        self.job = job
+        self.progress = {
+            'total': 0,
+            'completed': 0,
+            'failed': 0,
+            'segments': []
+        }
+        for _ in range(total):
+            self.add_segment(save=False)
+        self.save()
+
+    def add_segment(self, save=True):
+        segment_index = len(self.progress['segments'])
+        self.progress['segments'].append({'segment_index': segment_index, 'status': 'pending'})
+        self.progress['total'] += 1
+        if save:
+            self.save()
+
+    def on_segment_complete(self, meta):
+        entry = self.progress['segments'][meta['segment_index']]
+        self.progress['completed'] += 1
+        if not meta.get('audio_file'):
+            self.progress['failed'] += 1
+        entry['status'] = 'failed' if meta.get('error') else 'done'
+        if meta.get('filename'):
+            # Lets a client start playing before the whole story is done
+            entry['audio_url'] = f"/api/audio/{meta['filename']}"
+        self.save()
+
+    def save(self):
+        # Reassign a copy so SQLAlchemy notices the JSON change
+        self.job.progress = json.loads(json.dumps(self.progress))
+        db.session.commit()
+
+
+def _synthesize(job, story):
+    progress = _JobProgress(job, total=len(story.segments))
+    _set_stage(job, 'synthesizing_audio')
+
+    processor = StoryAudioProcessor()
+    return processor.process_story_segments(
+        story_uuid=story.uuid,
+        segments=story.segments,
+        voice_id=story.voice_id,
+        on_segment_complete=progress.on_segment_complete
+    )
+
+
+def _stream_and_synthesize(job, prompt, voice_id):
+    """
+    Generate a story with Gemini's streaming API, sending each segment to
+    synthesis as soon as its JSON object closes
+
+    The story row is created when the title arrives and gains segments as
+    they stream in, so job progress (and finished segment audio) is
+    visible while Gemini is still writing.
+
+    Returns:
+        (story, audio_metadata)
+    """
+    from utils.gemini import stream_story
+
+    _set_stage(job, 'generating_story')
+    print(f"\n🤖 Streaming story from prompt: {prompt[:100]}...")
+    print(f"🎤 Using voice ID: {voice_id}")
+
+    parser = StorySegmentParser()
+    progress = _JobProgress(job)
+    state = {'story': None}
+    # Segment files are named after the story before its row exists
+    story_uuid = str(uuid.uuid4())
+
+    def ensure_story(title):
+        if state['story'] is None:
+            state['story'] = _create_story(job, title, [], voice_id, story_uuid=story_uuid)
+        return state['story']
+
+    def segments():
+        for chunk in stream_story(prompt):
+            for kind, value in parser.feed(chunk):
+                if kind == 'title':
+                    ensure_story(value)
+                    continue
+
+                story = ensure_story('Untitled Story')
+                story.segments = story.segments + [value]
+                progress.add_segment()
+                print(f"  ✎ Segment {len(story.segments)} received [{value.get('emotion')}]")
+                yield value
+
+        document = parser.close()
+        story = ensure_story(document['title'])
+        story.title = document['title']
+        story.content = ' '.join(seg['text'] for seg in story.segments)
+        _set_stage(job, 'synthesizing_audio')
+
+    try:
+        audio_metadata = StoryAudioProcessor().process_story_segments(
+            story_uuid=story_uuid,
+            segments=segments(),
+            voice_id=voice_id,
+            on_segment_complete=progress.on_segment_complete
+        )
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Failed to parse Gemini response: {str(e)}')
+
+    story = state['story']
+    print(f"✓ Story generated: {story.title}")
+    print(f"  Segments: {len(story.segments)}")
+    return story, audio_metadata
+
+
+def _apply_edit(job, story):
+    """
+    Re-synthesize only the segments an edit added or changed
+
+    Returns:
+        Audio metadata for every segment of the edited story
+    """
+    new_segments = job.payload['segments']
+    reused, changed, orphans = plan_segment_reuse(story.audio_segments, new_segments)
+    print(f"\n✎ Editing story {story.id}: {len(reused)} segments reused, "
+          f"{len(changed)} to synthesize, {len(orphans)} orphaned")
+
+    progress = _JobProgress(job, total=len(new_segments))
+    _set_stage(job, 'synthesizing_audio')
+
+    # Seek tables are only stored on the asset rows
+    assets = {asset.filename: asset for asset in story.audio_files}
+
+    audio_metadata = [None] * len(new_segments)
+    for idx, meta in reused.items():
+        asset = assets.get(meta['filename'])
+        audio_metadata[idx] = {
+            **meta,
+            'segment_index': idx,
+            'text': new_segments[idx]['text'],
+            'emotion': new_segments[idx]['emotion'],
+            'seek_table': asset.seek_table if asset else None
+        }
+        progress.on_segment_complete(audio_metadata[idx])
+
+    if changed:
+        processor = StoryAudioProcessor()
+        synthesized = processor.process_story_segments(
+            story_uuid=story.uuid,
+            segments=[new_segments[idx] for idx in changed],
+            voice_id=story.voice_id or DEFAULT_VOICE_ID,
+            on_segment_complete=progress.on_segment_complete,
+            indices=changed,
+            revision=job.id  # Unique per edit, so concurrent or retried edits never share filenames
+        )
+        for meta in synthesized:
+            audio_metadata[meta['segment_index']] = meta
+
+    story.segments = new_segments
+    story.content = ' '.join(seg['text'] for seg in new_segments)
+    return audio_metadata, [name for meta in orphans for name in segment_audio_names(meta)]
+
+
+def run_story_job(job_id):
+    """
+    Run a queued story job to completion
+
+    "prompt" jobs generate the story with Gemini first; "segments" jobs
+    start from caller-provided segments. Both then synthesize audio and
+    persist AudioAsset rows. "edit" jobs re-synthesize only the changed
+    segments of an existing story. Must be called inside an app context.
+    """
+    job = db.session.get(StoryJob, job_id)
+    if job is None or job.status in ('completed', 'failed'):
+        return
+
+    payload = job.payload
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    job.error = None
+    db.session.commit()
+    JOB_QUEUE_WAIT_SECONDS.labels(job.kind).observe((job.started_at - job.created_at).total_seconds())
+
+    try:
+        if job.kind == 'edit':
+            _run_edit_job(job)
+            return
+
+        voice_id = payload.get('voice_id', DEFAULT_VOICE_ID)
+
+        # A recovered job may already have created its story
+        story = db.session.get(Story, job.story_id) if job.story_id else None
+
+        if story is not None and job.kind == 'prompt' and job.stage == 'generating_story':
+            # Interrupted mid-stream: the story only has some of its segments
+            print(f"  ↻ Discarding partially streamed story {story.id}")
+            job.story_id = None
+            db.session.delete(story)
+            db.session.commit()
+            story = None
+
+        audio_metadata = None
+        if story is None and job.kind == 'prompt' and GEMINI_STREAMING:
+            story, audio_metadata = _stream_and_synthesize(job, payload['prompt'], voice_id)
+        elif story is None and job.kind == 'prompt':
+            from utils.gemini import generate_story as gemini_generate_story
+
+            _set_stage(job, 'generating_story')
+            print(f"\n🤖 Generating story from prompt: {payload['prompt'][:100]}...")
+            print(f"🎤 Using voice ID: {voice_id}")
+
+            try:
+                generated_content = parse_gemini_story(gemini_generate_story(payload['prompt']))
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Failed to parse Gemini response: {str(e)}')
+
+            print(f"✓ Story generated: {generated_content['title']}")
+            print(f"  Segments: {len(generated_content['segments'])}")
+            story = _create_story(job, generated_content['title'], generated_content['segments'], voice_id)
+        elif story is None:
+            story = _create_story(job, payload['title'], payload['segments'], voice_id)
+
+        if audio_metadata is None:
+            audio_metadata = _synthesize(job, story)
+
+        _set_stage(job, 'concatenating_audio')
+        build_story_audio(story, audio_metadata)
+
+        _set_stage(job, 'saving')
+        save_story_audio(story, audio_metadata)
+
+        job.status = 'completed'
+        job.stage = 'done'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        _observe_job(job)
+
+        print(f"✓ Story saved with {len(audio_metadata)} audio segments\n")
+
+    except Exception as e:
+        _fail_job(job_id, e)
+
+
+def _story_edit_lock(story_id):
+    with _edit_locks_lock:
+        return _edit_locks.setdefault(story_id, threading.Lock())
+
+
+def _run_edit_job(job):
+    # Edits of one story run one at a time, so each plans reuse from the
+    # audio the previous one committed
+    with _story_edit_lock(job.story_id):
+        _apply_edit_job(job)
+
+
+def _apply_edit_job(job):
+    story = db.session.get(Story, job.story_id)
+    if story is None:
+        raise ValueError('Story was deleted before the edit ran')
+
+    old_story_files = story_audio_names(story)
+    audio_metadata, orphaned_files = _apply_edit(job, story)
+
+    _set_stage(job, 'concatenating_audio')
+    build_story_audio(story, audio_metadata)
+    current_story_files = set(story_audio_names(story))
+    orphaned_files.extend(name for name in old_story_files if name not in current_story_files)
+
+    _set_stage(job, 'saving')
+    save_story_audio(story, audio_metadata, replace=True)
+
+    job.status = 'completed'
+    job.stage = 'done'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    _observe_job(job)
+
+    # Only delete once nothing references the old files, and never a file
+    # the committed story still points at
+    db.session.refresh(story)
+    referenced = {name for meta in story.audio_segments or [] for name in segment_audio_names(meta)}
+    referenced.update(story_audio_names(story))
+    orphaned_files = [name for name in orphaned_files if name not in referenced]
+    audio_reclaimer.reclaim(orphaned_files)
+    print(f"✓ Story {story.id} edited, {len(orphaned_files)} old audio files queued for removal\n")
+
+
+def _fail_job(job_id, e):
+    db.session.rollback()
+    print(f"❌ Error running story job {job_id}: {e}")
+    traceback.print_exc()
+    job = db.session.get(StoryJob, job_id)
+    job.status = 'failed'
+    job.error = str(e)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    _observe_job(job)
+
+
+def _observe_job(job):
+    if job.started_at:
+        JOB_SECONDS.labels(job.kind, job.status).observe((job.finished_at - job.started_at).total_seconds())
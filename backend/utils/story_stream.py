@@ -0,0 +1,120 @@
+"""
+Incremental parser for Gemini's streamed story JSON
+
+Gemini returns {"title": "...", "segments": [{"text": ..., "emotion": ...}, ...]}
+a few tokens at a time. The parser scans the text as it arrives and
+emits the title and each segment as soon as its closing quote or brace
+is seen, so synthesis can start long before the response is complete.
+"""
+import json
+
+
+class StorySegmentParser:
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._start = None          # Offset of the top-level '{'
+        self._end = None            # Offset just past the matching '}'
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = False    # Next top-level string is a key, not a value
+        self._key = None            # Top-level key whose value is being read
+        self._segments_depth = None # Stack depth inside the "segments" array
+        self._object_start = None   # Offset of the segment object being read
+        self.title = None
+        self.segments = []
+
+    @property
+    def done(self):
+        return self._end is not None
+
+    def feed(self, chunk):
+        """
+        Consume the next piece of the response
+
+        Returns:
+            List of ('title', str) and ('segment', dict) events completed
+            by this chunk, in order
+
+        Raises:
+            json.JSONDecodeError if a completed segment is not valid JSON
+        """
+        self._text += chunk
+        text = self._text
+        events = []
+
+        while self._pos < len(text) and not self.done:
+            pos = self._pos
+            ch = text[pos]
+            self._pos += 1
+
+            if self._start is None:
+                # Skip markdown fences or any other preamble
+                if ch == '{':
+                    self._start = pos
+                    self._stack.append(ch)
+                    self._expect_key = True
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string(text[self._string_start:pos + 1], events)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in '{[':
+                if ch == '[' and len(self._stack) == 1 and self._key == 'segments':
+                    self._segments_depth = 2
+                elif ch == '{' and len(self._stack) == self._segments_depth:
+                    self._object_start = pos
+                self._stack.append(ch)
+            elif ch in '}]':
+                self._stack.pop()
+                depth = len(self._stack)
+                if ch == '}' and self._object_start is not None and depth == self._segments_depth:
+                    segment = json.loads(text[self._object_start:pos + 1])
+                    self._object_start = None
+                    self.segments.append(segment)
+                    events.append(('segment', segment))
+                elif ch == ']' and depth == 1:
+                    self._segments_depth = None
+                if depth == 0:
+                    self._end = pos + 1
+            elif len(self._stack) == 1:
+                if ch == ':':
+                    self._expect_key = False
+                elif ch == ',':
+                    self._expect_key = True
+                    self._key = None
+
+        return events
+
+    def _on_string(self, raw, events):
+        if len(self._stack) != 1:
+            return
+        if self._expect_key:
+            self._key = json.loads(raw)
+        elif self._key == 'title':
+            self.title = json.loads(raw)
+            events.append(('title', self.title))
+
+    def close(self):
+        """
+        Finish parsing and return the complete story document
+
+        Raises:
+            json.JSONDecodeError if the response was truncated or invalid
+        """
+        if not self.done:
+            raise json.JSONDecodeError('Story JSON ended before the top-level object closed',
+                                       self._text, len(self._text))
+        return json.loads(self._text[self._start:self._end])
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Defaults to backend/instance/tts_cache, beside the database, whatever the working directory
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR") or str(Path(__file__).resolve().parent.parent / "instance" / "tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GB
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio
+
+    Entries are keyed by a hash of the exact synthesis request. Audio is
+    stored on disk under <cache_dir>/<key[:2]>/<key>.mp3 and indexed in a
+    small SQLite database that tracks size, hit count and last access.
+    Least recently used entries are evicted once the byte budget is exceeded.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.cache_dir / "index.db"), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(url, payload, model_id=None):
+        """Hash of the exact request (endpoint + JSON body) and the model that serves it"""
+        canonical = json.dumps({"url": url, "payload": payload, "model_id": model_id},
+                               sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return self.cache_dir / key[:2] / f"{key}.mp3"
+
+    def open(self, key):
+        """
+        Open a cached file for reading (recording a hit), or return None on a miss
+
+        The file is opened under the index lock, so a concurrent eviction can
+        only unlink it once it is open and the caller still reads it whole.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                f = open(self.path_for(key), "rb")
+            except FileNotFoundError:
+                # File went missing underneath us; drop the stale index row
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE entries SET hits = hits + 1, last_access = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self._conn.commit()
+        return f
+
+    def register(self, key, size):
+        """Index a file already written to path_for(key), e.g. by a streaming tee"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO entries (key, size, hits, created_at, last_access) VALUES (?, ?, 0, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET size = excluded.size, last_access = excluded.last_access""",
+                (key, size, now, now)
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                self.path_for(key).unlink()
+            except FileNotFoundError:
+                pass
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._conn.commit()
+
+        if evicted:
+            print(f"  ♻ TTS cache evicted {evicted} entries")
+
+    def stats(self):
+        with self._lock:
+            entries, total, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM entries"
+            ).fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "hits": hits}
+
+
+_tts_cache = None
+_tts_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """Process-wide TTS cache, created on first use"""
+    global _tts_cache
+    with _tts_cache_lock:
+        if _tts_cache is None:
+            _tts_cache = TTSCache()
+        return _tts_cache
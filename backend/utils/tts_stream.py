@@ -0,0 +1,70 @@
+import hashlib
+import itertools
+import os
+import tempfile
+from pathlib import Path
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def tee_to_file(chunks, dest_path, on_commit=None):
+    """
+    Yield audio chunks while writing them to a temp file beside dest_path
+
+    When the source is exhausted the temp file is atomically renamed to
+    dest_path and on_commit(dest_path, size, sha256_hex) is called, so a
+    strong content hash is available without re-reading the file. If the source
+    fails or the consumer stops early (e.g. the client disconnects), the
+    partial file is removed and nothing is committed.
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dest_path.parent, prefix=f"{dest_path.name}.", suffix=".part")
+
+    committed = False
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+
+        if size:
+            os.replace(tmp_path, dest_path)
+            committed = True
+            if on_commit:
+                on_commit(dest_path, size, digest.hexdigest())
+    finally:
+        if not committed:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+def read_file_chunks(f, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the contents of a file opened for binary reading in fixed-size chunks, then close it"""
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def prime(chunks):
+    """
+    Pull the first chunk eagerly so provider errors surface before an
+    HTTP response has started, then return an iterator over all chunks
+    """
+    chunks = iter(chunks)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], chunks)
@@ -0,0 +1,32 @@
+"""
+Voices the app offers out of the box
+
+No imports, so anything (the voices API, the story pipeline, metric
+labels) can use it without import cycles.
+"""
+
+DEFAULT_VOICE_ID = "jTk8bSDoiLDLZqAVYKKr"  # Aayan voice
+
+# Predefined basic ElevenLabs voices (commonly available)
+BASIC_VOICES = [
+    {
+        "voice_id": "21m00Tcm4TlvDq8ikWAM",
+        "name": "Rachel",
+        "description": "Calm and soothing female voice"
+    },
+    {
+        "voice_id": "EXAVITQu4vr4xnSDxMaL",
+        "name": "Bella",
+        "description": "Soft and expressive female voice"
+    },
+    {
+        "voice_id": "ErXwobaYiN019PkySvjV",
+        "name": "Antoni",
+        "description": "Well-rounded male voice"
+    },
+    {
+        "voice_id": "pNInz6obpgDQGcFmaJgB",
+        "name": "Adam",
+        "description": "Deep and resonant male voice"
+    }
+]
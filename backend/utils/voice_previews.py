@@ -0,0 +1,194 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from dotenv import load_dotenv
+
+from utils.elevenlabs_client import generate_audio
+from utils.tts_stream import prime, tee_to_file
+
+load_dotenv()
+
+PREVIEW_TEXT = "Hi, this is a voice using ElevenLabs API"
+PREVIEW_MODEL_ID = "eleven_monolingual_v1"  # Model used by generate_audio
+
+# Defaults to backend/instance/voice_previews, beside the database, whatever the working directory
+VOICE_PREVIEW_CACHE_DIR = (os.getenv("VOICE_PREVIEW_CACHE_DIR")
+                           or str(Path(__file__).resolve().parent.parent / "instance" / "voice_previews"))
+VOICE_PREVIEW_MEMORY_ENTRIES = int(os.getenv("VOICE_PREVIEW_MEMORY_ENTRIES", "16"))
+VOICE_PREVIEW_WARM = os.getenv("VOICE_PREVIEW_WARM", "1") != "0"
+
+
+class VoicePreviewCache:
+    """
+    Two-level cache of voice preview audio
+
+    Previews are keyed by voice_id, model and preview text. Rendered audio
+    is kept on disk and the most recently used previews stay in memory.
+    Each entry carries a strong ETag derived from its bytes.
+    """
+
+    def __init__(self, cache_dir=VOICE_PREVIEW_CACHE_DIR, memory_entries=VOICE_PREVIEW_MEMORY_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key so concurrent requests for a cold voice render it once
+        self._render_locks = {}
+
+    @staticmethod
+    def make_key(voice_id, text=PREVIEW_TEXT):
+        return hashlib.sha256(f"{voice_id}\0{PREVIEW_MODEL_ID}\0{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_etag(data):
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def path_for(self, key):
+        return self.cache_dir / f"{key}.mp3"
+
+    def _render_lock(self, key):
+        with self._lock:
+            return self._render_locks.setdefault(key, threading.Lock())
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, voice_id, text=PREVIEW_TEXT):
+        """Return (audio bytes, etag) from memory or disk, or None on a miss"""
+        key = self.make_key(voice_id, text)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+                return entry
+
+        try:
+            data = self.path_for(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+        entry = (data, self.make_etag(data))
+        self._remember(key, entry)
+        return entry
+
+    def put(self, voice_id, data, text=PREVIEW_TEXT):
+        """Store rendered preview audio and return (audio bytes, etag)"""
+        key = self.make_key(voice_id, text)
+        path = self.path_for(key)
+
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        entry = (data, self.make_etag(data))
+        self._remember(key, entry)
+        return entry
+
+    def get_or_render(self, voice_id, text=PREVIEW_TEXT):
+        """Return a cached preview, synthesizing it with ElevenLabs on a miss"""
+        entry = self.get(voice_id, text)
+        if entry:
+            return entry
+
+        key = self.make_key(voice_id, text)
+        with self._render_lock(key):
+            # Another request may have rendered it while we waited
+            entry = self.get(voice_id, text)
+            if entry:
+                return entry
+
+            print(f"🎤 Generating preview for voice: {voice_id}")
+            audio_generator = generate_audio(text, voice_id)
+            if not audio_generator:
+                return None
+            return self.put(voice_id, b"".join(audio_generator), text)
+
+    def get_or_stream(self, voice_id, text=PREVIEW_TEXT):
+        """
+        Cached preview, or a chunk stream of a fresh render for an HTTP response
+
+        Holds the key's render lock like get_or_render, from synthesis until
+        the stream ends, so a preview is synthesized once: a request that
+        finds it being rendered (by the warmer or another request) waits and
+        gets the cached entry. Streamed chunks are teed to the preview's cache
+        file, which is committed only if the stream completes, and the
+        committed preview is kept in memory with its ETag.
+
+        Returns:
+            ((audio bytes, etag), None), (None, chunk iterator), or
+            (None, None) if synthesis fails before the first chunk arrives
+        """
+        entry = self.get(voice_id, text)
+        if entry:
+            return entry, None
+
+        key = self.make_key(voice_id, text)
+        render_lock = self._render_lock(key)
+        if not render_lock.acquire(blocking=False):
+            return self.get_or_render(voice_id, text), None
+
+        try:
+            # Another request may have rendered it since the lookup
+            entry = self.get(voice_id, text)
+            if entry:
+                render_lock.release()
+                return entry, None
+
+            print(f"🎤 Streaming preview for voice: {voice_id}")
+            audio_generator = generate_audio(text, voice_id)
+            chunks = prime(audio_generator) if audio_generator else None
+        except BaseException:
+            render_lock.release()
+            raise
+        if chunks is None:
+            render_lock.release()
+            return None, None
+        # Started here so the lock is released even if the response is never iterated
+        return None, prime(self._stream_locked(key, chunks, render_lock))
+
+    def _stream_locked(self, key, chunks, render_lock):
+        def remember(path, size, digest):
+            self._remember(key, (Path(path).read_bytes(), digest[:32]))  # Same ETag as make_etag()
+
+        try:
+            yield from tee_to_file(chunks, self.path_for(key), on_commit=remember)
+        finally:
+            render_lock.release()
+
+    def warm(self, voice_ids):
+        """Render any missing previews for voice_ids"""
+        rendered = 0
+        for voice_id in voice_ids:
+            try:
+                if self.get(voice_id) is None and self.get_or_render(voice_id):
+                    rendered += 1
+            except Exception as e:
+                print(f"  ✗ Failed to warm preview for {voice_id}: {e}")
+        print(f"✓ Voice previews warm ({rendered} rendered, {len(voice_ids)} total)")
+
+
+voice_preview_cache = VoicePreviewCache()
+
+
+def start_preview_warmer(voice_ids):
+    """Pre-render voice previews on a background thread"""
+    if not VOICE_PREVIEW_WARM or not os.getenv("ELEVENLABS_API_KEY"):
+        return None
+
+    thread = threading.Thread(
+        target=voice_preview_cache.warm,
+        args=(list(voice_ids),),
+        name="voice-preview-warmer",
+        daemon=True
+    )
+    thread.start()
+    return thread
@@ -1,8 +1,8 @@
 import { useState, useEffect, useRef } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
 import { motion, AnimatePresence } from 'framer-motion'
-import { getStory, getAudioUrl } from '../services/api'
-import { setLightColor } from '../utils/lightController'
+import { getStory, getStoryManifest, getAudioUrl, getStoryAudioUrl } from '../services/api'
+import { setLightColor, startLightSession, controlLightSession } from '../utils/lightController'
 import { getEmotionColor, getEmotionLabel, getEmotionMessage } from '../utils/emotions'
 import GlassCard from '../components/GlassCard'
 
@@ -15,15 +15,36 @@ function PlayerFullScreen() {
   const [progress, setProgress] = useState(0)
   const [currentEmotion, setCurrentEmotion] = useState('neutral')
   const audioRef = useRef(null)
+  // Backend light session for single-stream playback (null = client-driven lights)
+  const lightSessionRef = useRef(null)
+  // Segment-by-segment playback: manifest with prefetch hints, and the
+  // content hashes already warmed into the browser cache
+  const manifestRef = useRef(null)
+  const prefetchedRef = useRef(new Set())
+
+  // Stories with a concatenated audio file play as one stream; the offset
+  // table maps playback time back to segments for emotions and lights
+  const audioOffsets = story?.audio_offsets?.length ? story.audio_offsets : null
 
   useEffect(() => {
     loadStory()
   }, [id])
 
+  // Stop server-driven lights when leaving the player
+  useEffect(() => {
+    return () => {
+      controlLightSession(lightSessionRef.current, 'stop')
+      lightSessionRef.current = null
+    }
+  }, [id])
+
   const loadStory = async () => {
     const data = await getStory(id)
     setStory(data)
     console.log('Story loaded:', data)
+
+    prefetchedRef.current = new Set()
+    manifestRef.current = data.audio_offsets?.length ? null : await getStoryManifest(id)
     
     // Set initial emotion
     if (data.segments && data.segments[0]) {
@@ -43,9 +64,39 @@ function PlayerFullScreen() {
     const emotion = segment?.emotion || 'neutral'
     setCurrentEmotion(emotion)
     
-    // Set Govee light color based on emotion
-    console.log(`💡 Setting light to: ${emotion}`)
-    setLightColor(emotion)
+    // Set Govee light color based on emotion (the backend session does it when active)
+    if (!lightSessionRef.current) {
+      console.log(`💡 Setting light to: ${emotion}`)
+      setLightColor(emotion)
+    }
+  }
+
+  // Keep the backend light session in step with the audio element
+  const syncLights = async (action) => {
+    const position = audioRef.current ? audioRef.current.currentTime : 0
+    if (action === 'start' && !lightSessionRef.current) {
+      lightSessionRef.current = await startLightSession(story.id, position)
+      return
+    }
+    controlLightSession(lightSessionRef.current, action, position)
+  }
+
+  // Find the offset entry playing at a given time in the single stream
+  const offsetAtTime = (time) => {
+    let current = audioOffsets[0]
+    for (const entry of audioOffsets) {
+      if (entry.start_time <= time) current = entry
+      else break
+    }
+    return current
+  }
+
+  // Seek the single stream to the start of a segment
+  const seekToSegment = (segmentIndex) => {
+    const entry = audioOffsets.find(o => o.segment_index === segmentIndex)
+    if (entry && audioRef.current) {
+      audioRef.current.currentTime = entry.start_time
+    }
   }
 
   // Load and play a specific segment
@@ -122,20 +173,72 @@ function PlayerFullScreen() {
 
   // Play current segment when index changes (and we're in playing state)
   useEffect(() => {
-    if (story && isPlaying) {
+    if (story && isPlaying && !audioOffsets) {
       playSegment(currentSegmentIndex)
     }
   }, [currentSegmentIndex, story])
 
+  // Single-stream playback: derive the segment from the playback position
+  const handleTimeUpdate = () => {
+    const audio = audioRef.current
+    const entry = offsetAtTime(audio.currentTime)
+    const last = audioOffsets[audioOffsets.length - 1]
+    const totalDuration = last.start_time + last.duration
+
+    setProgress(Math.min(100, (audio.currentTime / totalDuration) * 100))
+
+    if (entry.segment_index !== currentSegmentIndex) {
+      setCurrentSegmentIndex(entry.segment_index)
+      onSegmentStart(story.segments[entry.segment_index], entry.segment_index)
+    }
+  }
+
+  // Segment playback: warm the next segment's file into the HTTP cache once
+  // the story position reaches its prefetch_at, so the switch is instant
+  const prefetchNextSegment = () => {
+    const manifest = manifestRef.current
+    const current = manifest?.segments[currentSegmentIndex]
+    const next = manifest?.segments[currentSegmentIndex + 1]
+    if (!current || !next?.filename || prefetchedRef.current.has(next.hash)) return
+
+    const storyTime = current.start + (audioRef.current?.currentTime || 0)
+    if (storyTime < next.prefetch_at) return
+
+    prefetchedRef.current.add(next.hash)
+    fetch(getAudioUrl(next.filename), { cache: 'force-cache' })
+      .then(response => response.blob())
+      .catch(() => prefetchedRef.current.delete(next.hash))
+  }
+
+  const handleStreamEnded = () => {
+    console.log('🎉 Story complete!')
+    controlLightSession(lightSessionRef.current, 'stop')
+    lightSessionRef.current = null
+    setIsPlaying(false)
+    setProgress(100)
+  }
+
   // Set up audio event listeners
   useEffect(() => {
     if (!audioRef.current) return
 
     const audio = audioRef.current
+
+    if (audioOffsets) {
+      audio.addEventListener('timeupdate', handleTimeUpdate)
+      audio.addEventListener('ended', handleStreamEnded)
+      return () => {
+        audio.removeEventListener('timeupdate', handleTimeUpdate)
+        audio.removeEventListener('ended', handleStreamEnded)
+      }
+    }
+
     audio.addEventListener('ended', handleAudioEnded)
+    audio.addEventListener('timeupdate', prefetchNextSegment)
 
     return () => {
       audio.removeEventListener('ended', handleAudioEnded)
+      audio.removeEventListener('timeupdate', prefetchNextSegment)
     }
   }, [currentSegmentIndex, story])
 
@@ -150,6 +253,7 @@ function PlayerFullScreen() {
       if (audioRef.current) {
         audioRef.current.pause()
       }
+      if (audioOffsets) syncLights('pause')
       setIsPlaying(false)
       console.log('⏸ Paused')
     } else {
@@ -163,6 +267,26 @@ function PlayerFullScreen() {
       setIsPlaying(true)
       console.log('▶ Playing')
       
+      if (audioOffsets) {
+        const audio = audioRef.current
+        if (!audio.src) {
+          audio.src = getStoryAudioUrl(story.id)
+          onSegmentStart(story.segments[currentSegmentIndex], currentSegmentIndex)
+        }
+        if (progress === 100) {
+          audio.currentTime = 0
+        } else if (audio.currentTime === 0) {
+          seekToSegment(currentSegmentIndex)
+        }
+        audio.play()
+          .then(() => syncLights('start'))
+          .catch(error => {
+            console.error('❌ Error playing story audio:', error)
+            setIsPlaying(false)
+          })
+        return
+      }
+      
       // Start playing the current segment immediately
       playSegment(currentSegmentIndex)
     }
@@ -177,6 +301,7 @@ function PlayerFullScreen() {
       audioRef.current.pause()
       audioRef.current.currentTime = 0
     }
+    if (audioOffsets) syncLights('pause')
     // Reset to first emotion
     if (story?.segments?.[0]) {
       setCurrentEmotion(story.segments[0].emotion || 'neutral')
@@ -201,6 +326,15 @@ function PlayerFullScreen() {
     const nextIndex = currentSegmentIndex + 1
     setCurrentSegmentIndex(nextIndex)
     
+    if (audioOffsets) {
+      seekToSegment(nextIndex)
+      syncLights('seek')
+      if (isPlaying) {
+        onSegmentStart(story.segments[nextIndex], nextIndex)
+        audioRef.current.play()
+      }
+    }
+    
     // Update progress
     const newProgress = ((nextIndex) / story.audio_segments.length) * 100
     setProgress(newProgress)
@@ -212,7 +346,7 @@ function PlayerFullScreen() {
       if (nextSegment) {
         const emotion = nextSegment.emotion || 'neutral'
         setCurrentEmotion(emotion)
-        setLightColor(emotion)
+        if (!lightSessionRef.current) setLightColor(emotion)
       }
     }
   }
@@ -235,6 +369,15 @@ function PlayerFullScreen() {
     const prevIndex = currentSegmentIndex - 1
     setCurrentSegmentIndex(prevIndex)
     
+    if (audioOffsets) {
+      seekToSegment(prevIndex)
+      syncLights('seek')
+      if (isPlaying) {
+        onSegmentStart(story.segments[prevIndex], prevIndex)
+        audioRef.current.play()
+      }
+    }
+    
     // Update progress
     const newProgress = ((prevIndex) / story.audio_segments.length) * 100
     setProgress(newProgress)
@@ -246,7 +389,7 @@ function PlayerFullScreen() {
       if (prevSegment) {
         const emotion = prevSegment.emotion || 'neutral'
         setCurrentEmotion(emotion)
-        setLightColor(emotion)
+        if (!lightSessionRef.current) setLightColor(emotion)
       }
     }
   }
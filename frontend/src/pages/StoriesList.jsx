@@ -9,7 +9,9 @@ import FloatingCreateButton from '../components/FloatingCreateButton'
 function StoriesList() {
   const navigate = useNavigate()
   const [stories, setStories] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
 
   useEffect(() => {
@@ -20,7 +22,8 @@ function StoriesList() {
     try {
       setLoading(true)
       const data = await getStories()
-      setStories(data)
+      setStories(data.stories)
+      setNextCursor(data.next_cursor)
       console.log('Loaded stories from backend:', data)
     } catch (err) {
       console.error('Error loading stories:', err)
@@ -30,6 +33,20 @@ function StoriesList() {
     }
   }
 
+  const loadMoreStories = async () => {
+    if (!nextCursor || loadingMore) return
+    try {
+      setLoadingMore(true)
+      const data = await getStories(nextCursor)
+      setStories(prev => [...prev, ...data.stories])
+      setNextCursor(data.next_cursor)
+    } catch (err) {
+      console.error('Error loading more stories:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleDeleteStory = async (storyId, storyTitle) => {
     try {
       console.log(`Attempting to delete story: "${storyTitle}" (ID: ${storyId})`)
@@ -164,7 +181,7 @@ function StoriesList() {
             >
               <span className="text-xl">📖</span>
               <span>
-                Found {stories.length} {stories.length === 1 ? 'story' : 'stories'}
+                Showing {stories.length} {stories.length === 1 ? 'story' : 'stories'}
               </span>
             </motion.div>
             
@@ -178,6 +195,18 @@ function StoriesList() {
                 />
               ))}
             </div>
+
+            {nextCursor && (
+              <div className="flex justify-center mt-10">
+                <button
+                  onClick={loadMoreStories}
+                  disabled={loadingMore}
+                  className="gradient-button"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more stories'}
+                </button>
+              </div>
+            )}
           </>
         )}
       </div>
@@ -214,12 +243,13 @@ function StoriesList() {
 function StoryCard({ story, index, onDelete }) {
   const navigate = useNavigate()
   
-  // Get emotion colors for preview
-  const emotionColors = story.segments?.map(s => getEmotionColor(s.emotion)) || ['#94A3B8']
-  const uniqueEmotions = [...new Set(story.segments?.map(s => s.emotion) || [])]
+  // Get emotion colors for preview from the precomputed summary
+  const summary = story.emotion_summary || {}
+  const emotionColors = summary.sequence?.map(emotion => getEmotionColor(emotion)) || ['#94A3B8']
+  const uniqueEmotions = Object.keys(summary.emotions || {})
   
-  const hasAudio = story.audio_segments && story.audio_segments.length > 0
-  const audioCount = story.audio_segments?.length || 0
+  const audioCount = summary.audio_count || 0
+  const hasAudio = audioCount > 0
 
   const handleCardClick = () => {
     navigate(`/player/${story.id}`)
@@ -311,9 +341,9 @@ function StoryCard({ story, index, onDelete }) {
           )}
 
           {/* Preview text */}
-          {story.segments && story.segments[0] && (
+          {story.preview && (
             <p className="text-white/60 text-sm mb-4 line-clamp-2">
-              {story.segments[0].text}
+              {story.preview}
             </p>
           )}
 
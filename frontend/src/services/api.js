@@ -1,12 +1,33 @@
 const API_BASE = 'http://localhost:5001/api'
 
-export async function getStories() {
-  const response = await fetch(`${API_BASE}/stories`)
+export async function getStories(cursor = null, limit = 24) {
+  /**
+   * Fetch one page of stories (newest first)
+   * 
+   * Returns { stories: [...], next_cursor } — pass next_cursor back in to
+   * load the following page. Each story carries summary fields only
+   * (title, preview, emotion_summary, ...), not full text or segments.
+   */
+  const params = new URLSearchParams({ limit })
+  if (cursor) params.set('cursor', cursor)
+  const response = await fetch(`${API_BASE}/stories?${params}`)
   return response.json()
 }
 
 export async function getStory(id) {
-  const response = await fetch(`${API_BASE}/stories/${id}`)
+  // audio_offsets match the story audio variant getStoryAudioUrl will fetch
+  const response = await fetch(`${API_BASE}/stories/${id}${audioVariantQuery()}`)
+  return response.json()
+}
+
+export async function getStoryManifest(id) {
+  /**
+   * Playback manifest: per-segment filename, size, duration, start time,
+   * content hash, emotion color and prefetch_at (story time at which the
+   * segment should start downloading)
+   */
+  const response = await fetch(`${API_BASE}/stories/${id}/manifest${audioVariantQuery()}`)
+  if (!response.ok) return null
   return response.json()
 }
 
@@ -29,25 +50,70 @@ export async function generateStory(storyData) {
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(storyData)
   })
-  return response.json()
+  return waitForAcceptedJob(response)
 }
 
-export async function createStory(data) {
+export async function createStory(data, onProgress) {
+  /**
+   * Queue story generation and resolve once the story is ready
+   * 
+   * onProgress (optional) is called with each job status poll:
+   * { status, stage, progress: { total, completed, failed, segments }, story_id }
+   */
   const response = await fetch(`${API_BASE}/stories`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(data)
   })
+  return waitForAcceptedJob(response, onProgress)
+}
+
+export async function getStoryJob(jobId) {
+  const response = await fetch(`${API_BASE}/stories/jobs/${jobId}`)
   return response.json()
 }
 
-export async function updateStory(id, data) {
+async function waitForAcceptedJob(response, onProgress) {
+  const data = await response.json()
+  if (response.status !== 202) {
+    return data
+  }
+  return waitForStoryJob(data.job_id, onProgress)
+}
+
+export async function waitForStoryJob(jobId, onProgress, interval = 2000) {
+  // Poll the job until it finishes; resolves with the same shape the
+  // synchronous endpoint used to return ({ success, id, uuid, story })
+  while (true) {
+    const job = await getStoryJob(jobId)
+    if (onProgress) onProgress(job)
+
+    if (job.status === 'completed') {
+      return {
+        success: true,
+        id: job.story_id,
+        uuid: job.story?.uuid,
+        story: job.story,
+        job
+      }
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Failed to generate story')
+    }
+
+    await new Promise(resolve => setTimeout(resolve, interval))
+  }
+}
+
+// Changed segments are re-synthesized in the background (only the ones that
+// changed); in that case this waits for the edit job like createStory does
+export async function updateStory(id, data, onProgress) {
   const response = await fetch(`${API_BASE}/stories/${id}`, {
     method: 'PUT',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(data)
   })
-  return response.json()
+  return waitForAcceptedJob(response, onProgress)
 }
 
 export async function deleteStory(id) {
@@ -63,8 +129,21 @@ export async function deleteStory(id) {
   return response.json()
 }
 
+// Ask for the low-bitrate audio variant on data-saver or slow connections.
+// Timing (offsets, manifest, light cues) must be requested with the same query.
+export function audioVariantQuery() {
+  const connection = navigator.connection
+  const slow = connection && (connection.saveData || ['slow-2g', '2g', '3g'].includes(connection.effectiveType))
+  return slow ? '?variant=mobile' : ''
+}
+
 export function getAudioUrl(filename) {
-  return `${API_BASE}/audio/${filename}`
+  return `${API_BASE}/audio/${filename}${audioVariantQuery()}`
+}
+
+export function getStoryAudioUrl(id) {
+  // Single concatenated file for the whole story (see story.audio_offsets)
+  return `${API_BASE}/stories/${id}/audio${audioVariantQuery()}`
 }
 
 export async function getVoices() {
@@ -1,6 +1,8 @@
 // Govee Light Control Integration
 // Controls smart lights based on story emotions
 
+import { audioVariantQuery } from '../services/api'
+
 // Use backend proxy to avoid CORS issues
 const API_BASE = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5001/api'
 const LIGHTS_API_URL = `${API_BASE}/lights/set-color`
@@ -77,6 +79,45 @@ export async function setLightColor(emotion) {
   }
 }
 
+// Server-driven light sessions: the backend fires each emotion change at
+// its offset in the story audio, so lights stay in time with playback
+const SESSIONS_API_URL = `${API_BASE}/lights/sessions`
+
+async function postSession(url, body = {}) {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  })
+  if (!response.ok) {
+    throw new Error(`HTTP ${response.status}`)
+  }
+  return response.json()
+}
+
+// Start a light session for a story; resolves to the session id, or null if
+// the backend can't drive the lights (not configured, no timing data)
+export async function startLightSession(storyId, position = 0) {
+  try {
+    // Cue times follow the audio variant the player is playing
+    const session = await postSession(`${SESSIONS_API_URL}${audioVariantQuery()}`, { story_id: storyId, position })
+    console.log(`💡 Light session started: ${session.session_id}`)
+    return session.session_id
+  } catch (error) {
+    console.log('   ℹ️  Server-driven lights unavailable, using per-segment updates')
+    return null
+  }
+}
+
+export async function controlLightSession(sessionId, action, position = null) {
+  if (!sessionId) return
+  try {
+    await postSession(`${SESSIONS_API_URL}/${sessionId}/${action}`, position === null ? {} : { position })
+  } catch (error) {
+    console.error(`   ✗ Error sending light session ${action}:`, error)
+  }
+}
+
 // Turn lights off (TODO: implement backend endpoint if needed)
 export async function turnLightsOff() {
   console.log('💡 Turn off lights feature - not yet implemented')